@@ -0,0 +1,318 @@
+"""
+Контроль нагрузки на внешние API
+Ограничение числа одновременных запросов с очередью по приоритетам,
+автоматический выключатель (circuit breaker) для нездорового апстрима
+и хеджирование медленных запросов
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Приоритеты запросов (меньше — важнее)"""
+    MENTION = 0  # Прямое обращение к боту
+    SEARCH = 1  # Дополнение результатов поиска
+    BACKGROUND = 2  # Фоновые задачи
+
+
+class PriorityLimiter:
+    """Семафор с очередью по приоритетам: освободившийся слот получает самый важный запрос"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity  # Максимум одновременных запросов
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (priority, seq, future)
+        self._sequence = itertools.count()
+
+        # Статистика ожидания в очереди по приоритетам
+        self.admitted: Dict[str, int] = {p.name: 0 for p in Priority}
+        self.wait_total: Dict[str, float] = {p.name: 0.0 for p in Priority}
+        self.wait_max: Dict[str, float] = {p.name: 0.0 for p in Priority}
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Количество ожидающих запросов по приоритетам"""
+        depth = {p.name: 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[Priority(priority).name] += 1
+        return depth
+
+    def _record_wait(self, priority: Priority, wait: float):
+        """Учёт времени ожидания слота"""
+        name = Priority(priority).name
+        self.admitted[name] += 1
+        self.wait_total[name] += wait
+        self.wait_max[name] = max(self.wait_max[name], wait)
+
+    async def acquire(self, priority: Priority = Priority.MENTION) -> float:
+        """
+        Занять слот (ожидая в очереди при необходимости)
+
+        Args:
+            priority: Приоритет запроса
+
+        Returns:
+            Время ожидания в очереди в секундах
+        """
+        if self.in_flight < self.capacity and not self.queue_depth_total():
+            self.in_flight += 1
+            self._record_wait(priority, 0.0)
+            return 0.0
+
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть передан нам одновременно с отменой — возвращаем его
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        wait = time.monotonic() - started_at
+        self._record_wait(priority, wait)
+        return wait
+
+    def queue_depth_total(self) -> int:
+        """Общее количество ожидающих запросов"""
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def release(self):
+        """Освободить слот (он передаётся самому приоритетному ожидающему)"""
+        if self.in_flight <= self.capacity and self._hand_over():
+            return
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def _hand_over(self) -> bool:
+        """Передать занятый слот первому живому ожидающему"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
+
+    def set_capacity(self, capacity: int):
+        """Изменение лимита одновременных запросов (например, при исключении ключа)"""
+        self.capacity = max(1, capacity)
+        while self.in_flight < self.capacity and self._hand_over():
+            self.in_flight += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.MENTION):
+        """Контекстный менеджер для слота"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict:
+        """Статистика ограничителя"""
+        return {
+            'capacity': self.capacity,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth(),
+            'admitted': dict(self.admitted),
+            'avg_queue_wait_seconds': {
+                name: round(self.wait_total[name] / count, 3) if count else 0.0
+                for name, count in self.admitted.items()
+            },
+            'max_queue_wait_seconds': {name: round(wait, 3) for name, wait in self.wait_max.items()}
+        }
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель.
+    После серии ошибок подряд перестаёт пропускать запросы на recovery_timeout секунд,
+    затем пропускает один пробный запрос (half-open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold  # Ошибок подряд до размыкания
+        self.recovery_timeout = recovery_timeout  # Секунд до пробного запроса
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow_request(self) -> Optional[str]:
+        """
+        Проверяет, можно ли отправить запрос
+
+        Returns:
+            None если апстрим считается нездоровым (запрос нужно отклонить сразу),
+            HALF_OPEN если запрос стал пробным (только он может вернуть пробу через abandon),
+            CLOSED для обычного запроса
+        """
+        if self.state == self.CLOSED:
+            return self.CLOSED
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+            logger.info(f"🔌 {self.name}: пробный запрос после паузы")
+
+        if self.state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return self.HALF_OPEN
+
+        self.rejected += 1
+        return None
+
+    def record_success(self):
+        """Учёт успешного запроса"""
+        if self.state != self.CLOSED:
+            logger.info(f"✅ {self.name}: апстрим восстановился, выключатель замкнут")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        """Учёт неудачного запроса"""
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"⛔ {self.name}: выключатель разомкнут после {self.consecutive_failures} ошибок")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+    def abandon(self):
+        """Пробный запрос отменён, не дойдя до результата — разрешаем следующий"""
+        self.probe_in_flight = False
+
+    def get_stats(self) -> Dict:
+        """Статистика выключателя"""
+        retry_in = 0.0
+        if self.state == self.OPEN:
+            retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'times_opened': self.times_opened,
+            'rejected_requests': self.rejected,
+            'retry_in_seconds': round(retry_in, 1)
+        }
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0, retry_after: Optional[float] = None) -> float:
+    """
+    Задержка перед повтором: экспоненциальная с полным джиттером
+
+    Args:
+        attempt: Номер повтора (с нуля)
+        base: Базовая задержка в секундах
+        cap: Максимальная задержка
+        retry_after: Значение заголовка Retry-After (если апстрим его прислал)
+
+    Returns:
+        Задержка в секундах
+    """
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class HedgingPolicy:
+    """
+    Политика хеджирования запросов: если ответа нет дольше скользящего p90,
+    отправляется дублирующий запрос. Доля дублей ограничена бюджетом.
+    Окно задержек своё у каждого профиля генерации: короткие ответы
+    small_talk не должны хеджироваться по p90 длинных ответов long.
+    """
+
+    def __init__(self, enabled: bool = False, budget: float = 0.1, window: int = 200,
+                 min_samples: int = 20, min_delay: float = 0.5):
+        self.enabled = enabled
+        self.budget = budget  # Максимальная доля дублирующих запросов
+        self.window = window  # Размер скользящего окна задержек профиля
+        self.min_samples = min_samples  # Сколько замеров профиля нужно до первого дубля
+        self.min_delay = min_delay  # Нижняя граница задержки перед дублем
+        self.latencies: Dict[str, deque] = {}  # Профиль -> окно задержек успешных ответов
+
+        # Статистика
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.denied_by_budget = 0
+
+    def record_latency(self, profile: str, latency: float):
+        """Учёт задержки успешного ответа профиля"""
+        window = self.latencies.get(profile)
+        if window is None:
+            window = self.latencies[profile] = deque(maxlen=self.window)
+        window.append(latency)
+
+    def percentile(self, profile: str, q: float) -> Optional[float]:
+        """Перцентиль задержки профиля по скользящему окну"""
+        window = self.latencies.get(profile)
+        if not window:
+            return None
+        ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self, profile: str) -> Optional[float]:
+        """
+        Через сколько секунд отправлять дубль
+
+        Args:
+            profile: Профиль генерации запроса
+
+        Returns:
+            Задержка или None, если хеджирование выключено или замеров профиля мало
+        """
+        self.requests += 1
+        if not self.enabled or len(self.latencies.get(profile, ())) < self.min_samples:
+            return None
+        return max(self.min_delay, self.percentile(profile, 0.9))
+
+    def try_spend(self) -> bool:
+        """Проверка бюджета: можно ли отправить ещё один дубль"""
+        if self.fired + 1 > self.budget * self.requests:
+            self.denied_by_budget += 1
+            return False
+        self.fired += 1
+        return True
+
+    def get_stats(self) -> Dict:
+        """Статистика хеджирования"""
+        latency = {}
+        for profile, window in self.latencies.items():
+            p50, p90, p99 = (self.percentile(profile, q) for q in (0.5, 0.9, 0.99))
+            latency[profile] = {
+                'samples': len(window),
+                'p50': round(p50, 3),
+                'p90': round(p90, 3),
+                'p99': round(p99, 3)
+            }
+        return {
+            'enabled': self.enabled,
+            'budget': self.budget,
+            'requests': self.requests,
+            'hedges_fired': self.fired,
+            'hedges_won': self.won,
+            'denied_by_budget': self.denied_by_budget,
+            'fire_rate': round(self.fired / self.requests, 3) if self.requests else 0.0,
+            'win_rate': round(self.won / self.fired, 3) if self.fired else 0.0,
+            'latency_by_profile': latency
+        }
@@ -0,0 +1,310 @@
+"""
+Кэш ответов на типовые вопросы к боту
+Нормализует вопрос и находит почти совпадающие формулировки через MinHash/LSH,
+чтобы не отправлять в Гигачат одно и то же по многу раз
+"""
+import hashlib
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class AnswerCache:
+    """Кэш ответов без учёта контекста беседы (вопрос -> ответ)"""
+
+    # Имена бота, которые не влияют на смысл вопроса
+    BOT_NAMES = [
+        "хозяин механического города", "хозяин заводного города",
+        "сота сил", "сота-сил", "сота", "соты", "сотя", "альмсиви", "сехт",
+        "sota_sil", "sota"
+    ]
+
+    # Слова-паразиты, которые не меняют ответ
+    FILLER_WORDS = {
+        "а", "ну", "же", "ли", "вот", "ка", "такой", "такая", "такое", "такие",
+        "пожалуйста", "плиз", "скажи", "подскажи", "мне", "нам", "слушай"
+    }
+
+    # Слова, которые отсылают к контексту беседы — такие вопросы не кэшируем
+    CONTEXT_WORDS = {
+        "он", "она", "оно", "они", "его", "её", "ее", "их", "им", "ему", "ей",
+        "это", "этот", "эта", "эти", "этого", "тот", "та", "те", "там", "тогда",
+        "выше", "ещё", "еще", "дальше", "продолжай", "продолжи", "подробнее"
+    }
+
+    # Слова, от которых ответ зависит от текущей даты и времени — такие вопросы не кэшируем
+    TIME_WORDS = {
+        "сегодня", "сегодняшний", "завтра", "вчера", "послезавтра", "позавчера", "сейчас", "щас",
+        "день", "дня", "дата", "дату", "число", "числа", "час", "часа", "часов", "время", "времени",
+        "год", "году", "месяц", "месяца", "неделя", "недели", "понедельник", "вторник", "среда",
+        "четверг", "пятница", "суббота", "воскресенье"
+    }
+
+    # Отрицания меняют смысл вопроса на противоположный при почти том же тексте
+    NEGATION_WORDS = {"не", "ни", "нет", "без", "нельзя"}
+
+    _MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(self, max_entries: int = 500, ttl: int = 6 * 3600, num_perm: int = 32,
+                 bands: int = 8, similarity_threshold: float = 0.75, max_question_words: int = 8):
+        self.max_entries = max_entries  # Максимальное количество записей
+        self.ttl = ttl  # Время жизни записи в секундах
+        self.num_perm = num_perm  # Размер MinHash-сигнатуры
+        self.bands = bands  # Количество полос LSH
+        self.rows = num_perm // bands
+        self.similarity_threshold = similarity_threshold  # Минимальная оценка сходства Жаккара
+        self.max_question_words = max_question_words  # Длинные вопросы не кэшируем
+        self._bot_names_re = re.compile(
+            r"\b(?:" + "|".join(re.escape(name) for name in self.BOT_NAMES) + r")\b"
+        )
+
+        # Параметры хеш-функций MinHash (фиксированы, чтобы сигнатуры были воспроизводимы)
+        rng = random.Random(5734)
+        self._perms = [
+            (rng.randrange(1, self._MERSENNE_PRIME), rng.randrange(0, self._MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+        self.entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self.buckets: Dict[Tuple, Set[Tuple[str, str]]] = {}
+
+        # Статистика
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.latency_saved = 0.0
+
+    def normalize(self, text: str) -> str:
+        """
+        Приведение вопроса к нормальной форме
+
+        Args:
+            text: Текст сообщения
+
+        Returns:
+            Нормализованный вопрос (может быть пустой строкой)
+        """
+        text = self._bot_names_re.sub(" ", text.lower().replace("ё", "е"))
+        words = re.findall(r"\w+", text)
+        return " ".join(word for word in words if word not in self.FILLER_WORDS)
+
+    def is_cacheable(self, text: str) -> bool:
+        """
+        Проверяет, можно ли отвечать на вопрос из кэша
+
+        Args:
+            text: Текст сообщения
+
+        Returns:
+            True если вопрос короткий и не зависит от контекста беседы
+        """
+        normalized = self.normalize(text)
+        if not normalized:
+            return False
+        words = normalized.split()
+        if len(words) > self.max_question_words:
+            return False
+        return not any(word in self.CONTEXT_WORDS or word in self.TIME_WORDS for word in words)
+
+    def _prompt_hash(self, prompt: str) -> str:
+        """Хеш персонализированного промпта (ответ зависит от варианта промпта)"""
+        return hashlib.md5(prompt.encode()).hexdigest()[:16]
+
+    def _signature(self, normalized: str) -> Tuple[int, ...]:
+        """MinHash-сигнатура по символьным триграммам"""
+        padded = f" {normalized} "
+        shingles = {padded[i:i + 3] for i in range(max(1, len(padded) - 2))}
+        base_hashes = [zlib.crc32(shingle.encode()) for shingle in shingles]
+        prime = self._MERSENNE_PRIME
+        return tuple(
+            min((a * h + b) % prime for h in base_hashes)
+            for a, b in self._perms
+        )
+
+    def _meaning_tokens(self, normalized: str) -> Tuple[Tuple[str, ...], int]:
+        """Числа и отрицания вопроса: почти совпадающий текст с другими числами или отрицаниями — другой вопрос"""
+        words = normalized.split()
+        numbers = tuple(word for word in words if word.isdigit())
+        negations = sum(1 for word in words if word in self.NEGATION_WORDS)
+        return numbers, negations
+
+    def _band_keys(self, signature: Tuple[int, ...], prompt_hash: str) -> List[Tuple]:
+        """Ключи корзин LSH для сигнатуры"""
+        return [
+            (prompt_hash, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, key: Tuple[str, str]):
+        """Удаление записи вместе с её корзинами LSH"""
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        for band_key in self._band_keys(entry["signature"], key[0]):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def _purge_expired(self, current_time: float):
+        """Удаление просроченных записей"""
+        expired = [key for key, entry in self.entries.items() if entry["expires_at"] <= current_time]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+
+    def get(self, text: str, prompt: str) -> Optional[str]:
+        """
+        Поиск ответа в кэше
+
+        Args:
+            text: Текст вопроса
+            prompt: Персонализированный системный промпт
+
+        Returns:
+            Сохранённый ответ или None
+        """
+        normalized = self.normalize(text)
+        if not normalized:
+            return None
+
+        current_time = time.time()
+        prompt_hash = self._prompt_hash(prompt)
+        key = (prompt_hash, normalized)
+
+        entry = self.entries.get(key)
+        if entry is None:
+            # Точного совпадения нет — ищем почти совпадающие вопросы
+            signature = self._signature(normalized)
+            candidates = set()
+            for band_key in self._band_keys(signature, prompt_hash):
+                candidates.update(self.buckets.get(band_key, ()))
+
+            best_score = 0.0
+            meaning = self._meaning_tokens(normalized)
+            for candidate in candidates:
+                # Сигнатура не различает "2+2" и "2+3" или "любишь" и "не любишь"
+                if self._meaning_tokens(candidate[1]) != meaning:
+                    continue
+                candidate_signature = self.entries[candidate]["signature"]
+                score = sum(1 for x, y in zip(signature, candidate_signature) if x == y) / self.num_perm
+                if score >= self.similarity_threshold and score > best_score:
+                    best_score = score
+                    key = candidate
+            entry = self.entries.get(key) if best_score else None
+            if entry is not None:
+                self.near_hits += 1
+
+        if entry is not None and entry["expires_at"] <= current_time:
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.latency_saved += entry["latency"]
+        return entry["answer"]
+
+    def put(self, text: str, prompt: str, answer: str, latency: float = 0.0):
+        """
+        Сохранение ответа в кэш
+
+        Args:
+            text: Текст вопроса
+            prompt: Персонализированный системный промпт
+            answer: Ответ Гигачата
+            latency: Время генерации ответа в секундах (для подсчёта экономии)
+        """
+        normalized = self.normalize(text)
+        if not normalized or not answer:
+            return
+
+        current_time = time.time()
+        prompt_hash = self._prompt_hash(prompt)
+        key = (prompt_hash, normalized)
+        self._remove(key)
+
+        signature = self._signature(normalized)
+        self.entries[key] = {
+            "answer": answer,
+            "signature": signature,
+            "latency": latency,
+            "expires_at": current_time + self.ttl
+        }
+        for band_key in self._band_keys(signature, prompt_hash):
+            self.buckets.setdefault(band_key, set()).add(key)
+
+        # Вытеснение по размеру: сначала просроченные, затем самые старые
+        if len(self.entries) > self.max_entries:
+            self._purge_expired(current_time)
+        while len(self.entries) > self.max_entries:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику кэша ответов"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'near_duplicate_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'latency_saved_seconds': round(self.latency_saved, 2)
+        }
+
+    def export_state(self) -> Dict:
+        """Непросроченные записи для снимка состояния (сигнатуры не сохраняются — они пересчитываются)"""
+        current_time = time.time()
+        return {
+            "entries": [
+                [prompt_hash, normalized, entry["answer"], entry["latency"], entry["expires_at"]]
+                for (prompt_hash, normalized), entry in self.entries.items()
+                if entry["expires_at"] > current_time
+            ]
+        }
+
+    def import_state(self, data: Dict):
+        """Восстановление записей из снимка (уже закэшированные ответы не заменяются)"""
+        current_time = time.time()
+        for prompt_hash, normalized, answer, latency, expires_at in data.get("entries", []):
+            key = (prompt_hash, normalized)
+            if expires_at <= current_time or key in self.entries:
+                continue
+            signature = self._signature(normalized)
+            self.entries[key] = {"answer": answer, "signature": signature, "latency": latency, "expires_at": expires_at}
+            self.entries.move_to_end(key, last=False)  # Записи из снимка старше новых
+            for band_key in self._band_keys(signature, prompt_hash):
+                self.buckets.setdefault(band_key, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        """Очищает кэш и статистику (для тестирования)"""
+        self.entries.clear()
+        self.buckets.clear()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.latency_saved = 0.0
+
+
+# Глобальный экземпляр кэша ответов
+answer_cache = AnswerCache()
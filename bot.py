@@ -8,15 +8,21 @@ import hashlib
 import hmac
 import logging
 import time
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Dict, Any, Optional, Callable
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from config import VK_TOKEN, VK_GROUP_ID, VK_API_URL, VK_API_VERSION, CONFIRMATION_SECRET, SYSTEM_PROMPT
-from gigachat_client import gigachat_client
+from config import (
+    VK_GROUP_ID, CONFIRMATION_SECRET, SYSTEM_PROMPT, EVENT_DEADLINE, COMMENT_POOL_ENABLED, COMMENT_POOL_INTERVAL,
+    LOOP_LAG_ENABLED, DEBUG_TOKEN, PROFILER_CONTINUOUS, PROFILER_FOCUS, MEMORY_MONITOR_ENABLED,
+    MEMORY_TRACEMALLOC_FRAMES, SHUTDOWN_STEP_TIMEOUT, SNAPSHOT_ENABLED
+)
+from gigachat_client import gigachat_client, ERROR_REPLIES
 from search_client import serper_client
 from history import history_manager
 from user_preferences import user_preferences
@@ -24,6 +30,23 @@ from confirmation_manager import confirmation_manager
 from message_deduplicator import message_deduplicator
 from hostile_responses import hostile_response_manager
 from random_comments import random_comments_manager
+from answer_cache import answer_cache
+from pipeline import MessagePipeline
+from admission import Priority
+from deadline import Deadline, set_deadline
+from vk_client import vk_client
+from degraded_mode import degraded_mode
+from quota_manager import quota_manager
+from metrics import REGISTRY, Counter, Histogram, LATENCY_BUCKETS
+from tracing import tracer
+from logging_setup import logging_pipeline
+from loop_monitor import loop_monitor
+from profiler import profiler
+from memory_monitor import memory_monitor
+from health import health_checker
+from shutdown import DrainingServer, shutdown_manager
+from snapshot import snapshot_manager
+from typing_indicator import typing_indicator
 
 def safe_log_message(message: str, max_length: int = 100) -> str:
     """Безопасное логирование сообщений (обрезка длинных URL и текстов)"""
@@ -31,15 +54,8 @@ def safe_log_message(message: str, max_length: int = 100) -> str:
         return message[:max_length] + "..."
     return message
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
-)
+# Настройка логирования: запись на диск в отдельном потоке, JSON с ротацией
+logging_pipeline.setup()
 logger = logging.getLogger(__name__)
 
 # Отключаем verbose логи от HTTP библиотек
@@ -47,7 +63,85 @@ logging.getLogger("uvicorn").setLevel(logging.WARNING)
 logging.getLogger("aiohttp").setLevel(logging.WARNING)
 logging.getLogger("fastapi").setLevel(logging.WARNING)
 
-app = FastAPI(title="Сота Сил - VK Bot")
+def gigachat_is_idle() -> bool:
+    """Гигачат простаивает: нет очереди и занято не больше половины слотов"""
+    limiter = gigachat_client.limiter
+    return not limiter.queue_depth_total() and limiter.in_flight * 2 <= limiter.capacity
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Жизненный цикл приложения: фоновые задачи и запись несохранённых данных при остановке"""
+    if SNAPSHOT_ENABLED:
+        # Тёплый перезапуск: контексты бесед, дедупликация, кулдауны и кэш ответов из снимка
+        await snapshot_manager.restore()
+        snapshot_manager.start()
+    health_checker.start()
+    if LOOP_LAG_ENABLED:
+        loop_monitor.start()
+    if MEMORY_MONITOR_ENABLED:
+        memory_monitor.start(MEMORY_TRACEMALLOC_FRAMES)
+    if PROFILER_CONTINUOUS:
+        profiler.start_continuous(PROFILER_FOCUS)
+    if COMMENT_POOL_ENABLED:
+        random_comments_manager.pool.start(
+            gigachat_client.generate, random_comments_manager.comment_templates,
+            gigachat_is_idle, COMMENT_POOL_INTERVAL
+        )
+    yield
+    # События уже дождались в DrainingServer.shutdown (до закрытия порта); здесь drain лишь
+    # отмечает остановку, если приложение запущено другим сервером (uvicorn bot:app)
+    await shutdown_manager.drain()
+    await random_comments_manager.pool.stop()
+    await loop_monitor.stop()
+    await memory_monitor.stop()
+    await health_checker.stop()
+    await snapshot_manager.stop()
+    await asyncio.to_thread(profiler.stop_continuous)
+    await shutdown_manager.finish()
+
+
+# Хранилища в памяти, размер которых отслеживается (ленивые — без принудительной загрузки файла)
+memory_monitor.register("gigachat.conversations", lambda: gigachat_client.conversations)
+memory_monitor.register("deduplicator.processed_hashes", lambda: message_deduplicator.processed_hashes)
+memory_monitor.register("deduplicator.processed_messages", lambda: message_deduplicator.processed_messages)
+memory_monitor.register("history", lambda: history_manager._history)
+memory_monitor.register("user_preferences", lambda: user_preferences._preferences)
+memory_monitor.register("answer_cache", lambda: answer_cache.entries)
+memory_monitor.register("quota_manager.usage", lambda: quota_manager.usage)
+
+# Фоновые проверки апстримов для /health/ready (Serper не критичен: без поиска бот отвечает сам)
+health_checker.register("vk", vk_client.ping)
+health_checker.register("gigachat", gigachat_client.ping)
+health_checker.register("serper", serper_client.ping, critical=False)
+health_checker.watch(gigachat_client.limiter, gigachat_client.breaker)
+
+# Секции снимка состояния для тёплого перезапуска
+snapshot_manager.register("gigachat.conversations", gigachat_client.export_state, gigachat_client.import_state)
+snapshot_manager.register("deduplicator", message_deduplicator.export_state, message_deduplicator.import_state)
+snapshot_manager.register("hostile_responses.cooldowns", hostile_response_manager.cooldowns.export_state,
+                          hostile_response_manager.cooldowns.import_state)
+snapshot_manager.register("random_comments.cooldowns", random_comments_manager.cooldowns.export_state,
+                          random_comments_manager.cooldowns.import_state)
+snapshot_manager.register("answer_cache", answer_cache.export_state, answer_cache.import_state)
+
+# Остановка: хранилища записываются до закрытия сессий
+shutdown_manager.register_flush("user_preferences", user_preferences.flush)
+shutdown_manager.register_flush("history", history_manager.flush)
+shutdown_manager.register_flush("hostile_responses.cooldowns", hostile_response_manager.cooldowns.flush)
+shutdown_manager.register_flush("random_comments.cooldowns", random_comments_manager.cooldowns.flush)
+shutdown_manager.register_flush("deduplicator", message_deduplicator.flush)
+if SNAPSHOT_ENABLED:
+    shutdown_manager.register_flush("snapshot", snapshot_manager.save)
+shutdown_manager.register_close("vk_client", vk_client.close)
+shutdown_manager.register_close("gigachat_client", gigachat_client.close)
+shutdown_manager.register_close("serper_client", serper_client.close)
+
+CALLBACK_SECONDS = Histogram("callback_seconds", "Время обработки колбэка VK по типу события", LATENCY_BUCKETS, ["event"])
+INTENTS = Counter("intent_total", "Исход классификации упоминаний (search, small_talk, chat, long)", ["intent"])
+
+
+app = FastAPI(title="Сота Сил - VK Bot", lifespan=lifespan)
 
 # Настройка CORS
 app.add_middleware(
@@ -70,8 +164,6 @@ async def send_message(user_id: int, peer_id: int = None, message: str = None) -
     Returns:
         True если отправлено успешно
     """
-    import aiohttp
-
     # Определяем получателя
     if peer_id:
         # Отправка в беседу
@@ -82,25 +174,10 @@ async def send_message(user_id: int, peer_id: int = None, message: str = None) -
         recipient_id = user_id
         logger.info(f"📤 Отправка личного сообщения пользователю {user_id}")
 
-    params = {
-        "peer_id": recipient_id,
-        "message": message,
-        "access_token": VK_TOKEN,
-        "v": VK_API_VERSION,
-        "random_id": 0
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{VK_API_URL}messages.send",
-            params=params
-        ) as response:
-            data = await response.json()
-            if "error" in data:
-                logger.error(f"Ошибка отправки: {data['error']}")
-                return False
-            logger.info(f"✅ Сообщение отправлено получателю {recipient_id}")
-            return True
+    if await vk_client.send_message(recipient_id, message):
+        logger.info(f"✅ Сообщение отправлено получателю {recipient_id}")
+        return True
+    return False
 
 
 async def get_user_name(user_id: int) -> str:
@@ -113,25 +190,7 @@ async def get_user_name(user_id: int) -> str:
     Returns:
         Имя пользователя или "Друг"
     """
-    import aiohttp
-
-    params = {
-        "user_ids": user_id,
-        "access_token": VK_TOKEN,
-        "v": VK_API_VERSION,
-        "fields": "first_name"
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{VK_API_URL}users.get",
-            params=params
-        ) as response:
-            data = await response.json()
-            if "response" in data:
-                user = data["response"][0]
-                return user.get("first_name", "Друг")
-    return "Друг"
+    return await vk_client.get_user_name(user_id)
 
 
 def check_secret_secret_type(event: Dict) -> bool:
@@ -187,6 +246,25 @@ def is_search_request(text: str) -> bool:
     return False
 
 
+def classify_intent(text: str) -> str:
+    """
+    Выбор профиля генерации по сообщению (для не поисковых запросов)
+
+    Args:
+        text: Текст сообщения
+
+    Returns:
+        small_talk — короткая реплика без вопроса ("ку", "спасибо"),
+        long — длинный развёрнутый вопрос, иначе chat
+    """
+    words = text.split()
+    if len(words) > 30 or len(text) > 250:
+        return "long"
+    if len(words) <= 4 and "?" not in text:
+        return "small_talk"
+    return "chat"
+
+
 def extract_search_query(text: str) -> str:
     """
     Извлечение поискового запроса из текста
@@ -237,6 +315,17 @@ def extract_search_query(text: str) -> str:
     return query
 
 
+@app.get("/health/live")
+async def health_live():
+    """Живость процесса (без ввода-вывода)"""
+    return health_checker.live()
+
+@app.get("/health/ready")
+async def health_ready():
+    """Готовность по закэшированным проверкам апстримов, очереди и выключателю (503 — не готов)"""
+    ready, report = health_checker.ready()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
 @app.get("/update_confirmation/{new_code}")
 async def update_confirmation_code(new_code: str):
     """Обновление кода подтверждения через GET запрос"""
@@ -268,7 +357,7 @@ async def hostile_responses_status():
     stats = hostile_response_manager.get_stats()
     return {
         "hostile_responses_stats": stats,
-        "description": "Статистика системы резких ответов на негативные сообщения"
+        "description": "Статистика системы резких ответов на негативные сообщения (кулдаун в каждой беседе свой)"
     }
 
 @app.get("/random_comments_status")
@@ -277,18 +366,210 @@ async def random_comments_status():
     stats = random_comments_manager.get_stats()
     return {
         "random_comments_stats": stats,
-        "description": "Статистика системы случайных комментариев без упоминаний"
+        "description": "Статистика системы случайных комментариев без упоминаний (кулдаун в каждой беседе свой)"
+    }
+
+@app.get("/answer_cache_status")
+async def answer_cache_status():
+    """Получение статуса кэша ответов"""
+    stats = answer_cache.get_stats()
+    return {
+        "answer_cache_stats": stats,
+        "prompt_cache_stats": user_preferences.get_prompt_cache_stats(),
+        "description": "Статистика кэша ответов на типовые вопросы и кэша персонализированных промптов"
+    }
+
+@app.get("/preferences_status")
+async def preferences_status():
+    """Получение статуса хранилища настроек пользователей"""
+    return {
+        "preferences_stats": user_preferences.get_stats(),
+        "description": "Хранилище настроек и особых пользователей: отложенная атомарная запись"
+    }
+
+
+@app.post("/preferences/reload")
+async def reload_special_users(request: Request):
+    """Перечитывание особых пользователей из файла настроек без перезапуска"""
+    require_debug_token(request)
+    return {"special_users": user_preferences.reload_special_users()}
+
+
+@app.get("/usage_report")
+async def usage_report(request: Request, top: int = 10):
+    """Отчёт о расходе токенов Гигачата по пользователям и беседам"""
+    require_debug_token(request)
+    return {
+        "usage": quota_manager.get_report(top),
+        "description": "Токены из блока usage ответов Гигачата, лимиты и отказы по квотам"
+    }
+
+
+@app.get("/gigachat_status")
+async def gigachat_status():
+    """Получение статуса очереди запросов к Гигачату"""
+    stats = gigachat_client.get_stats()
+    return {
+        "gigachat_stats": stats,
+        "description": "Очередь запросов к Гигачату, состояние выключателя и повторы"
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(REGISTRY.exposition(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/traces/slowest")
+async def slowest_traces(request: Request, limit: int = 10, format: str = "json"):
+    """Самые медленные из недавних событий с разбивкой по спанам (format=otlp — в формате OTLP/JSON)"""
+    require_debug_token(request)
+    traces = tracer.slowest(max(1, min(limit, 100)))
+    if format == "otlp":
+        return tracer.export_otlp(traces)
+    return {
+        "traces": [trace.to_dict() for trace in traces],
+        "tracer_stats": tracer.get_stats(),
+        "description": "Недавние события, отсортированные по длительности обработки"
+    }
+
+@app.get("/logging_status")
+async def logging_status():
+    """Получение статуса журнала"""
+    return {
+        "logging_stats": logging_pipeline.get_stats(),
+        "description": "Очередь записей журнала и сэмплирование INFO внутри событий"
+    }
+
+def require_debug_token(request: Request):
+    """
+    Проверка токена отладочных эндпоинтов (заголовок X-Debug-Token или параметр token)
+
+    Raises:
+        HTTPException: 404 если DEBUG_TOKEN не задан, 403 при неверном токене
+    """
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Отладочные эндпоинты отключены (DEBUG_TOKEN не задан)")
+    token = request.headers.get("X-Debug-Token") or request.query_params.get("token") or ""
+    if not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Неверный токен")
+
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10, format: str = "json", focus: str = "", top: int = 30):
+    """
+    Статистическое профилирование процесса в течение seconds секунд
+
+    format=collapsed возвращает свёрнутые стеки для flamegraph.pl/speedscope,
+    focus=handle_message оставляет только стеки, проходящие через функцию
+    """
+    require_debug_token(request)
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds должен быть от 0 до 60")
+    try:
+        profile = await profiler.profile(seconds, focus)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed() + "\n")
+    return {"profile": profile.to_dict(top), "profiler_stats": profiler.get_stats()}
+
+@app.get("/debug/memory")
+async def debug_memory(request: Request, refresh: bool = False):
+    """Размеры хранилищ в памяти, RSS, пороги и снимки tracemalloc"""
+    require_debug_token(request)
+    if refresh:
+        memory_monitor.refresh()
+    return {"memory_stats": memory_monitor.get_stats()}
+
+
+@app.post("/debug/memory/snapshot")
+async def debug_memory_snapshot(request: Request, label: Optional[str] = None):
+    """Снимок tracemalloc (первый снимок включает трассировку выделений)"""
+    require_debug_token(request)
+    label = await asyncio.to_thread(memory_monitor.take_snapshot, label)
+    return {"snapshot": label, "snapshots": list(memory_monitor.snapshots)}
+
+
+@app.get("/debug/memory/diff")
+async def debug_memory_diff(request: Request, old: Optional[str] = None, new: Optional[str] = None, top: int = 20):
+    """Рост памяти между двумя снимками по строкам кода (по умолчанию — два последних)"""
+    require_debug_token(request)
+    try:
+        return {"diff": await asyncio.to_thread(memory_monitor.diff, old, new, top)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Снимок не найден: {e}")
+
+@app.get("/debug/loop_lag")
+async def loop_lag(request: Request, top: int = 10):
+    """Задержки цикла событий и стеки колбэков, которые его блокировали"""
+    require_debug_token(request)
+    return {
+        "loop_lag_stats": loop_monitor.get_stats(top),
+        "description": "Опоздание пульса цикла событий; при блокировке дольше порога снимается стек потока цикла"
+    }
+
+@app.get("/shutdown_status")
+async def shutdown_status():
+    """Получение состояния плавной остановки"""
+    return {
+        "shutdown_stats": shutdown_manager.get_stats(),
+        "description": "Обрабатываемые события и итог последней остановки (прерванные события, записанные хранилища)"
+    }
+
+@app.get("/snapshot_status")
+async def snapshot_status():
+    """Получение статуса снимков состояния"""
+    return {
+        "snapshot_stats": snapshot_manager.get_stats(),
+        "description": "Снимок состояния в памяти для тёплого перезапуска: размеры секций, последняя запись и восстановление"
     }
 
+@app.get("/typing_status")
+async def typing_status():
+    """Получение статуса индикатора набора текста"""
+    return {
+        "typing_stats": typing_indicator.get_stats(),
+        "description": "Индикатор «печатает...» во время генерации и повторные упоминания, не дождавшиеся ответа"
+    }
+
+@app.get("/degraded_mode_status")
+async def degraded_mode_status():
+    """Получение статуса деградированного режима"""
+    stats = degraded_mode.get_stats()
+    return {
+        "degraded_mode_stats": stats,
+        "description": "Ответы без Гигачата, когда он не укладывается в SLO"
+    }
+
+@app.post("/degraded_mode/{state}")
+async def set_degraded_mode(request: Request, state: str, slo: Optional[float] = None,
+                            late_policy: Optional[str] = None):
+    """Включение/выключение деградированного режима (on/off) и настройка SLO"""
+    require_debug_token(request)
+    if state not in ("on", "off"):
+        raise HTTPException(status_code=400, detail="state должен быть on или off")
+    degraded_mode.configure(enabled=state == "on", slo=slo, late_policy=late_policy)
+    return {"status": "updated", "degraded_mode_stats": degraded_mode.get_stats()}
+
 @app.post("/")
 async def vk_callback(request: Request):
     """
     Обработка событий от ВКонтакте (Callback API)
     """
+    if shutdown_manager.reject():
+        # Не "ok" — VK повторит доставку, и событие обработает новый экземпляр
+        return PlainTextResponse("shutting down", status_code=503)
+    started_at = time.monotonic()
+    event_type = "unknown"
+    # Трасса события: все стадии и исходящие запросы попадают в неё через contextvars
+    trace = tracer.start_trace("vk_callback")
+    trace_status = "ok"
     try:
         event = await request.json()
         logger.info(f"Получено событие: {event.get('type', 'unknown')}")
-        event_type = event.get("type")
+        event_type = event.get("type") or "unknown"
+        trace.root.set_attribute("vk.event_type", event_type)
+        trace.root.set_attribute("vk.event_id", str(event.get("event_id", "")))
 
         # Обработка подтверждения
         if event_type == "confirmation":
@@ -314,13 +595,34 @@ async def vk_callback(request: Request):
 
         # Обработка новых сообщений
         if event_type == "message_new":
-            await handle_message(event["object"]["message"])
+            message = event["object"]["message"]
+            trace.root.set_attribute("vk.message_id", message.get("id", 0))
+            trace.root.set_attribute("vk.peer_id", message.get("peer_id", 0))
+            # Бюджет времени на событие отсчитывается с момента получения колбэка
+            deadline = Deadline(EVENT_DEADLINE, name=str(event.get("event_id", "")))
+            set_deadline(deadline)
+            # Если обработку прервёт остановка, ID сообщения забывается: повторная доставка будет обработана
+            on_drop = partial(message_deduplicator.forget, message.get("id"))
+            try:
+                async with shutdown_manager.track(str(event.get("event_id", "")), message.get("peer_id", 0), on_drop):
+                    await asyncio.wait_for(handle_message(message), deadline.remaining())
+            except asyncio.TimeoutError:
+                trace_status = "error"
+                trace.root.set_attribute("deadline_exceeded", True)
+                logger.warning(f"⌛ Обработка события прервана по дедлайну ({deadline.report()})")
 
         return {"response": "ok"}
 
     except Exception as e:
+        trace_status = "error"
+        trace.root.set_attribute("exception.type", type(e).__name__)
         logger.error(f"Ошибка обработки события: {e}")
         return {"response": "ok"}
+    finally:
+        tracer.finish_trace(trace, trace_status)
+        # Тип события приходит извне — в метку попадают только известные типы
+        label = event_type if event_type in ("confirmation", "message_new") else "other"
+        CALLBACK_SECONDS.labels(label).observe(time.monotonic() - started_at)
 
 
 async def handle_message(message: Dict):
@@ -427,9 +729,9 @@ async def handle_message(message: Dict):
         logger.info(f"⏭️ Сообщение без упоминания в беседе, проверяем случайные комментарии...")
         
         # Проверяем, стоит ли оставить случайный комментарий
-        if random_comments_manager.should_comment(clean_text):
+        if random_comments_manager.should_comment(clean_text, message.get("peer_id")):
             logger.info(f"💬 Генерируем случайный комментарий для сообщения: {clean_text[:50]}...")
-            random_comment = random_comments_manager.generate_comment(clean_text)
+            random_comment = random_comments_manager.generate_comment(clean_text, message.get("peer_id"))
             
             if random_comment:
                 logger.info(f"🎲 Случайный комментарий: {random_comment}")
@@ -441,19 +743,57 @@ async def handle_message(message: Dict):
         logger.info(f"⏭️ Сообщение без упоминания, случайный комментарий не требуется")
         return
 
-    # Получаем имя пользователя
-    user_name = await get_user_name(user_id)
+    # Упоминание, пришедшее во время генерации ответа, — признак того, что ответа не дождались
+    typing_indicator.note_mention(message.get("peer_id"), user_id)
 
-    logger.info(f"📝 Сообщение от {user_name}: {clean_text}")
+    pipeline = MessagePipeline(f"Сообщение {message_id} в беседе {chat_id}")
+    outcome = "error"
+    try:
+        outcome = await reply_to_mention(pipeline, message, user_id, chat_id, clean_text)
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        # Отменяем стадии, результат которых не понадобился, и пишем сводку по времени
+        pipeline.finish(outcome)
+
+
+async def reply_to_mention(pipeline: MessagePipeline, message: Dict, user_id: int, chat_id: str, clean_text: str) -> str:
+    """
+    Ответ на сообщение с упоминанием бота.
+    Независимые стадии (имя пользователя, поиск, промпт) выполняются параллельно.
+
+    Args:
+        pipeline: Стадии обработки сообщения
+        message: Данные сообщения
+        user_id: ID отправителя
+        chat_id: ID беседы для истории
+        clean_text: Текст сообщения без разметки упоминания
+
+    Returns:
+        Итог обработки (для сводки по стадиям)
+    """
+    # Имя пользователя нужно только для логов — запрашиваем его параллельно с остальной работой
+    pipeline.start("users.get", get_user_name(user_id))
 
     # Проверяем, является ли это поисковым запросом
-    if is_search_request(clean_text):
+    with pipeline.stage("classify"):
+        search_request = is_search_request(clean_text)
+        intent = "search" if search_request else classify_intent(clean_text)
+        INTENTS.labels(intent).inc()
+
+    if search_request:
         logger.info(f"🔍 Выполняем поиск в интернете...")
         search_query = extract_search_query(clean_text)
         logger.info(f"🔍 Поисковый запрос: {search_query}")
 
-        # Выполняем поиск через Serper
-        search_data = await serper_client.search(search_query)
+        # Поиск и дополнение ответа тратят квоту так же, как обычный вопрос
+        over_quota = quota_manager.check(user_id, chat_id)
+        if over_quota:
+            return await reply_over_quota(pipeline, user_id, message.get("peer_id"), over_quota)
+
+        # Выполняем поиск через Serper (параллельно с запросом имени)
+        search_data = await pipeline.run("serper", serper_client.search(search_query))
 
         if search_data:
             # Форматируем результаты (получаем сниппет и ссылку)
@@ -471,12 +811,22 @@ async def handle_message(message: Dict):
 Твоя задача: дополнить этот ответ, сохранив его суть и содержание. НЕ меняй основной смысл и факты. Можно добавить детали, пояснения или контекст, но основная информация должна остаться неизменной. Отвечай как Сота Сил (загадочно и мудро), но не добавляй лишних вступлений. Кратко и по сути."""
 
                 # Отправляем в Гигачат для дополнения
-                response = await gigachat_client.chat_with_personalized_prompt(
-                    search_prompt, chat_id, SYSTEM_PROMPT
-                )
+                show_typing(pipeline, message.get("peer_id"), user_id)
+                llm_task = pipeline.start("gigachat", gigachat_client.chat_with_personalized_prompt(
+                    search_prompt, chat_id, SYSTEM_PROMPT, priority=Priority.SEARCH, profile=intent,
+                    on_usage=partial(quota_manager.record_usage, user_id, chat_id)
+                ))
+                llm_response = await degraded_mode.wait(llm_task, "search")
+                if llm_response is None:
+                    # Гигачат не уложился в SLO — отдаём сниппет как есть
+                    return await reply_degraded(
+                        pipeline, message.get("peer_id"), chat_id,
+                        f"{snippet}\n\n🔗 Источник: {link}",
+                        lambda late_response: f"{late_response}\n\n🔗 Источник: {link}"
+                    )
 
                 # Добавляем ссылку на источник в конец
-                response = f"{response}\n\n🔗 Источник: {link}"
+                response = f"{llm_response}\n\n🔗 Источник: {link}"
                 logger.info(f"✅ Поиск выполнен успешно, ответ дополнен Гигачатом")
             else:
                 # Если формат неверный, возвращаем как есть
@@ -486,118 +836,221 @@ async def handle_message(message: Dict):
             response = "Магия псиджиков не смогла найти ничего... Возможно, механизмы поиска временно недоступны."
             logger.info(f"❌ Поиск не удался")
 
+        user_name = await pipeline.result("users.get", "Друг")
+        logger.info(f"📝 Поисковый запрос от {user_name}: {safe_log_message(clean_text)}")
+
         # Сохраняем ответ в историю
-        history_manager.add_message(chat_id, "assistant", response)
+        with pipeline.stage("history"):
+            history_manager.add_message(chat_id, "assistant", response)
 
         # Отправляем ответ в беседу
-        await send_message(user_id, message.get("peer_id"), response)
-        return
+        await pipeline.run("messages.send", send_message(user_id, message.get("peer_id"), response))
+        return "search"
 
     # Проверяем команды настройки (только при упоминании)
-    setup_response = user_preferences.parse_setup_command(user_id, clean_text)
+    with pipeline.stage("setup_command"):
+        setup_response = user_preferences.parse_setup_command(user_id, clean_text)
     if setup_response:
         logger.info(f"🔧 Выполнена команда настройки: {setup_response}")
         # Отправляем ответ на команду настройки
-        await send_message(user_id, message.get("peer_id"), setup_response)
-        return
+        await pipeline.run("messages.send", send_message(user_id, message.get("peer_id"), setup_response))
+        return "setup_command"
     
     # Проверяем команду показа списка настроек (только при упоминании)
     if "настройки" in clean_text.lower() and ("команды" in clean_text.lower() or "что" in clean_text.lower()):
         commands_list = user_preferences.list_user_commands()
         logger.info(f"🔧 Показан список команд настройки")
         # Отправляем список команд
-        await send_message(user_id, message.get("peer_id"), commands_list)
-        return
+        await pipeline.run("messages.send", send_message(user_id, message.get("peer_id"), commands_list))
+        return "commands_list"
 
     # Проверяем на агрессивные сообщения
     if hostile_response_manager.is_aggressive_message(clean_text):
-        logger.info(f"⚠️ Обнаружено агрессивное сообщение от {user_name}")
-        harsh_response = hostile_response_manager.generate_harsh_response()
+        logger.info(f"⚠️ Обнаружено агрессивное сообщение от {user_id}")
+        harsh_response = hostile_response_manager.generate_harsh_response(message.get("peer_id"))
         if harsh_response:
             logger.info(f"💢 Ответ с агрессией: {harsh_response[:50]}...")
-            await send_message(user_id, message.get("peer_id"), harsh_response)
-            return
+            await pipeline.run("messages.send", send_message(user_id, message.get("peer_id"), harsh_response))
+            return "hostile"
         else:
             logger.info(f"⏰ Агрессивный ответ отклонён (кулдаун)")
             # Можно отправить нейтральный ответ или пропустить
 
-    # Получаем персонализированный промпт
-    personalized_prompt = user_preferences.get_personalized_prompt(user_id, SYSTEM_PROMPT)
+    # Получаем персонализированный промпт (не зависит ни от имени, ни от поиска)
+    with pipeline.stage("prompt"):
+        prompt = user_preferences.get_prompt(user_id, SYSTEM_PROMPT)
+        personalized_prompt, special_name = prompt.text, prompt.special_name
+        special_address = prompt.special_address
     
     # Краткая информация о персонализации
-    special_name = user_preferences.get_special_name(user_id)
     if special_name:
         logger.info(f"👑 Особый пользователь: {special_name}")
     else:
         logger.info(f"👤 Пользователь {user_id}")
 
     # Сохраняем сообщение пользователя в историю
-    history_manager.add_message(chat_id, "user", clean_text)
-
-    # Отправляем запрос в Гигачат с персонализированным промптом
-    response = await gigachat_client.chat_with_personalized_prompt(
-        clean_text, chat_id, personalized_prompt
-    )
-    
-    # Для Любови добавляем обращение в начало ответа, если его там нет
-    special_name = user_preferences.get_special_name(user_id)
-    
-    if special_name == "Любовь":
-        # Проверяем, есть ли уже обращение "моя королева" в тексте
-        if "моя королева" not in response.lower():
-            response = f"Моя королева, {response}"
-            logger.info(f"👑 Добавлено обращение для Любови")
-        else:
-            logger.info(f"👑 Обращение уже присутствует в ответе")
-    
-    # Для Титомира добавляем обращение в начало ответа, если его там нет
-    if special_name == "Титомир":
-        # Проверяем, есть ли уже обращение "неопытный менестрель" в тексте
-        if "неопытный менестрель" not in response.lower():
-            response = f"Неопытный менестрель, {response}"
-            logger.info(f"🎭 Добавлено обращение для Титомира")
-        else:
-            logger.info(f"🎭 Обращение уже присутствует в ответе")
+    with pipeline.stage("history"):
+        history_manager.add_message(chat_id, "user", clean_text)
+
+    # Проверяем кэш ответов (только для вопросов, не зависящих от контекста беседы)
+    with pipeline.stage("answer_cache"):
+        cacheable = answer_cache.is_cacheable(clean_text)
+        cached_response = answer_cache.get(clean_text, personalized_prompt) if cacheable else None
+
+    if cached_response:
+        logger.info(f"⚡ Ответ из кэша")
+        gigachat_client.remember_exchange(chat_id, clean_text, cached_response)
+        response = add_special_address(cached_response, special_address)
+    else:
+        # Квоты проверяются до запроса к модели (ответ из кэша их не тратит)
+        over_quota = quota_manager.check(user_id, chat_id)
+        if over_quota:
+            return await reply_over_quota(pipeline, user_id, message.get("peer_id"), over_quota)
+
+        # Отправляем запрос в Гигачат с персонализированным промптом
+        started_at = time.monotonic()
+        show_typing(pipeline, message.get("peer_id"), user_id)
+        llm_task = pipeline.start("gigachat", gigachat_client.chat_with_personalized_prompt(
+            clean_text, chat_id, personalized_prompt, profile=intent,
+            on_usage=partial(quota_manager.record_usage, user_id, chat_id),
+            with_history=not cacheable  # Ответ из общего кэша не должен зависеть от этой беседы
+        ))
+
+        def finalize(llm_response: str) -> str:
+            if cacheable and llm_response not in ERROR_REPLIES:
+                answer_cache.put(clean_text, personalized_prompt, llm_response, time.monotonic() - started_at)
+            return add_special_address(llm_response, special_address)
+
+        llm_response = await degraded_mode.wait(llm_task, "chat")
+        if llm_response is None:
+            # Гигачат не уложился в SLO — отвечаем шаблоном в стиле Сота Сил
+            fallback = add_special_address(random_comments_manager.get_persona_template(clean_text), special_address)
+            return await reply_degraded(pipeline, message.get("peer_id"), chat_id, fallback, finalize)
+        response = finalize(llm_response)
+
+    user_name = await pipeline.result("users.get", "Друг")
+    logger.info(f"📝 Сообщение от {user_name}: {safe_log_message(clean_text)}")
 
     # Сохраняем ответ в историю
-    history_manager.add_message(chat_id, "assistant", response)
+    with pipeline.stage("history"):
+        history_manager.add_message(chat_id, "assistant", response)
 
     # Отправляем ответ в беседу
-    await send_message(user_id, message.get("peer_id"), response)
+    await pipeline.run("messages.send", send_message(user_id, message.get("peer_id"), response))
+    return "reply"
 
 
-async def main():
-    """Запуск бота"""
-    import aiohttp
+def show_typing(pipeline: MessagePipeline, peer_id: int, user_id: int):
+    """
+    Индикатор «печатает...» на время генерации ответа
 
-    logger.info("🚀 Запуск бота 'Сота Сил'...")
+    Args:
+        pipeline: Стадии обработки сообщения (индикатор гаснет после отправки ответа)
+        peer_id: ID беседы
+        user_id: ID пользователя, которому готовится ответ
+    """
+    typing = typing_indicator.start(peer_id, user_id)
+    pipeline.defer(typing.stop)
 
-    # Проверка подключения к VK API
-    logger.info("📡 Проверка подключения к ВКонтакте...")
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{VK_API_URL}groups.getById",
-            params={
-                "group_ids": VK_GROUP_ID,
-                "access_token": VK_TOKEN,
-                "v": VK_API_VERSION
-            }
-        ) as response:
-            data = await response.json()
-            if "response" in data and "groups" in data["response"] and data["response"]["groups"]:
-                group = data["response"]["groups"][0]
-                logger.info(f"✅ Подключение к ВКонтакте: '{group.get('name', 'Сота Сил')}'")
-            else:
-                logger.error(f"❌ Ошибка подключения к VK")
-                return
 
-    # Проверка подключения к GigaChat
-    logger.info("🤖 Проверка подключения к Гигачату...")
-    if await gigachat_client.test_connection():
-        logger.info("✅ Подключение к Гигачату: успешно!")
+async def reply_over_quota(pipeline: MessagePipeline, user_id: int, peer_id: int, reason: str) -> str:
+    """
+    Шаблонный ответ пользователю, превысившему квоту (без запроса к модели)
+
+    Args:
+        pipeline: Стадии обработки сообщения
+        user_id: ID отправителя
+        peer_id: ID беседы
+        reason: Причина отказа от quota_manager.check
+
+    Returns:
+        Итог обработки
+    """
+    await pipeline.run("messages.send", send_message(user_id, peer_id, quota_manager.over_quota_reply(reason)))
+    return "over_quota"
+
+
+def add_special_address(response: str, special_address: Optional[str]) -> str:
+    """
+    Добавление особого обращения для особых пользователей
+
+    Args:
+        response: Текст ответа
+        special_address: Особое обращение из хранилища настроек (или None)
+
+    Returns:
+        Ответ с обращением в начале (если его там ещё нет)
+    """
+    if not special_address:
+        return response
+
+    # Проверяем, есть ли уже обращение в тексте
+    if special_address.lower() not in response.lower():
+        response = f"{special_address[0].upper()}{special_address[1:]}, {response}"
+        logger.info(f"👑 Добавлено обращение «{special_address}»")
     else:
-        logger.error("❌ Ошибка подключения к Гигачату")
-        return
+        logger.info(f"👑 Обращение уже присутствует в ответе")
+
+    return response
+
+
+async def reply_degraded(pipeline: MessagePipeline, peer_id: int, chat_id: str, fallback: str,
+                         finalize: Callable[[str], str]) -> str:
+    """
+    Ответ в деградированном режиме: сразу отправляем то, что есть,
+    а поздний ответ Гигачата либо подставляем правкой сообщения, либо отбрасываем
+
+    Args:
+        pipeline: Стадии обработки сообщения (с незавершённой стадией gigachat)
+        peer_id: ID беседы
+        chat_id: ID беседы для истории
+        fallback: Ответ без участия Гигачата
+        finalize: Преобразование позднего ответа модели в итоговый текст
+
+    Returns:
+        Итог обработки (для сводки по стадиям)
+    """
+    conversation_message_id = await pipeline.run(
+        "messages.send", vk_client.send_editable_message(peer_id, fallback)
+    )
+    # Ответ уже в беседе — индикатор не должен висеть, пока ждём поздний ответ
+    pipeline.release()
+
+    if degraded_mode.late_policy == "edit" and conversation_message_id:
+        late_response = await pipeline.result("gigachat")
+        if late_response and late_response not in ERROR_REPLIES:
+            response = finalize(late_response)
+            if await pipeline.run("messages.edit", vk_client.edit_message(peer_id, conversation_message_id, response)):
+                degraded_mode.record_late_answer("edited")
+                logger.info(f"✏️ Деградированный ответ заменён ответом Гигачата")
+                with pipeline.stage("history"):
+                    history_manager.add_message(chat_id, "assistant", response)
+                return "degraded_edited"
+        degraded_mode.record_late_answer("failed")
+    else:
+        # Поздний ответ не нужен — стадия gigachat будет отменена
+        degraded_mode.record_late_answer("discarded")
+
+    with pipeline.stage("history"):
+        history_manager.add_message(chat_id, "assistant", fallback)
+    return "degraded"
+
+
+def server_config(port: int) -> uvicorn.Config:
+    """
+    Настройки веб-сервера. События ждёт DrainingServer (до SHUTDOWN_DRAIN_TIMEOUT),
+    после него uvicorn ждёт уже только отправку ответов — не дольше шага остановки,
+    чтобы успеть записать хранилища до SIGKILL
+    """
+    return uvicorn.Config(app, host="0.0.0.0", port=port, timeout_graceful_shutdown=SHUTDOWN_STEP_TIMEOUT)
+
+
+async def main():
+    """Запуск бота"""
+    logger.info("🚀 Запуск бота 'Сота Сил'...")
+
+    # Подключение к ВКонтакте и Гигачату проверяется параллельно в фоне после открытия порта
+    # (health_checker, запускается в lifespan): /health/ready станет успешным, когда проверки пройдут
 
     # Запуск веб-сервера
     import os
@@ -606,8 +1059,7 @@ async def main():
     logger.info(f"🌐 Запуск веб-сервера на порту {port}...")
     logger.info("📝 Для настройки Callback API в ВКонтакте используйте URL: http://localhost:8000")
     logger.info("💡 Для локального тестирования запустите: ngrok http 8000")
-    config = uvicorn.Config(app, host="0.0.0.0", port=port)
-    server = uvicorn.Server(config)
+    server = DrainingServer(server_config(port))
     await server.serve()
 
 
@@ -618,7 +1070,7 @@ if __name__ == "__main__":
     
     if os.environ.get('RENDER'):
         # Для Render.com
-        uvicorn.run(app, host="0.0.0.0", port=port)
+        DrainingServer(server_config(port)).run()
     else:
         # Для локального запуска
         asyncio.run(main())
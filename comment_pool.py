@@ -0,0 +1,260 @@
+"""
+Пул сгенерированных комментариев
+Фоновая задача в простое заранее просит Гигачат (с низшим приоритетом)
+написать новые реплики в стиле Сота Сил для каждой категории. Комментарий
+берётся из пула за O(1), поэтому на задержку ответа генерация не влияет.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+
+from storage import BatchedWriter
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+# Генератор: промпт -> текст ответа модели (или None при ошибке)
+Generator = Callable[[str], Awaitable[Optional[str]]]
+
+
+def _normalize(text: str) -> str:
+    """Ключ для сравнения реплик: без регистра, пунктуации и лишних пробелов"""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class CommentPool:
+    """Пул свежих реплик по категориям с защитой от повторов"""
+
+    def __init__(self, categories: Iterable[str], storage_file: Optional[str] = None,
+                 pool_size: int = 12, recent_size: int = 100, batch_size: int = 5):
+        self.pool_size = pool_size  # Реплик в запасе на категорию
+        self.batch_size = batch_size  # Реплик за один запрос к модели
+        self.pools: Dict[str, Deque[str]] = {category: deque() for category in categories}
+
+        # Недавно использованные реплики (и их ключи для проверки за O(1))
+        self.recent: Deque[str] = deque(maxlen=recent_size)
+        self._recent_keys: Dict[str, int] = {}
+        self._pooled_keys: set = set()
+        self._templates_keys: set = set()
+
+        self._task: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.drawn = 0
+        self.misses = 0
+        self.generated = 0
+        self.rejected_duplicates = 0
+        self.refills = 0
+        self.failed_refills = 0
+
+        self.writer = None
+        self._pending_file = storage_file  # Сохранённый пул читается при первом обращении
+        if storage_file:
+            self.writer = BatchedWriter(storage_file, self._serialize, 30.0, "пула комментариев")
+
+    def _ensure_loaded(self):
+        """Загрузка сохранённого пула при первом обращении, а не при импорте модуля"""
+        if self._pending_file:
+            storage_file, self._pending_file = self._pending_file, None
+            self._load(storage_file)
+
+    def _load(self, storage_file: str):
+        """Загрузка пула, сохранённого при прошлом запуске"""
+        if not os.path.exists(storage_file):
+            return
+        try:
+            with open(storage_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return
+        if data.get("version") != STATE_VERSION:
+            return
+        for line in data.get("recent", []):
+            self._remember_used(line)
+        for category, lines in data.get("pools", {}).items():
+            if category in self.pools:
+                for line in lines:
+                    self.add(category, line)
+
+    def _serialize(self) -> str:
+        """Снимок пула для записи на диск"""
+        self._ensure_loaded()
+        return json.dumps({
+            "version": STATE_VERSION,
+            "pools": {category: list(lines) for category, lines in self.pools.items()},
+            "recent": list(self.recent)
+        }, ensure_ascii=False, indent=2)
+
+    def _mark_dirty(self):
+        """Пул изменился — снимок будет записан со следующей пачкой"""
+        if self.writer is not None:
+            self.writer.mark_dirty()
+
+    def set_templates(self, templates: Dict[str, List[str]]):
+        """Статические шаблоны: сгенерированные реплики не должны их повторять"""
+        self._templates_keys = {_normalize(line) for lines in templates.values() for line in lines}
+
+    def _remember_used(self, line: str):
+        """Учёт использованной реплики (старые выпадают из окна)"""
+        if len(self.recent) == self.recent.maxlen:
+            old_key = _normalize(self.recent[0])
+            count = self._recent_keys.get(old_key, 0) - 1
+            if count > 0:
+                self._recent_keys[old_key] = count
+            else:
+                self._recent_keys.pop(old_key, None)
+        self.recent.append(line)
+        key = _normalize(line)
+        self._recent_keys[key] = self._recent_keys.get(key, 0) + 1
+
+    def add(self, category: str, line: str) -> bool:
+        """
+        Добавление реплики в пул категории
+
+        Returns:
+            False если реплика повторяет недавнюю, уже лежащую в пуле или шаблон
+        """
+        self._ensure_loaded()
+        line = line.strip()
+        key = _normalize(line)
+        if not key or category not in self.pools:
+            return False
+        if key in self._recent_keys or key in self._pooled_keys or key in self._templates_keys:
+            self.rejected_duplicates += 1
+            return False
+        pool = self.pools[category]
+        if len(pool) >= self.pool_size:
+            self._pooled_keys.discard(_normalize(pool.popleft()))
+        pool.append(line)
+        self._pooled_keys.add(key)
+        return True
+
+    def draw(self, category: str) -> Optional[str]:
+        """
+        Свежая реплика из пула (O(1))
+
+        Returns:
+            Реплика или None, если пул категории пуст
+        """
+        self._ensure_loaded()
+        pool = self.pools.get(category)
+        if not pool:
+            self.misses += 1
+            return None
+        line = pool.popleft()
+        self._pooled_keys.discard(_normalize(line))
+        self._remember_used(line)
+        self.drawn += 1
+        self._mark_dirty()
+        return line
+
+    def most_depleted(self) -> Optional[str]:
+        """Категория, которой больше всего не хватает реплик (None — все пулы полные)"""
+        self._ensure_loaded()
+        category = min(self.pools, key=lambda name: len(self.pools[name]), default=None)
+        if category is None or len(self.pools[category]) >= self.pool_size:
+            return None
+        return category
+
+    @staticmethod
+    def build_prompt(category: str, examples: List[str], count: int) -> str:
+        """Промпт для генерации реплик категории"""
+        sample = "\n".join(f"- {line}" for line in examples[:4])
+        return (
+            f"Придумай {count} новых коротких реплик Сота Сил для беседы (тема: {category}). "
+            f"Каждая реплика — одно-два предложения, загадочно и с иронией, "
+            f"без повторов друг друга и примеров. Примеры стиля:\n{sample}\n\n"
+            f"Ответь только списком реплик, по одной на строке, без нумерации."
+        )
+
+    @staticmethod
+    def parse_lines(text: str) -> List[str]:
+        """Реплики из ответа модели (маркеры списков и нумерация отбрасываются)"""
+        lines = []
+        for raw in text.splitlines():
+            line = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", raw).strip().strip('"«»')
+            if 10 <= len(line) <= 300:
+                lines.append(line)
+        return lines
+
+    async def refill_once(self, generate: Generator, examples: Dict[str, List[str]]) -> int:
+        """
+        Пополнение самой истощённой категории одним запросом к модели
+
+        Returns:
+            Количество добавленных реплик
+        """
+        category = self.most_depleted()
+        if category is None:
+            return 0
+        self.refills += 1
+        text = await generate(self.build_prompt(category, examples.get(category, []), self.batch_size))
+        if not text:
+            self.failed_refills += 1
+            return 0
+        added = sum(1 for line in self.parse_lines(text) if self.add(category, line))
+        self.generated += added
+        if added:
+            self._mark_dirty()
+            logger.info(f"🧩 Пул комментариев '{category}': +{added} (в запасе {len(self.pools[category])})")
+        return added
+
+    async def run(self, generate: Generator, examples: Dict[str, List[str]],
+                  is_idle: Callable[[], bool], interval: float = 300.0):
+        """
+        Фоновая задача: пополняет пулы, пока бот простаивает
+
+        Args:
+            generate: Запрос к модели
+            examples: Статические шаблоны по категориям (примеры стиля)
+            is_idle: Проверка простоя (генерация не должна отнимать слоты у пользователей)
+            interval: Пауза между пополнениями
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if not is_idle():
+                continue
+            try:
+                await self.refill_once(generate, examples)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_refills += 1
+                logger.error(f"❌ Ошибка пополнения пула комментариев: {e}")
+
+    def start(self, generate: Generator, examples: Dict[str, List[str]],
+              is_idle: Callable[[], bool], interval: float = 300.0):
+        """Запуск фоновой задачи пополнения"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run(generate, examples, is_idle, interval))
+
+    async def stop(self):
+        """Остановка фоновой задачи и запись пула"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.writer is not None:
+            await self.writer.flush_async()
+
+    def get_stats(self) -> Dict:
+        """Статистика пула"""
+        self._ensure_loaded()
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'pooled': {category: len(lines) for category, lines in self.pools.items()},
+            'drawn': self.drawn,
+            'fallback_to_templates': self.misses,
+            'generated': self.generated,
+            'rejected_duplicates': self.rejected_duplicates,
+            'refills': self.refills,
+            'failed_refills': self.failed_refills
+        }
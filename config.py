@@ -21,6 +21,13 @@ VK_CONFIRMATION_CODE = os.getenv("VK_CONFIRMATION_CODE")
 # Ключ авторизации Гигачата (Authorization key)
 GIGACHAT_AUTH_KEY = os.getenv("GIGACHAT_AUTH_KEY")
 
+# Дополнительные ключи Гигачата через запятую (у каждого свой лимит запросов)
+GIGACHAT_AUTH_KEYS = [
+    key.strip()
+    for key in [GIGACHAT_AUTH_KEY or ""] + os.getenv("GIGACHAT_AUTH_KEYS", "").split(",")
+    if key.strip()
+]
+
 # Client ID Гигачата
 GIGACHAT_CLIENT_ID = os.getenv("GIGACHAT_CLIENT_ID")
 
@@ -38,8 +45,123 @@ VK_API_VERSION = "5.199"
 
 # Настройки производительности
 MAX_TOKENS = 600  # Максимальное количество токенов в ответе
+
+
+def _generation_profile(name: str, model: str, max_tokens: int, temperature: float) -> dict:
+    """Профиль генерации, переопределяемый через GIGACHAT_PROFILE_<ИМЯ>_MODEL/_MAX_TOKENS/_TEMPERATURE"""
+    prefix = f"GIGACHAT_PROFILE_{name.upper()}_"
+    return {
+        "model": os.getenv(prefix + "MODEL", model),
+        "max_tokens": int(os.getenv(prefix + "MAX_TOKENS", str(max_tokens))),
+        "temperature": float(os.getenv(prefix + "TEMPERATURE", str(temperature)))
+    }
+
+
+# Профили генерации по типу сообщения
+GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "GigaChat")
+GENERATION_PROFILES = {
+    "small_talk": _generation_profile("small_talk", "GigaChat", 120, 0.5),  # "ку", "спасибо", приветствия
+    "chat": _generation_profile("chat", GIGACHAT_MODEL, MAX_TOKENS, 0.4),  # Обычный вопрос
+    "long": _generation_profile("long", GIGACHAT_MODEL, 1000, 0.4),  # Длинный развёрнутый вопрос
+    "search": _generation_profile("search", GIGACHAT_MODEL, 800, 0.3),  # Дополнение результатов поиска
+    "background": _generation_profile("background", "GigaChat", 300, 0.8),  # Фоновые задачи
+}
 HISTORY_LIMIT = 10  # Количество сообщений в истории для ускорения
 
+# Ограничение нагрузки на Гигачат
+GIGACHAT_MAX_CONCURRENCY = int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "4"))  # Одновременных запросов на ключ
+GIGACHAT_KEY_EXCLUDE_AFTER = int(os.getenv("GIGACHAT_KEY_EXCLUDE_AFTER", "3"))  # 401/429 подряд до исключения ключа
+GIGACHAT_KEY_EXCLUSION = float(os.getenv("GIGACHAT_KEY_EXCLUSION", "60"))  # Секунд вне ротации
+GIGACHAT_MAX_RETRIES = int(os.getenv("GIGACHAT_MAX_RETRIES", "2"))  # Повторов при 429/5xx
+GIGACHAT_BREAKER_THRESHOLD = int(os.getenv("GIGACHAT_BREAKER_THRESHOLD", "5"))  # Ошибок подряд до отключения
+GIGACHAT_BREAKER_RECOVERY = float(os.getenv("GIGACHAT_BREAKER_RECOVERY", "30"))  # Секунд до пробного запроса
+
+# Квоты на Гигачат (корзины токенов)
+USER_REQUESTS_PER_MINUTE = int(os.getenv("USER_REQUESTS_PER_MINUTE", "6"))  # Запросов пользователя в минуту
+USER_TOKENS_PER_DAY = int(os.getenv("USER_TOKENS_PER_DAY", "20000"))  # Токенов пользователя в сутки
+CHAT_REQUESTS_PER_MINUTE = int(os.getenv("CHAT_REQUESTS_PER_MINUTE", "20"))  # Запросов беседы в минуту
+CHAT_TOKENS_PER_DAY = int(os.getenv("CHAT_TOKENS_PER_DAY", "150000"))  # Токенов беседы в сутки
+QUOTA_PROMPT_TOKENS_CAP = int(os.getenv("QUOTA_PROMPT_TOKENS_CAP", "1500"))  # Токенов промпта, списываемых с квоты за запрос
+
+# Фоновая генерация реплик для случайных комментариев
+COMMENT_POOL_ENABLED = os.getenv("COMMENT_POOL_ENABLED", "true").lower() == "true"
+COMMENT_POOL_INTERVAL = float(os.getenv("COMMENT_POOL_INTERVAL", "300"))  # Секунд между пополнениями
+
+# Индикатор набора текста во время генерации ответа
+TYPING_INDICATOR_ENABLED = os.getenv("TYPING_INDICATOR_ENABLED", "true").lower() == "true"
+TYPING_REFRESH_INTERVAL = float(os.getenv("TYPING_REFRESH_INTERVAL", "4"))  # Секунд между обновлениями статуса
+TYPING_MAX_DURATION = float(os.getenv("TYPING_MAX_DURATION", "60"))  # Максимальное время показа в беседе
+TYPING_CALLS_PER_SECOND = float(os.getenv("TYPING_CALLS_PER_SECOND", "10"))  # Лимит вызовов setActivity
+
+# Журнал: JSON-записи с ротацией по размеру, запись на диск вне цикла событий
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Размер файла до ротации
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))  # Старых файлов журнала
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))  # Доля событий с полным журналом INFO
+
+# Мониторинг блокировок цикла событий
+LOOP_LAG_ENABLED = os.getenv("LOOP_LAG_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))  # Период пульса цикла (секунды)
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))  # Блокировка, после которой снимается стек
+
+# Отладочные эндпоинты (/debug/profile, /debug/memory): без токена отключены
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+
+# Профилировщик
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))  # Период сэмплов по запросу (секунды)
+PROFILER_CONTINUOUS = os.getenv("PROFILER_CONTINUOUS", "false").lower() == "true"  # Постоянный режим
+PROFILER_CONTINUOUS_INTERVAL = float(os.getenv("PROFILER_CONTINUOUS_INTERVAL", "0.1"))  # Период сэмплов в постоянном режиме
+PROFILER_ROLL_INTERVAL = float(os.getenv("PROFILER_ROLL_INTERVAL", "300"))  # Длина окна постоянного профиля
+PROFILER_KEEP = int(os.getenv("PROFILER_KEEP", "12"))  # Сколько окон хранить на диске
+PROFILER_DIR = os.getenv("PROFILER_DIR", "profiles")
+PROFILER_FOCUS = os.getenv("PROFILER_FOCUS", "handle_message")  # Учитывать только стеки через эту функцию
+
+# Учёт памяти по подсистемам
+MEMORY_MONITOR_ENABLED = os.getenv("MEMORY_MONITOR_ENABLED", "true").lower() == "true"
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", "60"))  # Секунд между проверками
+MEMORY_SIZER_BUDGET = int(os.getenv("MEMORY_SIZER_BUDGET", "2000"))  # Записей хранилища за одну проверку
+MEMORY_RSS_LIMIT_MB = float(os.getenv("MEMORY_RSS_LIMIT_MB", "400"))  # Порог RSS процесса
+MEMORY_SUBSYSTEM_LIMIT_MB = float(os.getenv("MEMORY_SUBSYSTEM_LIMIT_MB", "50"))  # Порог одного хранилища
+MEMORY_GROWTH_ALERT_MB = float(os.getenv("MEMORY_GROWTH_ALERT_MB", "50"))  # Допустимый рост RSS за час
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "0"))  # >0 — tracemalloc с запуска
+
+# Проверки здоровья: /health/ready отвечает по результатам фоновых проверок апстримов
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "30"))  # Секунд между проверками VK/Гигачата/Serper
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))  # Таймаут одной проверки
+HEALTH_MAX_QUEUE = int(os.getenv("HEALTH_MAX_QUEUE", "20"))  # Очередь Гигачата, при которой бот не готов
+
+# Плавная остановка: ожидание обрабатываемых событий, затем запись хранилищ и закрытие сессий
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))  # Секунд на завершение событий
+SHUTDOWN_STEP_TIMEOUT = float(os.getenv("SHUTDOWN_STEP_TIMEOUT", "5"))  # Запись одного хранилища / закрытие сессии
+
+# Снимок состояния в памяти для тёплого перезапуска (контексты бесед, дедупликация, кулдауны, кэш ответов)
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", "state_snapshot.bin")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))  # Секунд между снимками (и при остановке)
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "21600"))  # Снимок старше не восстанавливается
+
+# Трассировка событий (кольцевой буфер в памяти для /debug/traces)
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))  # Последних трасс в буфере
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))  # Спанов в одной трассе
+
+# Хеджирование: дублирующий запрос, если ответа нет дольше скользящего p90
+GIGACHAT_HEDGING = os.getenv("GIGACHAT_HEDGING", "false").lower() == "true"
+GIGACHAT_HEDGE_MODEL = os.getenv("GIGACHAT_HEDGE_MODEL", "")  # Модель для дубля (по умолчанию та же)
+GIGACHAT_HEDGE_BUDGET = float(os.getenv("GIGACHAT_HEDGE_BUDGET", "0.1"))  # Максимальная доля дублей
+
+# Таймауты (в секундах)
+EVENT_DEADLINE = float(os.getenv("EVENT_DEADLINE", "25"))  # Бюджет на обработку одного события
+VK_TIMEOUT = float(os.getenv("VK_TIMEOUT", "10"))  # Запрос к VK API
+GIGACHAT_TIMEOUT = float(os.getenv("GIGACHAT_TIMEOUT", "30"))  # Запрос к Гигачату
+SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "10"))  # Запрос к Serper
+SEND_RESERVE = float(os.getenv("SEND_RESERVE", "3"))  # Время, оставляемое на отправку ответа
+
+# Деградированный режим: если Гигачат не ответил за LLM_SLO секунд, отвечаем тем, что уже есть
+DEGRADED_MODE_ENABLED = os.getenv("DEGRADED_MODE_ENABLED", "true").lower() == "true"
+LLM_SLO = float(os.getenv("LLM_SLO", "8"))
+DEGRADED_LATE_POLICY = os.getenv("DEGRADED_LATE_POLICY", "edit")  # edit — заменить ответ, discard — отбросить
+
 # Путь к файлу истории
 HISTORY_FILE = os.getenv("HISTORY_FILE", "history.json")
 
@@ -87,7 +209,7 @@ SYSTEM_PROMPT = """Ты — Сота Сил, один из трёх богов 
 # Проверка конфигурации
 if not VK_TOKEN:
     raise ValueError("VK_TOKEN не найден в .env файле!")
-if not GIGACHAT_AUTH_KEY:
+if not GIGACHAT_AUTH_KEYS:
     raise ValueError("GIGACHAT_AUTH_KEY не найден в .env файле!")
 if not VK_GROUP_ID:
     raise ValueError("VK_GROUP_ID не найден в .env файле!")
\ No newline at end of file
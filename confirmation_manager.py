@@ -19,14 +19,23 @@ class ConfirmationManager:
         self.last_attempt_time = 0
         self.attempt_count = 0
         self.max_attempts = 5
+        # Файл читается при первом обращении (первый колбэк или статус), а не при импорте модуля
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        """Загрузка сохранённого кода при первом обращении"""
+        if self._loaded:
+            return
+        self._loaded = True
         self.load_code()
-        
+
         # Если код есть в конфигурации, используем его
         if VK_CONFIRMATION_CODE:
             self.expected_code = VK_CONFIRMATION_CODE
-    
+
     def load_code(self) -> Optional[str]:
         """Загружает код подтверждения из файла"""
+        self._loaded = True
         try:
             if os.path.exists(self.storage_file):
                 with open(self.storage_file, 'r', encoding='utf-8') as f:
@@ -46,6 +55,7 @@ class ConfirmationManager:
     def save_code(self, code: str) -> bool:
         """Сохраняет код подтверждения в файл"""
         try:
+            self._ensure_loaded()
             data = {
                 'code': code,
                 'last_attempt': int(time.time()),
@@ -68,10 +78,12 @@ class ConfirmationManager:
     
     def get_code(self) -> Optional[str]:
         """Возвращает текущий код подтверждения"""
+        self._ensure_loaded()
         return self.expected_code
     
     def should_attempt_update(self) -> bool:
         """Проверяет, можно ли попытаться обновить код"""
+        self._ensure_loaded()
         current_time = int(time.time())
         
         # Если прошло больше 5 минут с последней попытки
@@ -86,16 +98,19 @@ class ConfirmationManager:
     
     def record_attempt(self):
         """Записывает попытку обновления кода"""
+        self._ensure_loaded()
         self.attempt_count += 1
         self.last_attempt_time = int(time.time())
     
     def reset_attempts(self):
         """Сбрасывает счётчик попыток"""
+        self._ensure_loaded()
         self.attempt_count = 0
         logger.info("🔄 Сброшен счётчик попыток обновления кода")
     
     def get_status(self) -> dict:
         """Возвращает статус менеджера"""
+        self._ensure_loaded()
         return {
             'has_code': self.expected_code is not None,
             'code': self.expected_code,
@@ -107,6 +122,7 @@ class ConfirmationManager:
     def update_code_from_env(self):
         """Обновляет код из переменной окружения VK_CONFIRMATION_CODE"""
         env_code = os.getenv('VK_CONFIRMATION_CODE')
+        self._ensure_loaded()
         if env_code and env_code != self.expected_code:
             self.save_code(env_code)
             logger.info(f"🔄 Код обновлён из переменной окружения: {env_code}")
@@ -0,0 +1,199 @@
+"""
+Кулдауны по беседам
+Время последнего срабатывания хранится отдельно для каждой беседы, поэтому
+активная беседа не расходует кулдаун тихой. Состояние сохраняется одним
+периодическим снимком, а не записью файла на каждое срабатывание.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from metrics import Counter
+from storage import BatchedWriter
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 2
+
+# Ключ для срабатываний вне конкретной беседы (скрипты, тесты)
+GLOBAL_PEER = 0
+
+COOLDOWN_REJECTIONS = Counter("cooldown_rejections_total", "Срабатывания, отклонённые кулдауном", ["table"])
+
+
+class CooldownTable:
+    """Таблица кулдаунов: peer_id -> время последнего срабатывания"""
+
+    def __init__(self, name: str, cooldown: float, storage_file: Optional[str] = None,
+                 snapshot_interval: float = 60.0):
+        self.name = name
+        self.cooldown = cooldown  # Секунд между срабатываниями в одной беседе
+        self.storage_file = storage_file
+        # peer_id -> time.time() последнего срабатывания; снимок читается при первом обращении
+        self._peers: Optional[Dict[int, float]] = None if storage_file else {}
+        self._fired: Dict[int, int] = {}
+        self._suppressed: Dict[int, int] = {}
+        self.fired_total = 0
+        self.suppressed_total = 0
+        self._rejections = COOLDOWN_REJECTIONS.labels(name)
+        self._last_cleanup = time.monotonic()
+
+        self.writer = None
+        if storage_file:
+            self.writer = BatchedWriter(storage_file, self._serialize, snapshot_interval, name)
+
+    @property
+    def peers(self) -> Dict[int, float]:
+        """Время последнего срабатывания по беседам"""
+        if self._peers is None:
+            self._peers = self._load()
+        return self._peers
+
+    def _load(self) -> Dict[int, float]:
+        """Загрузка снимка (старый формат с одним глобальным временем не переносится)"""
+        if not os.path.exists(self.storage_file):
+            return {}
+        try:
+            with open(self.storage_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
+        if data.get("version") != STATE_VERSION:
+            logger.info(f"📦 {self.name}: старый глобальный кулдаун заменён кулдаунами по беседам")
+            return {}
+        now = time.time()
+        return {
+            int(peer_id): timestamp for peer_id, timestamp in data.get("peers", {}).items()
+            if now - timestamp < self.cooldown
+        }
+
+    def _serialize(self) -> str:
+        """Снимок таблицы (истёкшие кулдауны не сохраняются)"""
+        now = time.time()
+        return json.dumps({
+            "version": STATE_VERSION,
+            "peers": {
+                str(peer_id): timestamp for peer_id, timestamp in self.peers.items()
+                if now - timestamp < self.cooldown
+            }
+        }, ensure_ascii=False, indent=2)
+
+    def remaining(self, peer_id: int = GLOBAL_PEER) -> float:
+        """Секунд до окончания кулдауна в беседе"""
+        last = self.peers.get(peer_id)
+        if last is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.time() - last))
+
+    def ready(self, peer_id: int = GLOBAL_PEER) -> bool:
+        """Кулдаун в беседе истёк"""
+        return self.remaining(peer_id) <= 0
+
+    def check(self, peer_id: int = GLOBAL_PEER) -> bool:
+        """
+        Проверка кулдауна перед срабатыванием: отклонённое срабатывание учитывается в статистике
+
+        Args:
+            peer_id: ID беседы
+
+        Returns:
+            True если кулдаун в беседе истёк (время срабатывания не отмечается — см. mark)
+        """
+        if self.ready(peer_id):
+            return True
+        self._suppressed[peer_id] = self._suppressed.get(peer_id, 0) + 1
+        self.suppressed_total += 1
+        self._rejections.inc()
+        return False
+
+    def try_fire(self, peer_id: int = GLOBAL_PEER) -> bool:
+        """
+        Срабатывание, если кулдаун в беседе истёк
+
+        Args:
+            peer_id: ID беседы
+
+        Returns:
+            True если можно отвечать (время срабатывания уже учтено)
+        """
+        if not self.check(peer_id):
+            return False
+        self.mark(peer_id)
+        return True
+
+    def mark(self, peer_id: int = GLOBAL_PEER):
+        """Учёт срабатывания в беседе"""
+        self._cleanup()
+        self.peers[peer_id] = time.time()
+        self._fired[peer_id] = self._fired.get(peer_id, 0) + 1
+        self.fired_total += 1
+        if self.writer is not None:
+            self.writer.mark_dirty()
+
+    def reset(self, peer_id: Optional[int] = None):
+        """Сброс кулдауна в беседе (или во всех беседах)"""
+        if peer_id is None:
+            self.peers.clear()
+        else:
+            self.peers.pop(peer_id, None)
+        if self.writer is not None:
+            self.writer.mark_dirty()
+
+    def export_state(self) -> Dict:
+        """Действующие кулдауны для снимка состояния"""
+        now = time.time()
+        return {"peers": {str(peer_id): timestamp for peer_id, timestamp in self.peers.items()
+                          if now - timestamp < self.cooldown}}
+
+    def import_state(self, data: Dict):
+        """Восстановление кулдаунов из снимка (остаётся более позднее срабатывание)"""
+        now = time.time()
+        for peer_id, timestamp in data.get("peers", {}).items():
+            if now - timestamp < self.cooldown and timestamp > self.peers.get(int(peer_id), 0):
+                self.peers[int(peer_id)] = timestamp
+
+    def _cleanup(self):
+        """Удаление бесед с истёкшим кулдауном (не чаще раза в cooldown секунд)"""
+        if time.monotonic() - self._last_cleanup < self.cooldown:
+            return
+        self._last_cleanup = time.monotonic()
+        now = time.time()
+        for peer_id, timestamp in list(self.peers.items()):
+            if now - timestamp >= self.cooldown:
+                del self.peers[peer_id]
+                self._fired.pop(peer_id, None)
+                self._suppressed.pop(peer_id, None)
+
+    async def flush(self):
+        """Запись снимка, если есть несохранённые срабатывания"""
+        if self.writer is not None:
+            await self.writer.flush_async()
+
+    def get_stats(self, top: int = 20) -> Dict:
+        """
+        Статистика кулдаунов по беседам
+
+        Args:
+            top: Сколько бесед с последними срабатываниями показать
+
+        Returns:
+            Общие счётчики и состояние кулдауна в каждой беседе
+        """
+        recent = sorted(self.peers.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            'cooldown_seconds': self.cooldown,
+            'tracked_chats': len(self.peers),
+            'fired_total': self.fired_total,
+            'suppressed_total': self.suppressed_total,
+            'chats': {
+                str(peer_id): {
+                    'next_in': int(self.remaining(peer_id)),
+                    'fired': self._fired.get(peer_id, 0),
+                    'suppressed': self._suppressed.get(peer_id, 0)
+                }
+                for peer_id, _ in recent
+            },
+            'snapshot': self.writer.get_stats() if self.writer is not None else None
+        }
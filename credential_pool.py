@@ -0,0 +1,166 @@
+"""
+Пул ключей авторизации Гигачата
+У каждого ключа свой токен доступа и свой бюджет одновременных запросов.
+Запрос уходит через наименее загруженный ключ, а ключ, который подряд
+не проходит авторизацию или упирается в 429, временно исключается.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class GigaChatCredential:
+    """Один ключ авторизации: токен доступа, загрузка и состояние"""
+
+    # Обновляем токен заранее, чтобы он не истёк посреди запроса
+    TOKEN_REFRESH_MARGIN = 60.0
+
+    def __init__(self, auth_key: str, index: int, budget: int):
+        self.name = f"key{index}"
+        self.auth_key = auth_key
+        self.budget = max(1, budget)  # Одновременных запросов через этот ключ
+        self.auth_headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            'RqUID': str(uuid.uuid4()),
+            'Authorization': f'Basic {auth_key}'
+        }
+        self.access_token: Optional[str] = None
+        self.token_expires_at = 0.0  # time.time(), когда токен перестанет действовать
+        self.token_lock = asyncio.Lock()  # Один запрос токена на ключ одновременно
+
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.excluded_until = 0.0  # time.monotonic(), до которого ключ не используется
+
+        # Статистика
+        self.requests = 0
+        self.auth_failures = 0
+        self.rate_limited = 0
+        self.times_excluded = 0
+
+    def token_valid(self) -> bool:
+        """Есть ли действующий токен доступа"""
+        return bool(self.access_token) and time.time() < self.token_expires_at - self.TOKEN_REFRESH_MARGIN
+
+    def set_token(self, access_token: Optional[str], expires_at_ms: Optional[int] = None):
+        """
+        Сохранение токена доступа
+
+        Args:
+            access_token: Токен (None — сбросить)
+            expires_at_ms: Время истечения в миллисекундах (как его возвращает OAuth Гигачата)
+        """
+        self.access_token = access_token
+        if not access_token:
+            self.token_expires_at = 0.0
+        elif expires_at_ms:
+            self.token_expires_at = expires_at_ms / 1000
+        else:
+            # Токен Гигачата живёт 30 минут
+            self.token_expires_at = time.time() + 30 * 60
+
+    def is_excluded(self) -> bool:
+        """Ключ временно исключён из маршрутизации"""
+        return time.monotonic() < self.excluded_until
+
+    def utilization(self) -> float:
+        """Доля занятого бюджета"""
+        return self.in_flight / self.budget
+
+    def get_stats(self) -> Dict:
+        """Статистика ключа (без самого ключа)"""
+        excluded_for = max(0.0, self.excluded_until - time.monotonic())
+        return {
+            'budget': self.budget,
+            'in_flight': self.in_flight,
+            'utilization': round(self.utilization(), 2),
+            'requests': self.requests,
+            'auth_failures': self.auth_failures,
+            'rate_limited': self.rate_limited,
+            'consecutive_failures': self.consecutive_failures,
+            'excluded': excluded_for > 0,
+            'excluded_for_seconds': round(excluded_for, 1),
+            'times_excluded': self.times_excluded,
+            'has_token': self.token_valid()
+        }
+
+
+class CredentialPool:
+    """Пул ключей с маршрутизацией по наименьшей загрузке"""
+
+    def __init__(self, auth_keys: Sequence[str], budget_per_key: int = 4,
+                 exclude_after: int = 3, exclusion_timeout: float = 60.0):
+        self.credentials: List[GigaChatCredential] = [
+            GigaChatCredential(key, index, budget_per_key)
+            for index, key in enumerate(dict.fromkeys(k for k in auth_keys if k))
+        ]
+        self.exclude_after = exclude_after  # Ошибок подряд до исключения ключа
+        self.exclusion_timeout = exclusion_timeout  # Секунд вне ротации
+
+    def capacity(self) -> int:
+        """Суммарный бюджет ключей, которые сейчас в ротации"""
+        active = [c for c in self.credentials if not c.is_excluded()]
+        # Если исключены все ключи, оставляем минимальную пропускную способность для проб
+        return sum(c.budget for c in active) or 1
+
+    def acquire(self) -> Optional[GigaChatCredential]:
+        """
+        Выбор наименее загруженного ключа и учёт запроса на нём
+
+        Returns:
+            Ключ или None, если пул пуст. Если исключены все ключи, возвращается тот,
+            чьё исключение закончится раньше всех (лучше попробовать, чем молчать)
+        """
+        if not self.credentials:
+            return None
+        active = [c for c in self.credentials if not c.is_excluded()]
+        if active:
+            credential = min(active, key=lambda c: (c.utilization(), c.requests))
+        else:
+            credential = min(self.credentials, key=lambda c: c.excluded_until)
+        credential.in_flight += 1
+        credential.requests += 1
+        return credential
+
+    def release(self, credential: GigaChatCredential):
+        """Запрос через ключ завершён"""
+        credential.in_flight = max(0, credential.in_flight - 1)
+
+    def record_success(self, credential: GigaChatCredential):
+        """Ключ отработал нормально"""
+        credential.consecutive_failures = 0
+
+    def record_auth_failure(self, credential: GigaChatCredential):
+        """Ключ не прошёл авторизацию"""
+        credential.auth_failures += 1
+        credential.set_token(None)
+        self._record_failure(credential, "ошибки авторизации")
+
+    def record_rate_limit(self, credential: GigaChatCredential, retry_after: Optional[float] = None):
+        """Ключ упёрся в лимит запросов (429)"""
+        credential.rate_limited += 1
+        self._record_failure(credential, "лимит запросов", retry_after)
+
+    def _record_failure(self, credential: GigaChatCredential, reason: str, retry_after: Optional[float] = None):
+        """Учёт ошибки ключа и исключение после серии ошибок подряд"""
+        credential.consecutive_failures += 1
+        if credential.consecutive_failures < self.exclude_after:
+            return
+        timeout = max(self.exclusion_timeout, retry_after or 0.0)
+        credential.excluded_until = time.monotonic() + timeout
+        credential.consecutive_failures = 0
+        credential.times_excluded += 1
+        logger.warning(f"🔑 Ключ Гигачата {credential.name} исключён на {timeout:g}s ({reason})")
+
+    def get_stats(self) -> Dict:
+        """Загрузка и состояние каждого ключа"""
+        return {
+            'keys': len(self.credentials),
+            'capacity': self.capacity(),
+            'per_key': {c.name: c.get_stats() for c in self.credentials}
+        }
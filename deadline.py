@@ -0,0 +1,96 @@
+"""
+Сквозные дедлайны обработки событий
+Дедлайн создаётся при получении события и через contextvars доступен
+всем исходящим запросам как оставшийся бюджет времени
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import aiohttp
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Бюджет времени на обработку события исчерпан"""
+
+
+class Deadline:
+    """Бюджет времени на обработку одного события"""
+
+    def __init__(self, budget: float, name: str = ""):
+        self.name = name
+        self.budget = budget  # Полный бюджет в секундах
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+        self.consumed: List[Dict] = []  # [{'stage', 'seconds'}]
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """
+        Оставшееся время
+
+        Args:
+            reserve: Время, которое нужно оставить следующим стадиям
+
+        Returns:
+            Секунды до дедлайна (не меньше нуля)
+        """
+        return max(0.0, self.expires_at - time.monotonic() - reserve)
+
+    def expired(self) -> bool:
+        """Проверка истечения дедлайна"""
+        return time.monotonic() >= self.expires_at
+
+    def record(self, stage: str, seconds: float):
+        """Учёт времени, потраченного стадией"""
+        self.consumed.append({'stage': stage, 'seconds': seconds})
+
+    def share(self, seconds: float) -> float:
+        """Доля бюджета в процентах"""
+        return 100.0 * seconds / self.budget if self.budget else 0.0
+
+    def report(self) -> str:
+        """Сводка по расходу бюджета"""
+        used = time.monotonic() - self.started_at
+        return f"бюджет {self.budget:.1f}s, израсходовано {self.share(used):.0f}%"
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def set_deadline(deadline: Optional[Deadline]):
+    """Установка дедлайна для текущего контекста (и всех задач, созданных из него)"""
+    return _current_deadline.set(deadline)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Дедлайн текущего события (None вне обработки события)"""
+    return _current_deadline.get()
+
+
+def remaining_budget(default: float, reserve: float = 0.0) -> float:
+    """
+    Время, доступное очередному исходящему запросу
+
+    Args:
+        default: Собственный таймаут запроса
+        reserve: Время, которое нужно оставить следующим стадиям
+
+    Returns:
+        Минимум из собственного таймаута и остатка бюджета события
+
+    Raises:
+        DeadlineExceeded: если бюджет уже исчерпан
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining(reserve)
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Дедлайн события {deadline.name} истёк")
+    return min(default, remaining)
+
+
+def client_timeout(default: float, reserve: float = 0.0) -> aiohttp.ClientTimeout:
+    """Таймаут aiohttp для исходящего запроса с учётом дедлайна события"""
+    return aiohttp.ClientTimeout(total=remaining_budget(default, reserve))
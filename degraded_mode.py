@@ -0,0 +1,83 @@
+"""
+Деградированный режим ответов
+Если Гигачат не уложился в SLO, бот сразу отвечает тем, что уже есть
+(сниппет поиска или шаблон в стиле Сота Сил), а поздний ответ модели
+либо отбрасывается, либо заменяет отправленное сообщение
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from config import DEGRADED_MODE_ENABLED, LLM_SLO, DEGRADED_LATE_POLICY
+
+logger = logging.getLogger(__name__)
+
+
+class DegradedModeManager:
+    """Менеджер деградированного режима"""
+
+    LATE_POLICIES = ("edit", "discard")
+
+    def __init__(self, enabled: bool = DEGRADED_MODE_ENABLED, slo: float = LLM_SLO,
+                 late_policy: str = DEGRADED_LATE_POLICY):
+        self.enabled = enabled
+        self.slo = slo  # Секунд ожидания ответа модели
+        self.late_policy = late_policy if late_policy in self.LATE_POLICIES else "edit"
+
+        # Статистика
+        self.on_time = 0
+        self.slo_misses: Dict[str, int] = {}  # путь (search/chat) -> количество
+        self.late_answers: Dict[str, int] = {"edited": 0, "discarded": 0, "failed": 0}
+
+    async def wait(self, task: asyncio.Task, path: str) -> Optional[str]:
+        """
+        Ожидание ответа модели в пределах SLO
+
+        Args:
+            task: Задача запроса к Гигачату
+            path: Путь обработки (search или chat) для статистики
+
+        Returns:
+            Ответ модели или None, если SLO нарушен и режим включён
+        """
+        if not self.enabled:
+            return await task
+
+        done, _ = await asyncio.wait({task}, timeout=self.slo)
+        if task in done:
+            self.on_time += 1
+            return task.result()
+
+        self.slo_misses[path] = self.slo_misses.get(path, 0) + 1
+        logger.warning(f"🐢 Гигачат не ответил за {self.slo:g}s, отвечаем в деградированном режиме ({path})")
+        return None
+
+    def record_late_answer(self, outcome: str):
+        """Учёт судьбы позднего ответа (edited, discarded, failed)"""
+        self.late_answers[outcome] = self.late_answers.get(outcome, 0) + 1
+
+    def configure(self, enabled: Optional[bool] = None, slo: Optional[float] = None,
+                  late_policy: Optional[str] = None):
+        """Изменение настроек режима во время работы"""
+        if enabled is not None:
+            self.enabled = enabled
+        if slo is not None and slo > 0:
+            self.slo = slo
+        if late_policy in self.LATE_POLICIES:
+            self.late_policy = late_policy
+        logger.info(f"🔧 Деградированный режим: enabled={self.enabled}, slo={self.slo}s, late={self.late_policy}")
+
+    def get_stats(self) -> Dict:
+        """Статистика деградированного режима"""
+        return {
+            'enabled': self.enabled,
+            'slo_seconds': self.slo,
+            'late_policy': self.late_policy,
+            'on_time_answers': self.on_time,
+            'slo_misses': dict(self.slo_misses),
+            'late_answers': dict(self.late_answers)
+        }
+
+
+# Глобальный экземпляр менеджера
+degraded_mode = DegradedModeManager()
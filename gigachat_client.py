@@ -1,11 +1,28 @@
 """
 Клиент для работы с API Гигачата
 """
+import asyncio
 import aiohttp
 import json
-import uuid
-from typing import List, Dict, Optional
-from config import GIGACHAT_AUTH_KEY, GIGACHAT_CLIENT_ID, GIGACHAT_SCOPE, SYSTEM_PROMPT, MAX_TOKENS
+import time
+from typing import Callable, List, Dict, Optional, Tuple
+from admission import Priority, PriorityLimiter, CircuitBreaker, HedgingPolicy, backoff_delay
+from config import (
+    GIGACHAT_AUTH_KEYS, GIGACHAT_CLIENT_ID, GIGACHAT_SCOPE, SYSTEM_PROMPT,
+    GIGACHAT_MAX_CONCURRENCY, GIGACHAT_KEY_EXCLUDE_AFTER, GIGACHAT_KEY_EXCLUSION, GIGACHAT_MAX_RETRIES, GIGACHAT_BREAKER_THRESHOLD, GIGACHAT_BREAKER_RECOVERY,
+    GIGACHAT_TIMEOUT, SEND_RESERVE, GIGACHAT_HEDGING, GIGACHAT_HEDGE_MODEL, GIGACHAT_HEDGE_BUDGET,
+    GENERATION_PROFILES
+)
+from credential_pool import CredentialPool, GigaChatCredential
+from deadline import DeadlineExceeded, client_timeout, current_deadline
+from tracing import span
+from metrics import Gauge, Histogram, LATENCY_BUCKETS, TOKEN_BUCKETS, UPSTREAM_ERRORS
+
+# Ответы-заглушки при сбоях API (это не ответы модели, их нельзя кэшировать)
+NO_TOKEN_REPLY = "Мои механизмы сейчас не отвечают... Попробуй позже."
+API_ERROR_REPLY = "Механизмы пока молчат... Попробуй позже."
+EXCEPTION_REPLY = "Что-то сломалось в моих механизмах... Попробуй позже."
+ERROR_REPLIES = frozenset({NO_TOKEN_REPLY, API_ERROR_REPLY, EXCEPTION_REPLY})
 
 
 class GigaChatClient:
@@ -14,18 +31,47 @@ class GigaChatClient:
     def __init__(self):
         self.auth_url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
         self.api_base_url = "https://gigachat.devices.sberbank.ru/api/v1"
-        self.model = "GigaChat"  # Используем базовую модель
-        self.auth_headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json',
-            'RqUID': str(uuid.uuid4()),
-            'Authorization': f'Basic {GIGACHAT_AUTH_KEY}'
-        }
+        self.profiles = GENERATION_PROFILES  # Профили генерации (модель, max_tokens, temperature)
+        self.model = self.profiles["chat"]["model"]  # Модель по умолчанию
         self.auth_payload = {
             'scope': GIGACHAT_SCOPE
         }
-        self.access_token = None
-        self.conversations: Dict[str, List[Dict]] = {}
+        self.conversations: Dict[str, List[Dict]] = {}  # Только реплики, без системного промпта
+        self._system_messages: Dict[str, Dict] = {}  # промпт -> общий для всех бесед system-message
+
+        # Пул ключей: у каждого свой токен и бюджет одновременных запросов
+        self.pool = CredentialPool(
+            GIGACHAT_AUTH_KEYS, GIGACHAT_MAX_CONCURRENCY, GIGACHAT_KEY_EXCLUDE_AFTER, GIGACHAT_KEY_EXCLUSION
+        )
+
+        # Контроль нагрузки: очередь по приоритетам (ёмкость — сумма бюджетов ключей), выключатель и повторы
+        self.limiter = PriorityLimiter(self.pool.capacity())
+        self.breaker = CircuitBreaker("Гигачат", GIGACHAT_BREAKER_THRESHOLD, GIGACHAT_BREAKER_RECOVERY)
+        self.max_retries = GIGACHAT_MAX_RETRIES
+        self.retries = 0
+        self.hedging = HedgingPolicy(GIGACHAT_HEDGING, GIGACHAT_HEDGE_BUDGET)
+        self.hedge_model = GIGACHAT_HEDGE_MODEL or None  # None — та же модель, что в профиле
+
+        # Гистограммы по профилям генерации
+        self.latency_histogram = Histogram(
+            "gigachat_profile_latency_seconds", "Время получения ответа по профилю", LATENCY_BUCKETS, ["profile"]
+        )
+        self.tokens_histogram = Histogram(
+            "gigachat_profile_completion_tokens", "Токенов в ответе по профилю", TOKEN_BUCKETS, ["profile"]
+        )
+        self.ttfb_histogram = Histogram(
+            "gigachat_ttfb_seconds", "Время до заголовков ответа chat/completions по модели", LATENCY_BUCKETS, ["model"]
+        )
+
+        # Датчики очереди вычисляются только при чтении /metrics
+        queue_depth = Gauge("gigachat_queue_depth", "Запросов к Гигачату в очереди по приоритету", ["priority"])
+        for priority in Priority:
+            queue_depth.labels(priority.name).set_function(
+                lambda name=priority.name: self.limiter.queue_depth()[name]
+            )
+        Gauge("gigachat_in_flight", "Выполняющихся запросов к Гигачату").set_function(lambda: self.limiter.in_flight)
+        Gauge("gigachat_capacity", "Ёмкость очереди (сумма бюджетов ключей)").set_function(lambda: self.limiter.capacity)
+        self._session: Optional[aiohttp.ClientSession] = None
 
     def _load_history(self, chat_id: str) -> List[Dict]:
         """Загрузка истории для конкретного чата"""
@@ -35,31 +81,285 @@ class GigaChatClient:
         """Сохранение истории для конкретного чата"""
         self.conversations[chat_id] = messages
 
-    async def _get_access_token(self) -> bool:
+    def _system_message(self, prompt: str) -> Dict:
         """
-        Получение Access Token через OAuth
+        System-message для промпта. Один объект на промпт, общий для всех бесед:
+        в историю он не копируется, а добавляется перед историей при запросе
         """
-        try:
+        message = self._system_messages.get(prompt)
+        if message is None:
+            if len(self._system_messages) >= 1000:
+                self._system_messages.clear()
+            message = self._system_messages[prompt] = {"role": "system", "content": prompt}
+        return message
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия (соединения переиспользуются между запросами)"""
+        if self._session is None or self._session.closed:
             # Отключаем проверку SSL сертификатов для Гигачата
             connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.post(
-                    self.auth_url,
-                    headers=self.auth_headers,
-                    data=self.auth_payload
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        self.access_token = data.get('access_token')
-                        if self.access_token:
-                            return True
-                    else:
-                        return False
-        except Exception as e:
-            return False
-        return False
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=GIGACHAT_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _get_access_token(self, credential: GigaChatCredential) -> bool:
+        """
+        Получение Access Token через OAuth для ключа (если действующего токена нет)
+        """
+        # Параллельные запросы через один ключ ждут один и тот же токен
+        async with credential.token_lock:
+            if credential.token_valid():
+                return True
+            try:
+                with span("gigachat.oauth", "client", key=credential.name) as oauth_span:
+                    async with self._get_session().post(
+                        self.auth_url,
+                        headers=credential.auth_headers,
+                        data=self.auth_payload,
+                        timeout=client_timeout(GIGACHAT_TIMEOUT, reserve=SEND_RESERVE)
+                    ) as response:
+                        oauth_span.set_attribute("http.status_code", response.status)
+                        if response.status == 200:
+                            data = await response.json()
+                            credential.set_token(data.get('access_token'), data.get('expires_at'))
+                            return credential.token_valid()
+                        else:
+                            return False
+            except Exception as e:
+                return False
+
+    async def _post_completion(self, messages: List[Dict], profile: Dict, credential: GigaChatCredential,
+                               model: Optional[str] = None) -> Tuple[int, Optional[Dict], Optional[float]]:
+        """
+        Один запрос к chat/completions
+
+        Args:
+            messages: Сообщения для модели
+            profile: Профиль генерации
+            credential: Ключ, через который идёт запрос
+            model: Модель вместо указанной в профиле (для дублирующих запросов)
+
+        Returns:
+            (HTTP-статус, тело ответа при успехе, значение Retry-After)
+        """
+        api_headers = {
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {credential.access_token}'
+        }
+        payload = {
+            "model": model or profile["model"],
+            "messages": messages,
+            "temperature": profile["temperature"],
+            "max_tokens": profile["max_tokens"]
+        }
+
+        # Оставляем часть бюджета события на отправку ответа
+        started_at = time.monotonic()
+        with span("gigachat.chat/completions", "client", model=payload["model"], key=credential.name) as http_span:
+            async with self._get_session().post(
+                f"{self.api_base_url}/chat/completions",
+                headers=api_headers,
+                json=payload,
+                timeout=client_timeout(GIGACHAT_TIMEOUT, reserve=SEND_RESERVE)
+            ) as response:
+                ttfb = time.monotonic() - started_at
+                self.ttfb_histogram.labels(payload["model"]).observe(ttfb)
+                http_span.set_attribute("http.status_code", response.status)
+                http_span.set_attribute("ttfb_ms", round(ttfb * 1000, 1))
+                if response.status == 200:
+                    return response.status, await response.json(), None
+                retry_after = response.headers.get("Retry-After")
+                try:
+                    retry_after = float(retry_after) if retry_after else None
+                except ValueError:
+                    retry_after = None
+                return response.status, None, retry_after
+
+    async def _post_hedged(self, messages: List[Dict], profile: str,
+                           credential: GigaChatCredential) -> Tuple[int, Optional[Dict], Optional[float]]:
+        """
+        Запрос с хеджированием: если ответа нет дольше p90 профиля, отправляется дубль
+        (при необходимости — в более быструю модель). Побеждает первый успешный
+        ответ, проигравший запрос отменяется.
+        """
+        started_at = time.monotonic()
+        result = await self._race_with_hedge(messages, profile, credential)
+        if result[0] == 200:
+            # Задержка считается от первого запроса — так её видит пользователь
+            self.hedging.record_latency(profile, time.monotonic() - started_at)
+        return result
+
+    async def _post_hedge(self, messages: List[Dict], profile: Dict) -> Tuple[Optional[int], Optional[Dict], Optional[float]]:
+        """Дубль запроса через собственный ключ пула (учитывается в загрузке ключа)"""
+        credential = self.pool.acquire()
+        try:
+            if not await self._get_access_token(credential):
+                return None, None, None
+            return await self._post_completion(messages, profile, credential, self.hedge_model)
+        finally:
+            self.pool.release(credential)
+
+    async def _race_with_hedge(self, messages: List[Dict], profile: str,
+                               credential: GigaChatCredential) -> Tuple[int, Optional[Dict], Optional[float]]:
+        """Основной запрос и, при необходимости, дубль; возвращает первый успешный ответ"""
+        delay = self.hedging.hedge_delay(profile)
+        generation = self.profiles[profile]
+        if delay is None:
+            return await self._post_completion(messages, generation, credential)
+
+        primary = asyncio.ensure_future(self._post_completion(messages, generation, credential))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if primary in done or not self.hedging.try_spend():
+                return await primary
+
+            hedge = asyncio.ensure_future(self._post_hedge(messages, generation))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result()[0] == 200:
+                        if task is hedge:
+                            self.hedging.won += 1
+                        return task.result()
+            # Оба запроса неудачны — решение о повторе принимается по основному
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _complete(self, messages: List[Dict], priority: Priority = Priority.MENTION,
+                        profile: str = "chat", on_usage: Optional[Callable[[Dict], None]] = None) -> str:
+        """
+        Получение ответа модели с учётом лимита одновременных запросов,
+        выключателя и повторов при временных ошибках
+
+        Args:
+            messages: Сообщения для модели (вместе с системным промптом)
+            priority: Приоритет запроса в очереди
+            profile: Профиль генерации (small_talk, chat, long, search, background)
+            on_usage: Обработчик блока usage успешного ответа (учёт токенов)
 
-    async def chat_with_personalized_prompt(self, user_message: str, chat_id: str, personalized_prompt: str) -> str:
+        Returns:
+            Текст ответа или одна из заглушек ERROR_REPLIES
+        """
+        # Апстрим нездоров — отвечаем сразу, не занимая очередь
+        admission = self.breaker.allow_request()
+        if admission is None:
+            return API_ERROR_REPLY
+        probe = admission == CircuitBreaker.HALF_OPEN
+
+        if profile not in self.profiles:
+            profile = "chat"
+
+        # Исключение ключа или его возврат в ротацию меняет общую пропускную способность
+        capacity = self.pool.capacity()
+        if capacity != self.limiter.capacity:
+            self.limiter.set_capacity(capacity)
+
+        started_at = time.monotonic()
+        completed = False
+        try:
+            async with self.limiter.slot(priority):
+                reply = await self._complete_with_retries(messages, profile, on_usage, probe)
+            completed = True
+            if reply not in ERROR_REPLIES:
+                self.latency_histogram.labels(profile).observe(time.monotonic() - started_at)
+            return reply
+        finally:
+            # Возвращать пробу может только сам пробный запрос: обычный запрос, пропущенный
+            # до размыкания и отменённый позже, не должен разрешать вторую пробу
+            if probe and not completed:
+                self.breaker.abandon()
+
+    async def _complete_with_retries(self, messages: List[Dict], profile: str,
+                                     on_usage: Optional[Callable[[Dict], None]] = None,
+                                     probe: bool = False) -> str:
+        """Запрос к API с обновлением токена и повторами при 429/5xx (probe — пробный запрос выключателя)"""
+        token_refreshed = False
+        attempt = 0
+        while True:
+            # Каждая попытка идёт через наименее загруженный ключ
+            credential = self.pool.acquire()
+            try:
+                # Проверяем наличие Access Token
+                if not await self._get_access_token(credential):
+                    UPSTREAM_ERRORS.labels("gigachat", "no_token").inc()
+                    self.pool.record_auth_failure(credential)
+                    # Другой ключ может оказаться исправным
+                    if len(self.pool.credentials) > 1 and attempt < self.max_retries:
+                        attempt += 1
+                        continue
+                    self.breaker.record_failure()
+                    return NO_TOKEN_REPLY
+
+                status, data, retry_after = await self._post_hedged(messages, profile, credential)
+            except DeadlineExceeded:
+                # Бюджет события исчерпан — повторять бессмысленно; исход неизвестен,
+                # поэтому пробный запрос выключателя возвращается, а не зависает
+                UPSTREAM_ERRORS.labels("gigachat", "deadline").inc()
+                if probe:
+                    self.breaker.abandon()
+                return EXCEPTION_REPLY
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                UPSTREAM_ERRORS.labels("gigachat", type(e).__name__).inc()
+                status, data, retry_after = None, None, None
+            except Exception as e:
+                UPSTREAM_ERRORS.labels("gigachat", type(e).__name__).inc()
+                self.breaker.record_failure()
+                return EXCEPTION_REPLY
+            finally:
+                self.pool.release(credential)
+
+            if status == 200:
+                self.pool.record_success(credential)
+                self.breaker.record_success()
+                usage = data.get("usage") or {}
+                if "completion_tokens" in usage:
+                    self.tokens_histogram.labels(profile).observe(usage["completion_tokens"])
+                if usage and on_usage is not None:
+                    on_usage(usage)
+                return data["choices"][0]["message"]["content"]
+
+            if status is not None:
+                UPSTREAM_ERRORS.labels("gigachat", str(status)).inc()
+
+            # Попробуем получить новый токен (один раз)
+            if status == 401:
+                self.pool.record_auth_failure(credential)
+                if not token_refreshed:
+                    token_refreshed = True
+                    continue
+            elif status == 429:
+                self.pool.record_rate_limit(credential, retry_after)
+
+            retryable = status is None or status == 429 or status >= 500
+            if retryable and attempt < self.max_retries:
+                delay = backoff_delay(attempt, retry_after=retry_after)
+                deadline = current_deadline()
+                # Повтор не успеет завершиться до дедлайна события
+                if deadline is None or deadline.remaining(SEND_RESERVE) > delay:
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+            self.breaker.record_failure()
+            return EXCEPTION_REPLY if status is None else API_ERROR_REPLY
+
+    async def chat_with_personalized_prompt(self, user_message: str, chat_id: str, personalized_prompt: str,
+                                            priority: Priority = Priority.MENTION, profile: str = "chat",
+                                            on_usage: Optional[Callable[[Dict], None]] = None,
+                                            with_history: bool = True) -> str:
         """
         Отправка сообщения в Гигачат с персонализированным промптом
 
@@ -67,171 +367,184 @@ class GigaChatClient:
             user_message: Сообщение пользователя
             chat_id: ID беседы/пользователя
             personalized_prompt: Персонализированный промпт для пользователя
+            priority: Приоритет запроса (прямое обращение, поиск или фоновая задача)
+            profile: Профиль генерации (модель и лимит токенов)
+            on_usage: Обработчик блока usage ответа (учёт токенов по квотам)
+            with_history: Передавать ли модели историю беседы (ответы для общего кэша
+                генерируются без неё, чтобы не зависеть от беседы, где их спросили)
 
         Returns:
             Ответ от Гигачата
         """
-        # Проверяем наличие Access Token
-        if not self.access_token:
-            if not await self._get_access_token():
-                return "Мои механизмы сейчас не отвечают... Попробуй позже."
-
         # Загружаем историю
         messages = self._load_history(chat_id)
 
-        # Если история пустая, добавляем персонализированный системный промпт
-        if not messages:
-            messages.append({"role": "system", "content": personalized_prompt})
-        else:
-            # Если есть сообщения, но нет системного промпта, добавляем его
-            has_system = any(msg.get("role") == "system" for msg in messages)
-            if not has_system:
-                messages.insert(0, {"role": "system", "content": personalized_prompt})
-
         # Добавляем сообщение пользователя
         messages.append({"role": "user", "content": user_message})
 
-        # Заголовки для API запросов
-        api_headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-
-        try:
-            # Отключаем проверку SSL сертификатов для API запросов
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                payload = {
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": 0.4,  # Слегка повышена для большей вариативности
-                    "max_tokens": MAX_TOKENS
-                }
+        # Персонализированный промпт актуального пользователя ставится перед историей
+        context = messages if with_history else messages[-1:]
+        assistant_message = await self._complete(
+            [self._system_message(personalized_prompt)] + context, priority, profile, on_usage
+        )
+        if assistant_message in ERROR_REPLIES:
+            return assistant_message
 
-                async with session.post(
-                    f"{self.api_base_url}/chat/completions",
-                    headers=api_headers,
-                    json=payload
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        assistant_message = data["choices"][0]["message"]["content"]
-
-                        # Сохраняем сообщение бота в историю
-                        messages.append({"role": "assistant", "content": assistant_message})
-                        self._save_history(chat_id, messages)
-
-                        return assistant_message
-                    else:
-                        # Попробуем получить новый токен
-                        if response.status == 401:
-                            self.access_token = None
-                            if await self._get_access_token():
-                                return await self.chat_with_personalized_prompt(user_message, chat_id, personalized_prompt)
-                        return "Механизмы пока молчат... Попробуй позже."
+        # Сохраняем сообщение бота в историю
+        messages.append({"role": "assistant", "content": assistant_message})
+        self._save_history(chat_id, messages)
 
-        except Exception as e:
-            return "Что-то сломалось в моих механизмах... Попробуй позже."
+        return assistant_message
 
-    async def chat(self, user_message: str, chat_id: str) -> str:
+    async def chat(self, user_message: str, chat_id: str, priority: Priority = Priority.MENTION,
+                   profile: str = "chat", on_usage: Optional[Callable[[Dict], None]] = None) -> str:
         """
         Отправка сообщения в Гигачат и получение ответа
 
         Args:
             user_message: Сообщение пользователя
             chat_id: ID беседы/пользователя
+            priority: Приоритет запроса
+            profile: Профиль генерации
+            on_usage: Обработчик блока usage ответа
 
         Returns:
             Ответ от Гигачата
         """
-        # Проверяем наличие Access Token
-        if not self.access_token:
-            if not await self._get_access_token():
-                return "Мои механизмы сейчас не отвечают... Попробуй позже."
-
         # Загружаем историю
         messages = self._load_history(chat_id)
 
-        # Если история пустая, добавляем системный промпт
-        if not messages:
-            messages.append({"role": "system", "content": SYSTEM_PROMPT})
-
         # Добавляем сообщение пользователя
         messages.append({"role": "user", "content": user_message})
 
-        # Заголовки для API запросов
-        api_headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
+        assistant_message = await self._complete(
+            [self._system_message(SYSTEM_PROMPT)] + messages, priority, profile, on_usage
+        )
+        if assistant_message in ERROR_REPLIES:
+            return assistant_message
 
-        try:
-            # Отключаем проверку SSL сертификатов для API запросов
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                payload = {
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": 0.4,  # Слегка повышена для большей вариативности
-                    "max_tokens": MAX_TOKENS
-                }
+        # Сохраняем сообщение бота в историю
+        messages.append({"role": "assistant", "content": assistant_message})
+        self._save_history(chat_id, messages)
 
-                async with session.post(
-                    f"{self.api_base_url}/chat/completions",
-                    headers=api_headers,
-                    json=payload
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        assistant_message = data["choices"][0]["message"]["content"]
-
-                        # Сохраняем сообщение бота в историю
-                        messages.append({"role": "assistant", "content": assistant_message})
-                        self._save_history(chat_id, messages)
-
-                        return assistant_message
-                    else:
-                        # Попробуем получить новый токен
-                        if response.status == 401:
-                            self.access_token = None
-                            if await self._get_access_token():
-                                return await self.chat(user_message, chat_id)
-                        return "Механизмы пока молчат... Попробуй позже."
+        return assistant_message
 
-        except Exception as e:
-            return "Что-то сломалось в моих механизмах... Попробуй позже."
+    async def generate(self, prompt: str, system_prompt: str = SYSTEM_PROMPT,
+                       priority: Priority = Priority.BACKGROUND, profile: str = "background") -> Optional[str]:
+        """
+        Разовый запрос без истории беседы (для фоновых задач)
+
+        Args:
+            prompt: Задание для модели
+            system_prompt: Системный промпт
+            priority: Приоритет в очереди (по умолчанию — фоновый)
+            profile: Профиль генерации
+
+        Returns:
+            Ответ модели или None при ошибке
+        """
+        reply = await self._complete(
+            [self._system_message(system_prompt), {"role": "user", "content": prompt}], priority, profile
+        )
+        return None if reply in ERROR_REPLIES else reply
+
+    async def ping(self) -> bool:
+        """
+        Проверка доступности Гигачата без генерации (для фоновой проверки здоровья):
+        действующий токен одного из ключей и список моделей
+
+        Returns:
+            True если API ответил 200
+        """
+        credential = self.pool.acquire()
+        if credential is None:
+            return False
+        try:
+            if not await self._get_access_token(credential):
+                return False
+            async with self._get_session().get(
+                f"{self.api_base_url}/models",
+                headers={'Accept': 'application/json', 'Authorization': f'Bearer {credential.access_token}'}
+            ) as response:
+                return response.status == 200
+        finally:
+            self.pool.release(credential)
 
     async def test_connection(self) -> bool:
         """
         Тестирование подключения к GigaChat API
         """
-        if not self.access_token:
-            if not await self._get_access_token():
+        credential = self.pool.acquire()
+        try:
+            if not await self._get_access_token(credential):
                 return False
 
-        api_headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-
-        try:
-            # Отключаем проверку SSL сертификатов для API запросов
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.get(
-                    f"{self.api_base_url}/models",
-                    headers=api_headers
-                ) as response:
-                    if response.status == 200:
-                        print("Подключение к GigaChat API успешно!")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        print(f"Ошибка подключения к GigaChat API: {response.status}, {error_text}")
-                        return False
+            api_headers = {
+                'Accept': 'application/json',
+                'Authorization': f'Bearer {credential.access_token}'
+            }
+
+            async with self._get_session().get(
+                f"{self.api_base_url}/models",
+                headers=api_headers,
+                timeout=client_timeout(GIGACHAT_TIMEOUT)
+            ) as response:
+                if response.status == 200:
+                    print("Подключение к GigaChat API успешно!")
+                    return True
+                else:
+                    error_text = await response.text()
+                    print(f"Ошибка подключения к GigaChat API: {response.status}, {error_text}")
+                    return False
         except Exception as e:
             print(f"Ошибка при тестировании подключения: {e}")
             return False
+        finally:
+            self.pool.release(credential)
+
+    def remember_exchange(self, chat_id: str, user_message: str, assistant_message: str):
+        """
+        Добавление в контекст беседы обмена репликами, полученного без запроса к API
+        (например, ответа из кэша), чтобы следующие вопросы учитывали его
+
+        Args:
+            chat_id: ID беседы/пользователя
+            user_message: Сообщение пользователя
+            assistant_message: Ответ бота
+        """
+        messages = self._load_history(chat_id)
+        messages.append({"role": "user", "content": user_message})
+        messages.append({"role": "assistant", "content": assistant_message})
+        self._save_history(chat_id, messages)
+
+    def get_stats(self) -> Dict:
+        """Статистика клиента: очередь, ключи, выключатель, повторы"""
+        return {
+            'limiter': self.limiter.get_stats(),
+            'credentials': self.pool.get_stats(),
+            'circuit_breaker': self.breaker.get_stats(),
+            'retries': self.retries,
+            'hedging': self.hedging.get_stats(),
+            'profiles': {
+                name: {
+                    **profile,
+                    'latency_seconds': self.latency_histogram.labels(name).snapshot(),
+                    'completion_tokens': self.tokens_histogram.labels(name).snapshot()
+                }
+                for name, profile in self.profiles.items()
+            },
+            'max_retries': self.max_retries,
+            'active_conversations': len(self.conversations)
+        }
+
+    def export_state(self) -> Dict:
+        """Контексты бесед для снимка состояния"""
+        return {"conversations": self.conversations}
+
+    def import_state(self, data: Dict):
+        """Восстановление контекстов бесед из снимка (беседы, начатые после запуска, не заменяются)"""
+        for chat_id, messages in data.get("conversations", {}).items():
+            self.conversations.setdefault(chat_id, messages)
 
     def clear_history(self, chat_id: str):
         """Очистка истории для конкретного чата"""
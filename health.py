@@ -0,0 +1,188 @@
+"""
+Проверки здоровья
+/health/live не делает никакого ввода-вывода: процесс жив, раз отвечает.
+/health/ready собирается из того, что уже лежит в памяти: насыщение очереди
+Гигачата, состояние выключателя и результаты проверок апстримов (VK,
+Гигачат, Serper), которые обновляет фоновая задача. Сами эндпоинты никогда
+не обращаются к апстримам.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import HEALTH_PROBE_INTERVAL, HEALTH_PROBE_TIMEOUT, HEALTH_MAX_QUEUE
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_UP = Gauge("upstream_up", "Результат последней фоновой проверки апстрима (1 — доступен)", ["upstream"])
+
+
+class _Probe:
+    """Фоновая проверка одного апстрима и её последний результат"""
+
+    def __init__(self, name: str, check: Callable[[], Awaitable[bool]], critical: bool):
+        self.name = name
+        self.check = check  # Корутина: True — апстрим отвечает
+        self.critical = critical  # Без критичного апстрима бот не готов принимать события
+        self.ok: Optional[bool] = None  # None — проверка ещё не выполнялась
+        self.checked_at = 0.0
+        self.latency = 0.0
+        self.error = ""
+        self.failures = 0
+
+    def to_dict(self, max_age: float) -> Dict:
+        age = time.monotonic() - self.checked_at if self.ok is not None else None
+        return {
+            'ok': self.ok,
+            'critical': self.critical,
+            'stale': age is not None and age > max_age,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'latency_ms': round(self.latency * 1000, 1),
+            'error': self.error,
+            'consecutive_failures': self.failures
+        }
+
+
+class HealthChecker:
+    """Живость, готовность и кэш фоновых проверок апстримов"""
+
+    def __init__(self, interval: float = HEALTH_PROBE_INTERVAL, timeout: float = HEALTH_PROBE_TIMEOUT,
+                 max_queue: int = HEALTH_MAX_QUEUE):
+        self.interval = interval  # Период фоновых проверок
+        self.timeout = timeout  # Таймаут одной проверки
+        self.max_queue = max_queue  # Очередь Гигачата, начиная с которой бот не готов
+        self.probes: Dict[str, _Probe] = {}
+        self.started_at = time.monotonic()
+        self.rounds = 0
+        self._limiter = None
+        self._breaker = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable[[], Awaitable[bool]], critical: bool = True):
+        """
+        Регистрация проверки апстрима
+
+        Args:
+            name: Имя апстрима (vk, gigachat, serper)
+            check: Корутина без аргументов, возвращающая True, если апстрим доступен
+            critical: Влияет ли результат на готовность
+        """
+        probe = self.probes[name] = _Probe(name, check, critical)
+        UPSTREAM_UP.labels(name).set_function(lambda: 1 if probe.ok else 0)
+
+    def watch(self, limiter, breaker):
+        """Очередь и выключатель, состояние которых учитывается в готовности"""
+        self._limiter = limiter
+        self._breaker = breaker
+
+    async def _run_probe(self, probe: _Probe):
+        started_at = time.monotonic()
+        try:
+            ok = bool(await asyncio.wait_for(probe.check(), self.timeout))
+            error = "" if ok else "проверка не пройдена"
+        except asyncio.TimeoutError:
+            ok, error = False, f"таймаут {self.timeout:g}s"
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        probe.latency = time.monotonic() - started_at
+        probe.checked_at = time.monotonic()
+        if probe.ok is None:
+            # Первая проверка после запуска заменяет последовательные проверки перед открытием порта
+            if ok:
+                logger.info(f"✅ Подключение к {probe.name}: успешно ({probe.latency * 1000:.0f} мс)")
+            else:
+                logger.error(f"❌ Ошибка подключения к {probe.name}: {error}")
+        elif not ok and probe.ok:
+            logger.warning(f"🩺 {probe.name} не отвечает: {error}")
+        elif ok and probe.ok is False:
+            logger.info(f"🩺 {probe.name} снова доступен")
+        probe.ok, probe.error = ok, error
+        probe.failures = 0 if ok else probe.failures + 1
+
+    async def probe_all(self):
+        """Один раунд проверок всех апстримов (параллельно)"""
+        await asyncio.gather(*(self._run_probe(probe) for probe in self.probes.values()))
+        self.rounds += 1
+
+    async def run(self):
+        """Фоновые проверки: первая сразу после запуска, дальше раз в interval"""
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"❌ Ошибка проверки апстримов: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запуск фоновых проверок"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Остановка фоновых проверок"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def live(self) -> Dict:
+        """Живость: без ввода-вывода и без обращения к состоянию апстримов"""
+        return {'status': 'alive', 'uptime_seconds': round(time.monotonic() - self.started_at, 1)}
+
+    def ready(self) -> Tuple[bool, Dict]:
+        """
+        Готовность по закэшированному состоянию
+
+        Returns:
+            (готов ли бот, отчёт с причинами неготовности)
+        """
+        max_age = self.interval * 3 + self.timeout  # Результат старше — фоновая задача не работает
+        reasons = []
+        upstreams = {}
+        for name, probe in self.probes.items():
+            report = upstreams[name] = probe.to_dict(max_age)
+            if not probe.critical:
+                continue
+            if probe.ok is None:
+                reasons.append(f"{name}: проверка ещё не выполнялась")
+            elif report['stale']:
+                reasons.append(f"{name}: результат проверки устарел")
+            elif not probe.ok:
+                reasons.append(f"{name}: {probe.error}")
+
+        queue = None
+        if self._limiter is not None:
+            depth = self._limiter.queue_depth_total()
+            queue = {
+                'depth': depth,
+                'limit': self.max_queue,
+                'in_flight': self._limiter.in_flight,
+                'capacity': self._limiter.capacity,
+                'saturated': depth >= self.max_queue
+            }
+            if queue['saturated']:
+                reasons.append(f"очередь Гигачата переполнена ({depth})")
+
+        breaker = self._breaker.get_stats() if self._breaker is not None else None
+        if breaker is not None and breaker['state'] == "open":
+            reasons.append(f"выключатель Гигачата разомкнут (повтор через {breaker['retry_in_seconds']}s)")
+
+        ready = not reasons
+        return ready, {
+            'status': 'ready' if ready else 'not_ready',
+            'reasons': reasons,
+            'upstreams': upstreams,
+            'gigachat_queue': queue,
+            'circuit_breaker': breaker,
+            'probe_rounds': self.rounds,
+            'probe_interval_seconds': self.interval
+        }
+
+
+# Глобальный экземпляр проверок здоровья
+health_checker = HealthChecker()
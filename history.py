@@ -6,6 +6,7 @@ import os
 from typing import Dict, List, Optional
 from datetime import datetime
 from config import HISTORY_LIMIT
+from storage import BatchedWriter
 
 
 class HistoryManager:
@@ -14,9 +15,19 @@ class HistoryManager:
     Хранит историю для каждой беседы отдельно.
     """
 
-    def __init__(self, history_file: str = "history.json"):
+    def __init__(self, history_file: str = "history.json", flush_delay: float = 2.0):
         self.history_file = history_file
-        self.history: Dict[str, List[Dict]] = self._load_history()
+        # Файл читается при первом обращении, а не при импорте модуля
+        self._history: Optional[Dict[str, List[Dict]]] = None
+        # Запись одной пачкой и вне цикла событий (несохранённое дописывается при остановке)
+        self.writer = BatchedWriter(history_file, self._serialize, flush_delay, "history")
+
+    @property
+    def history(self) -> Dict[str, List[Dict]]:
+        """История бесед: chat_id -> сообщения"""
+        if self._history is None:
+            self._history = self._load_history()
+        return self._history
 
     def _load_history(self) -> Dict[str, List[Dict]]:
         """Загрузка истории из файла"""
@@ -29,10 +40,17 @@ class HistoryManager:
                 return {}
         return {}
 
+    def _serialize(self) -> str:
+        """Снимок истории для записи на диск"""
+        return json.dumps(self.history, ensure_ascii=False, indent=2)
+
     def _save_history(self):
-        """Сохранение истории в файл"""
-        with open(self.history_file, 'w', encoding='utf-8') as f:
-            json.dump(self.history, f, ensure_ascii=False, indent=2)
+        """Сохранение истории в файл (отложенное)"""
+        self.writer.mark_dirty()
+
+    async def flush(self):
+        """Запись несохранённых изменений на диск"""
+        await self.writer.flush_async()
 
     def get_history(self, chat_id: str) -> List[Dict]:
         """Получение истории для конкретной беседы"""
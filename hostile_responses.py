@@ -3,19 +3,18 @@
 Бот отвечает агрессией на агрессию в стиле Сота Сил
 """
 import re
-import json
-import os
-import time
 from typing import List, Optional, Dict
 
+from cooldown_table import CooldownTable, GLOBAL_PEER
+
 
 class HostileResponseManager:
     """Менеджер резких ответов на негативные сообщения"""
     
     def __init__(self, storage_file: str = "hostile_responses_state.json"):
         self.storage_file = storage_file
-        self.last_response_time = self._load_last_response_time()
-        self.response_cooldown = 300  # 5 минут между резкими ответами
+        self.response_cooldown = 300  # 5 минут между резкими ответами (в каждой беседе)
+        self.cooldowns = CooldownTable("Резкие ответы", self.response_cooldown, storage_file)
         
         # Паттерны агрессивных сообщений
         self.aggressive_patterns = [
@@ -97,26 +96,6 @@ class HostileResponseManager:
             "Иди изучи что-нибудь полезное вместо того чтобы со мной разговаривать."
         ]
 
-    def _load_last_response_time(self) -> float:
-        """Загрузка времени последнего резкого ответа"""
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get('last_response_time', 0)
-            except (json.JSONDecodeError, IOError):
-                pass
-        return 0
-
-    def _save_last_response_time(self, timestamp: float):
-        """Сохранение времени последнего резкого ответа"""
-        try:
-            data = {'last_response_time': timestamp}
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"Ошибка сохранения времени резкого ответа: {e}")
-
     def is_aggressive_message(self, message_text: str) -> bool:
         """
         Определяет, является ли сообщение агрессивным
@@ -135,49 +114,42 @@ class HostileResponseManager:
         
         return False
 
-    def should_respond_harshly(self) -> bool:
+    def should_respond_harshly(self, peer_id: int = GLOBAL_PEER) -> bool:
         """
-        Проверяет, можно ли сейчас дать резкий ответ
+        Проверяет, можно ли сейчас дать резкий ответ в беседе
         
+        Args:
+            peer_id: ID беседы
+
         Returns:
             True если можно ответить резко
         """
-        current_time = time.time()
-        time_since_last = current_time - self.last_response_time
-        
-        return time_since_last >= self.response_cooldown
+        return self.cooldowns.ready(peer_id)
 
-    def generate_harsh_response(self) -> Optional[str]:
+    def generate_harsh_response(self, peer_id: int = GLOBAL_PEER) -> Optional[str]:
         """
         Генерирует резкий ответ
         
+        Args:
+            peer_id: ID беседы (кулдаун у каждой беседы свой)
+
         Returns:
             Сгенерированный резкий ответ или None
         """
-        if not self.should_respond_harshly():
+        if not self.cooldowns.try_fire(peer_id):
             return None
         
         # Выбираем случайный резкий ответ
         import random
         response = random.choice(self.hostile_responses)
         
-        # Обновляем время последнего ответа
-        self.last_response_time = time.time()
-        self._save_last_response_time(self.last_response_time)
-        
         return response
 
     def get_stats(self) -> Dict:
-        """Получение статистики резких ответов"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_response_time
-        
+        """Получение статистики резких ответов (кулдауны по беседам)"""
         return {
-            'last_response_time': self.last_response_time,
-            'time_since_last_response': int(time_since_last),
-            'can_respond': time_since_last >= self.response_cooldown,
-            'next_response_in': max(0, self.response_cooldown - int(time_since_last)),
-            'cooldown_minutes': self.response_cooldown // 60
+            'cooldown_minutes': self.response_cooldown // 60,
+            **self.cooldowns.get_stats()
         }
 
 
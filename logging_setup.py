@@ -0,0 +1,135 @@
+"""
+Логирование бота "Сота Сил"
+Цикл событий только кладёт записи в очередь (QueueHandler), а форматирование
+и запись на диск выполняет отдельный поток (QueueListener). В файл пишутся
+JSON-записи (structlog) с ротацией по размеру, в консоль — привычные строки.
+INFO/DEBUG внутри события сэмплируются: у несэмплированных событий остаётся
+только сводная запись по стадиям.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+from typing import Dict, Optional
+
+import structlog
+
+from config import LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE_RATE
+from tracing import current_span
+
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class EventSamplingFilter(logging.Filter):
+    """
+    Привязка записей к трассе события и сэмплирование INFO/DEBUG.
+    Решение о сэмплировании принимается по trace_id, поэтому у события
+    сохраняются либо все записи, либо только сводная (extra={'event_summary': True}).
+    Предупреждения и ошибки проходят всегда, записи вне событий — тоже.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.passed = 0
+        self.dropped = 0
+
+    def sampled(self, trace_id: str) -> bool:
+        """Попадает ли событие в выборку (одинаково для всех его записей)"""
+        return int(trace_id[-8:], 16) < self.sample_rate * 0x100000000
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = current_span()
+        if span is not None:
+            trace = span.trace
+            record.trace_id = trace.trace_id
+            record.event_id = trace.root.attributes.get("vk.event_id")
+            if (record.levelno < logging.WARNING and not getattr(record, "event_summary", False)
+                    and not self.sampled(trace.trace_id)):
+                self.dropped += 1
+                return False
+        self.passed += 1
+        return True
+
+
+def json_formatter() -> logging.Formatter:
+    """Форматтер JSON-записей: время, уровень, логгер, сообщение и ID трассы события"""
+    return structlog.stdlib.ProcessorFormatter(
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.JSONRenderer(ensure_ascii=False)
+        ],
+        foreign_pre_chain=[
+            structlog.processors.TimeStamper(fmt="iso", utc=False),
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.ExtraAdder(allow=("trace_id", "event_id"))
+        ]
+    )
+
+
+class LoggingPipeline:
+    """Очередь записей и поток, который пишет их в консоль и файл"""
+
+    def __init__(self):
+        self.queue: Optional[queue.SimpleQueue] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.sampling: Optional[EventSamplingFilter] = None
+        self.log_file = ""
+
+    def setup(self, log_file: str = LOG_FILE, level: str = LOG_LEVEL, max_bytes: int = LOG_MAX_BYTES,
+              backup_count: int = LOG_BACKUP_COUNT, sample_rate: float = LOG_SAMPLE_RATE):
+        """
+        Настройка корневого логгера (повторный вызов перенастраивает)
+
+        Args:
+            log_file: Файл JSON-журнала
+            level: Минимальный уровень записей
+            max_bytes: Размер файла, после которого он ротируется
+            backup_count: Сколько старых файлов хранить
+            sample_rate: Доля событий, у которых сохраняются все INFO/DEBUG записи
+        """
+        self.stop()
+
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True
+        )
+        file_handler.setFormatter(json_formatter())
+
+        self.queue = queue.SimpleQueue()
+        self.sampling = EventSamplingFilter(sample_rate)
+        queue_handler = logging.handlers.QueueHandler(self.queue)
+        queue_handler.addFilter(self.sampling)
+
+        root = logging.getLogger()
+        root.handlers[:] = [queue_handler]
+        root.setLevel(level)
+
+        self.listener = logging.handlers.QueueListener(self.queue, console, file_handler, respect_handler_level=True)
+        self.listener.start()
+        self.log_file = log_file
+
+    def stop(self):
+        """Запись оставшихся в очереди записей и остановка потока"""
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def get_stats(self) -> Dict:
+        """Статистика журнала"""
+        return {
+            'log_file': self.log_file,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'sample_rate': self.sampling.sample_rate if self.sampling else None,
+            'passed': self.sampling.passed if self.sampling else 0,
+            'dropped_by_sampling': self.sampling.dropped if self.sampling else 0
+        }
+
+
+# Глобальный экземпляр журнала
+logging_pipeline = LoggingPipeline()
+atexit.register(logging_pipeline.stop)
@@ -0,0 +1,163 @@
+"""
+Мониторинг задержек цикла событий
+Фоновая задача отмечает «пульс» цикла, а сторожевой поток проверяет, что
+пульс не пропал. Если цикл не отвечает дольше порога, поток снимает стек
+потока цикла (sys._current_frames) — это стек колбэка, который блокирует
+цикл прямо сейчас (синхронная запись файла, тяжёлый json.dump и т. п.)
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds", "Опоздание пульса цикла событий", LAG_BUCKETS)
+LOOP_STALLS = Counter("event_loop_stalls_total", "Блокировки цикла событий дольше порога по месту в коде", ["culprit"])
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopLagMonitor:
+    """Пульс цикла событий и сторожевой поток, ловящий блокирующие вызовы"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD,
+                 history_size: int = 50, stack_limit: int = 25):
+        self.interval = interval  # Период пульса
+        self.threshold = threshold  # Опоздание пульса, после которого снимается стек
+        self.stack_limit = stack_limit
+        self.stalls: Deque[Dict] = deque(maxlen=history_size)
+        self.culprits: Dict[str, int] = {}  # Место в коде -> число блокировок
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._current_stall: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Запуск пульса в текущем цикле и сторожевого потока"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        """Остановка мониторинга"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+
+    async def _heartbeat(self):
+        """Пульс: опоздание пробуждения — это время, на которое цикл был занят"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            with self._lock:
+                self._last_tick = now
+                stall, self._current_stall = self._current_stall, None
+                if stall is not None:
+                    stall['duration_ms'] = round(lag * 1000, 1)
+            if stall is not None:
+                logger.warning(
+                    f"🐢 Цикл событий заблокирован на {stall['duration_ms']:.0f} мс: {stall['culprit']}"
+                )
+
+    def _watchdog(self):
+        """Сторожевой поток: снимает стек цикла, если пульс пропал дольше порога"""
+        while not self._stopped.wait(self.threshold / 2):
+            with self._lock:
+                silent = time.monotonic() - self._last_tick - self.interval
+                if silent < self.threshold or self._current_stall is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                stall = self._capture(frame, silent)
+                self._current_stall = stall
+                # get_stats копирует их из цикла событий под той же блокировкой
+                self.stalls.append(stall)
+                self.culprits[stall['culprit']] = self.culprits.get(stall['culprit'], 0) + 1
+            LOOP_STALLS.labels(stall['culprit']).inc()
+
+    def _capture(self, frame, silent: float) -> Dict:
+        """Стек потока цикла и место в коде бота, где он остановился"""
+        summary = traceback.extract_stack(frame, limit=self.stack_limit)
+        return {
+            'at': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'detected_after_ms': round(silent * 1000, 1),
+            'duration_ms': None,  # Заполняется, когда цикл снова отвечает
+            'culprit': self._culprit(summary),
+            'stack': [f"{entry.filename}:{entry.lineno} {entry.name}: {entry.line}" for entry in summary]
+        }
+
+    @staticmethod
+    def _culprit(summary: traceback.StackSummary) -> str:
+        """Самый глубокий кадр из файлов бота (иначе — самый глубокий кадр вообще)"""
+        for entry in reversed(summary):
+            if entry.filename.startswith(_REPO_DIR) and not entry.filename.endswith("loop_monitor.py"):
+                return f"{os.path.relpath(entry.filename, _REPO_DIR)}:{entry.lineno} {entry.name}"
+        if summary:
+            entry = summary[-1]
+            return f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}"
+        return "unknown"
+
+    def get_stats(self, top: int = 10) -> Dict:
+        """
+        Статистика задержек цикла
+
+        Args:
+            top: Сколько последних блокировок показать со стеком
+
+        Returns:
+            Пороги, перцентили опоздания пульса, места блокировок и последние стеки
+        """
+        with self._lock:
+            stalls: List[Dict] = [dict(stall) for stall in list(self.stalls)[-top:]]
+            culprits = dict(self.culprits)
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'interval_ms': self.interval * 1000,
+            'threshold_ms': self.threshold * 1000,
+            'last_lag_ms': round(self.last_lag * 1000, 1),
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'lag_seconds': LOOP_LAG_SECONDS.labels().snapshot(),
+            'stalls_total': sum(culprits.values()),
+            'culprits': dict(sorted(culprits.items(), key=lambda item: item[1], reverse=True)),
+            'recent_stalls': list(reversed(stalls))
+        }
+
+
+# Глобальный экземпляр монитора
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,295 @@
+"""
+Учёт памяти по подсистемам
+Размер каждого хранилища в памяти (истории бесед, дедупликатор, настройки...)
+считается инкрементально: за одну проверку измеряется ограниченное число
+записей, а каждая запись заново измеряется раз за полный проход (хранилища
+меняют записи на месте, поэтому дешёвого признака изменения нет). Фоновая
+задача следит за порогами и ростом RSS; снимки tracemalloc позволяют сравнить
+две точки во времени и найти строки кода, которые выделяют растущую память.
+"""
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from config import (
+    MEMORY_CHECK_INTERVAL, MEMORY_RSS_LIMIT_MB, MEMORY_SUBSYSTEM_LIMIT_MB, MEMORY_GROWTH_ALERT_MB,
+    MEMORY_SIZER_BUDGET
+)
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+MEMORY_ALERTS = Counter("memory_alerts_total", "Превышения порогов памяти", ["subsystem"])
+SUBSYSTEM_BYTES = Gauge("memory_subsystem_bytes", "Оценка размера хранилища в памяти", ["subsystem"])
+
+
+def deep_sizeof(obj: Any) -> int:
+    """
+    Размер объекта вместе со всем, на что он ссылается (каждый объект учитывается один раз)
+
+    Обходятся словари, последовательности, множества и атрибуты объектов;
+    классы, модули и функции не учитываются.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        else:
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return size
+
+
+class _Subsystem:
+    """Инкрементальная оценка размера одного словаря-хранилища"""
+
+    def __init__(self, name: str, source: Callable[[], Optional[Dict]]):
+        self.name = name
+        self.source = source  # Возвращает словарь хранилища (None — ещё не загружено)
+        self.sizes: Dict[Any, int] = {}  # ключ -> размер записи на последнем проходе
+        self.entries_bytes = 0
+        self.container_bytes = 0
+        self.entries = 0
+        self.cursor = 0
+        self.full_passes = 0
+
+    @property
+    def total(self) -> int:
+        return self.entries_bytes + self.container_bytes
+
+    def refresh(self, budget: int):
+        """Измерение очередных budget записей; после полного прохода удаляются исчезнувшие ключи"""
+        container = self.source()
+        if container is None:
+            return
+        self.container_bytes = sys.getsizeof(container)
+        self.entries = len(container)
+        keys = list(container.keys())
+        window = keys[self.cursor:self.cursor + budget]
+        for key in window:
+            # История беседы с ограниченной длиной меняется на месте: тот же объект, та же длина
+            size = deep_sizeof(key) + deep_sizeof(container.get(key))
+            self.entries_bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+        self.cursor += len(window)
+        if self.cursor >= len(keys):
+            self.cursor = 0
+            self.full_passes += 1
+            alive = set(keys)
+            for key in [key for key in self.sizes if key not in alive]:
+                self.entries_bytes -= self.sizes.pop(key)
+
+    def to_dict(self) -> Dict:
+        return {
+            'bytes': self.total,
+            'mb': round(self.total / MB, 2),
+            'entries': self.entries,
+            'measured_entries': len(self.sizes),
+            'full_passes': self.full_passes
+        }
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (на Linux из /proc, иначе пиковый RSS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryMonitor:
+    """Размеры хранилищ, пороги памяти и снимки tracemalloc"""
+
+    def __init__(self, check_interval: float = MEMORY_CHECK_INTERVAL, budget: int = MEMORY_SIZER_BUDGET,
+                 rss_limit_mb: float = MEMORY_RSS_LIMIT_MB, subsystem_limit_mb: float = MEMORY_SUBSYSTEM_LIMIT_MB,
+                 growth_alert_mb: float = MEMORY_GROWTH_ALERT_MB, max_snapshots: int = 5):
+        self.check_interval = check_interval
+        self.budget = budget  # Записей на хранилище за одну проверку
+        self.rss_limit = rss_limit_mb * MB
+        self.subsystem_limit = subsystem_limit_mb * MB
+        self.growth_alert = growth_alert_mb * MB  # Допустимый рост RSS за час
+        self.subsystems: Dict[str, _Subsystem] = {}
+        self.snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+        self.max_snapshots = max_snapshots
+        self._snapshot_seq = 0
+        self.alerts: Deque[Dict] = deque(maxlen=50)
+        self._rss_history: Deque[Tuple[float, int]] = deque()  # (время, RSS) за последний час
+        self._alerting: set = set()  # Подсистемы, по которым уже отправлено предупреждение
+        self._task: Optional[asyncio.Task] = None
+        Gauge("process_resident_memory_bytes", "RSS процесса").set_function(rss_bytes)
+
+    def register(self, name: str, source: Callable[[], Optional[Dict]]):
+        """
+        Регистрация хранилища
+
+        Args:
+            name: Имя подсистемы (например, gigachat.conversations)
+            source: Функция, возвращающая словарь хранилища
+        """
+        subsystem = self.subsystems[name] = _Subsystem(name, source)
+        SUBSYSTEM_BYTES.labels(name).set_function(lambda: subsystem.total)
+
+    def refresh(self):
+        """Очередной инкрементальный проход по всем хранилищам"""
+        for subsystem in self.subsystems.values():
+            subsystem.refresh(self.budget)
+
+    def check(self) -> List[Dict]:
+        """
+        Обновление размеров и проверка порогов
+
+        Returns:
+            Новые предупреждения
+        """
+        self.refresh()
+        now = time.monotonic()
+        rss = rss_bytes()
+        self._rss_history.append((now, rss))
+        while self._rss_history and now - self._rss_history[0][0] > 3600:
+            self._rss_history.popleft()
+
+        exceeded = {name: s.total for name, s in self.subsystems.items() if s.total > self.subsystem_limit}
+        if rss > self.rss_limit:
+            exceeded["rss"] = rss
+        growth = rss - min(value for _, value in self._rss_history)
+        if growth > self.growth_alert:
+            exceeded["rss_growth_per_hour"] = growth
+
+        fresh = []
+        for name, value in exceeded.items():
+            if name in self._alerting:
+                continue  # Предупреждаем один раз, пока порог не перестанет превышаться
+            alert = {'at': time.strftime("%Y-%m-%d %H:%M:%S"), 'subsystem': name, 'mb': round(value / MB, 1)}
+            self.alerts.append(alert)
+            MEMORY_ALERTS.labels(name).inc()
+            fresh.append(alert)
+            logger.warning(f"🧠 Память: {name} = {alert['mb']} МБ выше порога")
+        self._alerting = set(exceeded)
+
+        # Снимок в момент тревоги — его сравнение с предыдущим покажет, откуда рост
+        if fresh and tracemalloc.is_tracing():
+            self.take_snapshot(f"alert-{time.strftime('%H%M%S')}")
+        return fresh
+
+    async def run(self):
+        """Фоновая проверка памяти"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"❌ Ошибка проверки памяти: {e}")
+
+    def start(self, trace_frames: int = 0):
+        """Запуск фоновой проверки (trace_frames > 0 — сразу включить tracemalloc)"""
+        if trace_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Остановка фоновой проверки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def take_snapshot(self, label: Optional[str] = None, frames: int = 10) -> str:
+        """
+        Снимок tracemalloc (при первом вызове трассировка включается)
+
+        Returns:
+            Метка снимка
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._snapshot_seq += 1
+        label = label or f"{time.strftime('%Y%m%d-%H%M%S')}-{self._snapshot_seq}"
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ))
+        self.snapshots[label] = snapshot
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return label
+
+    def diff(self, old: Optional[str] = None, new: Optional[str] = None, top: int = 20) -> Dict:
+        """
+        Разница между двумя снимками tracemalloc по строкам кода
+
+        Args:
+            old: Метка раннего снимка (по умолчанию предпоследний)
+            new: Метка позднего снимка (по умолчанию последний)
+            top: Сколько строк показать
+
+        Raises:
+            KeyError: если снимков меньше двух или метка не найдена
+        """
+        labels = list(self.snapshots)
+        if len(labels) < 2 and (old is None or new is None):
+            raise KeyError("Нужно минимум два снимка")
+        old = old or labels[-2]
+        new = new or labels[-1]
+        stats = self.snapshots[new].compare_to(self.snapshots[old], "lineno")
+        return {
+            'from': old,
+            'to': new,
+            'total_diff_kb': round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            'top': [{
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_diff_kb': round(stat.size_diff / 1024, 1),
+                'size_kb': round(stat.size / 1024, 1),
+                'count_diff': stat.count_diff
+            } for stat in stats[:top]]
+        }
+
+    def get_stats(self) -> Dict:
+        """Размеры хранилищ, RSS, пороги и последние предупреждения"""
+        return {
+            'rss_mb': round(rss_bytes() / MB, 1),
+            'subsystems': {name: s.to_dict() for name, s in self.subsystems.items()},
+            'limits_mb': {
+                'rss': self.rss_limit / MB,
+                'subsystem': self.subsystem_limit / MB,
+                'rss_growth_per_hour': self.growth_alert / MB
+            },
+            'alerts': list(self.alerts),
+            'tracemalloc': {
+                'tracing': tracemalloc.is_tracing(),
+                'traced_mb': round(tracemalloc.get_traced_memory()[0] / MB, 1) if tracemalloc.is_tracing() else 0,
+                'snapshots': list(self.snapshots)
+            }
+        }
+
+
+# Глобальный экземпляр монитора памяти
+memory_monitor = MemoryMonitor()
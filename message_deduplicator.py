@@ -4,19 +4,89 @@
 """
 import time
 import hashlib
+import json
 import logging
-from typing import Set, Dict, Tuple
+import os
+from typing import Set, Dict, Optional, Tuple
 from collections import defaultdict
 
+from metrics import Counter
+from storage import BatchedWriter
+
 logger = logging.getLogger(__name__)
 
+DEDUP_HITS = Counter("dedup_hits_total", "Отброшенные дубликаты сообщений по способу обнаружения", ["kind"])
+
 class MessageDeduplicator:
-    def __init__(self, max_age: int = 300):  # 5 минут
+    def __init__(self, max_age: int = 300, storage_file: Optional[str] = None):  # 5 минут
         self.max_age = max_age  # Время жизни записи в секундах
         self.processed_messages: Dict[int, float] = {}  # message_id -> timestamp
         self.processed_hashes: Dict[str, float] = {}  # content_hash -> timestamp
         self.cleanup_interval = 60  # Очищаем каждые 60 секунд
         self.last_cleanup = time.time()
+
+        # Снимок ID сообщений: после перезапуска повторная доставка VK не обрабатывается дважды
+        self.storage_file = storage_file
+        self._loaded = storage_file is None  # Снимок читается при первой проверке
+        self.writer = BatchedWriter(storage_file, self._serialize, 5.0, "дедупликатора") if storage_file else None
+
+    def _ensure_loaded(self):
+        """Загрузка снимка ID сообщений (записи старше max_age отбрасываются)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.storage_file):
+            return
+        try:
+            with open(self.storage_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return
+        now = time.time()
+        for message_id, timestamp in data.get("messages", {}).items():
+            if now - timestamp <= self.max_age:
+                self.processed_messages.setdefault(int(message_id), timestamp)
+
+    def _serialize(self) -> str:
+        """Снимок ID недавно обработанных сообщений"""
+        now = time.time()
+        return json.dumps({
+            "messages": {
+                str(message_id): timestamp for message_id, timestamp in self.processed_messages.items()
+                if now - timestamp <= self.max_age
+            }
+        })
+
+    def export_state(self) -> Dict:
+        """ID и хеши недавно обработанных сообщений для снимка состояния"""
+        now = time.time()
+        return {
+            "messages": {str(message_id): timestamp for message_id, timestamp in self.processed_messages.items()
+                         if now - timestamp <= self.max_age},
+            "hashes": {content_hash: timestamp for content_hash, timestamp in self.processed_hashes.items()
+                       if now - timestamp <= self.max_age}
+        }
+
+    def import_state(self, data: Dict):
+        """Восстановление окна дедупликации из снимка (записи старше max_age отбрасываются)"""
+        self._ensure_loaded()
+        now = time.time()
+        for message_id, timestamp in data.get("messages", {}).items():
+            if now - timestamp <= self.max_age:
+                self.processed_messages.setdefault(int(message_id), timestamp)
+        for content_hash, timestamp in data.get("hashes", {}).items():
+            if now - timestamp <= self.max_age:
+                self.processed_hashes.setdefault(content_hash, timestamp)
+
+    def forget(self, message_id: int):
+        """Удаление ID сообщения, обработка которого прервана (повторная доставка будет обработана)"""
+        if self.processed_messages.pop(message_id, None) is not None and self.writer is not None:
+            self.writer.mark_dirty()
+
+    async def flush(self):
+        """Запись снимка, если есть несохранённые изменения"""
+        if self.writer is not None:
+            await self.writer.flush_async()
     
     def _generate_content_hash(self, text: str, user_id: int, peer_id: int) -> str:
         """Генерирует хеш содержимого сообщения"""
@@ -36,6 +106,7 @@ class MessageDeduplicator:
         Returns:
             Tuple[bool, str]: (is_duplicate, reason)
         """
+        self._ensure_loaded()
         current_time = time.time()
         
         # Очистка старых записей
@@ -45,12 +116,14 @@ class MessageDeduplicator:
         
         # Сначала проверяем по ID сообщения (наиболее надёжный способ)
         if message_id and message_id in self.processed_messages:
+            DEDUP_HITS.labels("id").inc()
             return True, f"duplicate_id_{message_id}"
         
         # Если ID недоступен, проверяем по хешу содержимого
         if text and user_id and peer_id:
             content_hash = self._generate_content_hash(text, user_id, peer_id)
             if content_hash in self.processed_hashes:
+                DEDUP_HITS.labels("content").inc()
                 return True, f"duplicate_content_{content_hash[:8]}"
             
             # Добавляем хеш в обработанные
@@ -59,6 +132,8 @@ class MessageDeduplicator:
         # Добавляем ID в обработанные (если есть)
         if message_id:
             self.processed_messages[message_id] = current_time
+            if self.writer is not None:
+                self.writer.mark_dirty()
         
         return False, "new_message"
     
@@ -100,4 +175,4 @@ class MessageDeduplicator:
         logger.info("🔄 Дедупликатор сброшен")
 
 # Глобальный экземпляр дедупликатора
-message_deduplicator = MessageDeduplicator()
\ No newline at end of file
+message_deduplicator = MessageDeduplicator(storage_file="dedup_state.json")
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Метрики бота "Сота Сил"
+Лёгкие счётчики, датчики и гистограммы с фиксированными корзинами: наблюдение —
+это bisect и два сложения, поэтому инструментирование включено всегда.
+Все метрики регистрируются в REGISTRY и отдаются на /metrics в текстовом
+формате Prometheus.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Корзины по умолчанию для задержек (секунды)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0)
+
+# Корзины для быстрых операций: запись файлов, обработка в цикле событий (секунды)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Корзины для количества токенов
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 400, 600, 800, 1000, 1500, 2000)
+
+
+class _HistogramChild:
+    """Гистограмма для одного набора значений меток"""
+
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # Последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Учёт одного значения"""
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.upper_bounds[index] if index < len(self.upper_bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        """Краткая сводка для JSON-статусов"""
+        return {
+            'count': self.count,
+            'avg': round(self.sum / self.count, 3) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99)
+        }
+
+
+def _format_value(value: float) -> str:
+    """Число в формате Prometheus"""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Метки сэмпла: {name="value",...}"""
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    """Реестр метрик для /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric"):
+        """Регистрация метрики (метрика с тем же именем заменяется)"""
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["_Metric"]:
+        """Метрика по имени"""
+        return self._metrics.get(name)
+
+    def exposition(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Реестр по умолчанию
+REGISTRY = Registry()
+
+
+class _Metric(ABC):
+    """Общая часть метрик: имя, описание, метки и дочерние метрики по значениям меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """Метрика для нового набора значений меток"""
+
+    def labels(self, *values: str):
+        """Метрика для конкретных значений меток (дочерние метрики стоит сохранять в горячем коде)"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """Все наборы меток с их метриками"""
+        return list(self._children.items())
+
+    def samples(self) -> List[str]:
+        """Строки сэмплов для экспозиции"""
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+            for values, child in self._children.items()
+        ]
+
+
+class _CounterChild:
+    """Счётчик для одного набора значений меток"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        """Увеличение счётчика"""
+        self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    """Монотонный счётчик с метками"""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        """Увеличение счётчика без меток"""
+        self.labels().inc(amount)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Значения по наборам меток для JSON-статусов"""
+        return {",".join(values) or "all": child.value for values, child in self._children.items()}
+
+
+class _GaugeChild:
+    """Датчик для одного набора значений меток"""
+
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение вычисляется при чтении (ничего не стоит в горячем коде)"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """Датчик текущего значения с метками"""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        """Датчик без меток, значение которого вычисляется при чтении"""
+        self.labels().set_function(function)
+
+
+class Histogram(_Metric):
+    """Гистограмма с метками"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        """Учёт значения для гистограммы без меток"""
+        self.labels().observe(value)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Сводка по всем наборам меток"""
+        return {
+            ",".join(values) or "all": child.snapshot()
+            for values, child in self._children.items()
+        }
+
+    def samples(self) -> List[str]:
+        """Накопительные корзины, сумма и количество по каждому набору меток"""
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            bounds = self.upper_bounds + (float("inf"),)
+            for bound, bucket_count in zip(bounds, child.counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+# Ошибки внешних сервисов (VK, Гигачат, Serper) — общий счётчик для всех клиентов
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Ошибки внешних сервисов по сервису и виду ошибки", ["upstream", "kind"]
+)
@@ -0,0 +1,169 @@
+"""
+Учёт стадий обработки сообщения
+Запускает независимые стадии конкурентно и замеряет время каждой,
+чтобы в логах был виден критический путь
+"""
+import asyncio
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from deadline import current_deadline
+from metrics import Counter, Histogram, LATENCY_BUCKETS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Время стадий обработки сообщения (users.get, serper, gigachat, messages.send, history...)",
+    LATENCY_BUCKETS, ["stage"]
+)
+OUTCOMES = Counter("pipeline_outcomes_total", "Итоги обработки упоминаний", ["outcome"])
+
+
+class MessagePipeline:
+    """Граф стадий обработки одного сообщения"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.monotonic()
+        self.stages: List[Dict] = []  # [{'name', 'start', 'duration', 'status'}]
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._awaitables: Dict[str, Awaitable] = {}
+        self._deferred: List[Callable[[], None]] = []  # Действия после отправки ответа
+        self.deadline = current_deadline()  # Дедлайн события (если задан)
+
+    def _record(self, name: str, started_at: float, status: str):
+        """Запись времени выполнения стадии"""
+        duration = time.monotonic() - started_at
+        STAGE_SECONDS.labels(name).observe(duration)
+        self.stages.append({
+            'name': name,
+            'start': started_at - self.started_at,
+            'duration': duration,
+            'status': status
+        })
+        if self.deadline is not None:
+            self.deadline.record(name, duration)
+
+    async def run(self, name: str, awaitable: Awaitable) -> Any:
+        """
+        Выполнение асинхронной стадии с замером времени
+
+        Args:
+            name: Название стадии
+            awaitable: Корутина стадии
+
+        Returns:
+            Результат стадии
+        """
+        started_at = time.monotonic()
+        status = "ok"
+        try:
+            with span(name):
+                return await awaitable
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self._record(name, started_at, status)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Синхронная стадия с замером времени"""
+        started_at = time.monotonic()
+        status = "ok"
+        try:
+            with span(name):
+                yield
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self._record(name, started_at, status)
+
+    def start(self, name: str, awaitable: Awaitable) -> asyncio.Task:
+        """
+        Запуск стадии в фоне, параллельно с остальными
+
+        Args:
+            name: Название стадии
+            awaitable: Корутина стадии
+
+        Returns:
+            Задача asyncio (результат получать через await)
+        """
+        task = asyncio.ensure_future(self.run(name, awaitable))
+        self.tasks[name] = task
+        self._awaitables[name] = awaitable
+        return task
+
+    def cancel_pending(self, reason: str = ""):
+        """Отмена незавершённых стадий, если их результат больше не нужен"""
+        cancelled = [name for name, task in self.tasks.items() if not task.done()]
+        for name in cancelled:
+            self.tasks[name].cancel()
+            # Стадия могла не успеть стартовать — закрываем корутину, чтобы не было предупреждений
+            awaitable = self._awaitables.get(name)
+            if inspect.iscoroutine(awaitable) and inspect.getcoroutinestate(awaitable) == inspect.CORO_CREATED:
+                awaitable.close()
+        if cancelled:
+            logger.info(f"🛑 Отменены стадии {', '.join(cancelled)}" + (f" ({reason})" if reason else ""))
+
+    async def result(self, name: str, default: Any = None) -> Any:
+        """Результат фоновой стадии (default при ошибке или отмене)"""
+        task = self.tasks.get(name)
+        if task is None:
+            return default
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            return default
+        except Exception as e:
+            logger.error(f"Ошибка стадии {name}: {e}")
+            return default
+
+    def defer(self, callback: Callable[[], None]):
+        """Действие, которое нужно выполнить, когда ответ отправлен (или обработка прервана)"""
+        self._deferred.append(callback)
+
+    def release(self):
+        """Выполнение отложенных действий (в обратном порядке, каждое один раз)"""
+        while self._deferred:
+            callback = self._deferred.pop()
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка отложенного действия {self.name}: {e}")
+
+    def summary(self) -> str:
+        """Сводка по стадиям: смещение от начала и длительность"""
+        parts = []
+        for stage in sorted(self.stages, key=lambda s: s['start']):
+            part = f"{stage['name']}@{stage['start']:.2f}+{stage['duration']:.2f}s"
+            if self.deadline is not None:
+                # Доля бюджета события, которую съела стадия
+                part += f"({self.deadline.share(stage['duration']):.0f}%)"
+            if stage['status'] != "ok":
+                part += f"[{stage['status']}]"
+            parts.append(part)
+        total = time.monotonic() - self.started_at
+        summary = f"⏱️ {self.name}: {' '.join(parts)} total={total:.2f}s"
+        if self.deadline is not None:
+            summary += f", {self.deadline.report()}"
+        return summary
+
+    def finish(self, outcome: Optional[str] = None):
+        """Отмена оставшихся стадий и запись сводки в лог"""
+        self.release()
+        self.cancel_pending(outcome or "")
+        OUTCOMES.labels(outcome or "unknown").inc()
+        # Сводка остаётся в журнале и у событий, не попавших в выборку
+        logger.info(self.summary() + (f" ({outcome})" if outcome else ""), extra={"event_summary": True})
@@ -0,0 +1,210 @@
+"""
+Статистический профилировщик
+Отдельный поток с заданной частотой снимает стеки всех потоков процесса
+(sys._current_frames) и считает одинаковые стеки. Результат — свёрнутые
+стеки (формат flamegraph.pl / speedscope) и таблица самых частых функций.
+Профилирование по запросу длится N секунд; постоянный режим с низкой
+частотой пишет профили на диск окнами фиксированной длины.
+"""
+import asyncio
+import glob
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    PROFILER_INTERVAL, PROFILER_CONTINUOUS_INTERVAL, PROFILER_ROLL_INTERVAL, PROFILER_KEEP, PROFILER_DIR
+)
+from storage import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(frame) -> str:
+    """Кадр стека: функция (файл:строка начала функции)"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    """Накопленные стеки одного окна профилирования"""
+
+    def __init__(self):
+        self.stacks: Dict[str, int] = {}  # "поток;внешний кадр;...;внутренний кадр" -> число сэмплов
+        self.samples = 0  # Сколько раз снимались стеки
+        self.started_at = time.time()
+        self.duration = 0.0
+
+    def add(self, stack: str):
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def collapsed(self) -> str:
+        """Свёрнутые стеки: строка на стек, в конце число сэмплов"""
+        return "\n".join(f"{stack} {count}" for stack, count in
+                         sorted(self.stacks.items(), key=lambda item: item[1], reverse=True))
+
+    def top(self, limit: int = 20) -> List[Dict]:
+        """
+        Самые частые функции
+
+        Returns:
+            [{'function', 'self', 'total', 'self_percent', 'total_percent'}]:
+            self — функция на вершине стека, total — функция где-либо в стеке
+        """
+        own: Dict[str, int] = {}
+        inclusive: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # Первый элемент — имя потока
+            if not frames:
+                continue
+            own[frames[-1]] = own.get(frames[-1], 0) + count
+            for name in set(frames):
+                inclusive[name] = inclusive.get(name, 0) + count
+        total = sum(self.stacks.values()) or 1
+        rows = sorted(inclusive, key=lambda name: (own.get(name, 0), inclusive[name]), reverse=True)[:limit]
+        return [{
+            'function': name,
+            'self': own.get(name, 0),
+            'total': inclusive[name],
+            'self_percent': round(100 * own.get(name, 0) / total, 1),
+            'total_percent': round(100 * inclusive[name] / total, 1)
+        } for name in rows]
+
+    def to_dict(self, top: int = 20) -> Dict:
+        return {
+            'started_at': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            'duration_seconds': round(self.duration, 2),
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'top': self.top(top),
+            'collapsed': self.collapsed()
+        }
+
+
+class SamplingProfiler:
+    """Профилировщик по запросу и в постоянном режиме"""
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, continuous_interval: float = PROFILER_CONTINUOUS_INTERVAL,
+                 roll_interval: float = PROFILER_ROLL_INTERVAL, keep: int = PROFILER_KEEP,
+                 directory: str = PROFILER_DIR, max_depth: int = 64):
+        self.interval = interval  # Период сэмплов при профилировании по запросу
+        self.continuous_interval = continuous_interval  # Период сэмплов в постоянном режиме
+        self.roll_interval = roll_interval  # Длина окна постоянного профиля
+        self.keep = keep  # Сколько файлов постоянного профиля хранить
+        self.directory = directory
+        self.max_depth = max_depth
+        self._busy = threading.Lock()  # Одновременно идёт только одно профилирование по запросу
+        self._continuous: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.on_demand_runs = 0
+        self.rolled_profiles = 0
+
+    def _sample(self, profile: Profile, focus: str = ""):
+        """Один снимок стеков всех потоков, кроме потока профилировщика"""
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+            frames.reverse()
+            # focus — учитываются только стеки, проходящие через функцию (например, handle_message)
+            if focus and not any(name.startswith(focus + " (") for name in frames):
+                continue
+            profile.add(";".join([names.get(thread_id, str(thread_id))] + frames))
+        profile.samples += 1
+
+    def _run(self, profile: Profile, seconds: float, interval: float, focus: str,
+             stopped: Optional[threading.Event] = None):
+        """Сэмплирование в течение seconds секунд (выполняется в отдельном потоке)"""
+        started_at = time.monotonic()
+        deadline = started_at + seconds
+        while time.monotonic() < deadline and not (stopped is not None and stopped.is_set()):
+            self._sample(profile, focus)
+            time.sleep(interval)
+        profile.duration = time.monotonic() - started_at
+
+    async def profile(self, seconds: float, focus: str = "") -> Profile:
+        """
+        Профилирование по запросу (цикл событий не блокируется)
+
+        Args:
+            seconds: Длительность профилирования
+            focus: Имя функции, через которую должны проходить учитываемые стеки
+
+        Returns:
+            Накопленный профиль
+
+        Raises:
+            RuntimeError: если профилирование уже идёт
+        """
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже выполняется")
+        try:
+            self.on_demand_runs += 1
+            profile = Profile()
+            await asyncio.to_thread(self._run, profile, seconds, self.interval, focus)
+            return profile
+        finally:
+            self._busy.release()
+
+    def start_continuous(self, focus: str = ""):
+        """Постоянный режим: профиль каждые roll_interval секунд записывается в directory"""
+        if self._continuous is not None and self._continuous.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopped.clear()
+        self._continuous = threading.Thread(
+            target=self._continuous_loop, args=(focus,), name="continuous-profiler", daemon=True
+        )
+        self._continuous.start()
+        logger.info(f"🔬 Постоянное профилирование: раз в {self.continuous_interval}s, окно {self.roll_interval}s")
+
+    def _continuous_loop(self, focus: str):
+        while not self._stopped.is_set():
+            profile = Profile()
+            self._run(profile, self.roll_interval, self.continuous_interval, focus, self._stopped)
+            if profile.stacks:
+                self._write(profile)
+
+    def _write(self, profile: Profile):
+        """Запись окна профиля и удаление старых файлов"""
+        name = time.strftime("profile-%Y%m%d-%H%M%S.collapsed", time.localtime(profile.started_at))
+        try:
+            atomic_write_text(os.path.join(self.directory, name), profile.collapsed() + "\n")
+            self.rolled_profiles += 1
+            for old in self.saved_profiles()[:-self.keep]:
+                os.unlink(old)
+        except OSError as e:
+            logger.error(f"❌ Ошибка записи профиля: {e}")
+
+    def saved_profiles(self) -> List[str]:
+        """Файлы постоянного профиля (от старых к новым)"""
+        return sorted(glob.glob(os.path.join(self.directory, "profile-*.collapsed")))
+
+    def stop_continuous(self):
+        """Остановка постоянного режима (текущее окно записывается)"""
+        self._stopped.set()
+        if self._continuous is not None:
+            self._continuous.join(timeout=2.0)
+            self._continuous = None
+
+    def get_stats(self) -> Dict:
+        """Статистика профилировщика"""
+        return {
+            'busy': self._busy.locked(),
+            'on_demand_runs': self.on_demand_runs,
+            'continuous': self._continuous is not None and self._continuous.is_alive(),
+            'rolled_profiles': self.rolled_profiles,
+            'saved_profiles': [os.path.basename(path) for path in self.saved_profiles()]
+        }
+
+
+# Глобальный экземпляр профилировщика
+profiler = SamplingProfiler()
@@ -0,0 +1,249 @@
+"""
+Квоты на использование Гигачата
+Учёт токенов (prompt/completion) по пользователям и беседам из блока usage
+ответов API и ограничение частоты запросов корзинами токенов (token bucket):
+запросов в минуту и токенов в сутки. Промпт списывается с квоты не больше
+чем на prompt_tokens_cap: в нём весь контекст беседы, и без потолка активная
+беседа исчерпывала бы квоту за несколько реплик.
+"""
+import logging
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+from config import (
+    USER_REQUESTS_PER_MINUTE, USER_TOKENS_PER_DAY, CHAT_REQUESTS_PER_MINUTE, CHAT_TOKENS_PER_DAY,
+    QUOTA_PROMPT_TOKENS_CAP
+)
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+class TokenBucket:
+    """Корзина токенов: ёмкость capacity, пополнение rate единиц в секунду"""
+
+    __slots__ = ("capacity", "rate", "level", "updated_at")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> float:
+        """Пополнение корзины за прошедшее время"""
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return self.level
+
+    def has(self, amount: float = 1.0) -> bool:
+        """Хватает ли в корзине amount единиц"""
+        return self.refill() >= amount
+
+    def consume(self, amount: float = 1.0):
+        """Списание (уровень может уйти в минус — долг гасится пополнением)"""
+        self.refill()
+        self.level -= amount
+
+    def is_full(self) -> bool:
+        """Корзина полная — её состояние не отличается от новой"""
+        return self.refill() >= self.capacity
+
+
+class QuotaManager:
+    """Менеджер квот по пользователям и беседам"""
+
+    # Дешёвые ответы без запроса к модели
+    OVER_QUOTA_REPLIES = {
+        "rate": [
+            "Механизмы перегреты твоими вопросами. Дай шестерням остыть минуту.",
+            "Даже Сота Сил не отвечает на всё сразу. Повтори вопрос чуть позже.",
+            "Терпение — добродетель строителя. Я отвечу, когда механизмы будут готовы."
+        ],
+        "tokens": [
+            "На сегодня ты исчерпал запас моей мудрости. Возвращайся завтра.",
+            "Заводной город не бесконечен, и моё внимание тоже. До завтра, смертный.",
+            "Свитки на сегодня закрыты. Размышляй над уже сказанным."
+        ]
+    }
+
+    def __init__(self, user_requests_per_minute: int = USER_REQUESTS_PER_MINUTE,
+                 user_tokens_per_day: int = USER_TOKENS_PER_DAY,
+                 chat_requests_per_minute: int = CHAT_REQUESTS_PER_MINUTE,
+                 chat_tokens_per_day: int = CHAT_TOKENS_PER_DAY,
+                 idle_ttl: float = 3600.0, prompt_tokens_cap: int = QUOTA_PROMPT_TOKENS_CAP):
+        self.limits = {
+            "user": (user_requests_per_minute, user_tokens_per_day),
+            "chat": (chat_requests_per_minute, chat_tokens_per_day)
+        }
+        self.idle_ttl = idle_ttl  # Через сколько секунд без запросов полные корзины удаляются
+        self.prompt_tokens_cap = prompt_tokens_cap  # Больше токенов промпта за запрос с квоты не списывается
+
+        # (scope, id) -> (корзина запросов, корзина токенов)
+        self._buckets: Dict[Tuple[str, str], Tuple[TokenBucket, TokenBucket]] = {}
+        self._last_seen: Dict[Tuple[str, str], float] = {}
+        self._last_cleanup = time.monotonic()
+
+        # Статистика за текущие сутки: (scope, id) -> счётчики; при смене суток сбрасывается
+        self.usage: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self.usage_day = self._today()
+        self.previous_day: Dict = {}  # Итоги прошлых суток
+        self.rejected: Dict[str, int] = {}  # причина -> количество
+        self.started_at = time.time()
+
+    @staticmethod
+    def _today() -> str:
+        """Текущие сутки (местное время)"""
+        return time.strftime("%Y-%m-%d")
+
+    def _totals(self) -> Dict[str, int]:
+        """Итоги по всем пользователям за текущие сутки"""
+        totals = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'charged_tokens': 0}
+        for (scope, _), counters in self.usage.items():
+            if scope == "user":
+                for name in totals:
+                    totals[name] += counters[name]
+        return totals
+
+    def _roll_day(self):
+        """Смена суток: статистика прошлых суток сворачивается в итоги, записи по пользователям удаляются"""
+        today = self._today()
+        if today == self.usage_day:
+            return
+        self.previous_day = dict(self._totals(), day=self.usage_day)
+        logger.info(f"📅 Квоты: итоги {self.usage_day} — {self.previous_day['total_tokens']} токенов, "
+                    f"записей удалено {len(self.usage)}")
+        self.usage = {}
+        self.rejected = {}
+        self.usage_day = today
+        self.started_at = time.time()
+
+    def _buckets_for(self, scope: str, key: str) -> Tuple[TokenBucket, TokenBucket]:
+        """Корзины пользователя или беседы (создаются при первом запросе)"""
+        buckets = self._buckets.get((scope, key))
+        if buckets is None:
+            per_minute, per_day = self.limits[scope]
+            buckets = self._buckets[(scope, key)] = (
+                TokenBucket(per_minute, per_minute / 60),
+                TokenBucket(per_day, per_day / DAY)
+            )
+        self._last_seen[(scope, key)] = time.monotonic()
+        return buckets
+
+    def check(self, user_id: int, chat_id: str) -> Optional[str]:
+        """
+        Проверка квот перед запросом к модели (при успехе запрос сразу учитывается)
+
+        Args:
+            user_id: ID пользователя
+            chat_id: ID беседы
+
+        Returns:
+            None если запрос разрешён, иначе причина отказа (user_rate, user_tokens, chat_rate, chat_tokens)
+        """
+        self._cleanup()
+        scopes = (("user", str(user_id)), ("chat", str(chat_id)))
+        buckets = [self._buckets_for(scope, key) for scope, key in scopes]
+
+        for (scope, _), (requests, tokens) in zip(scopes, buckets):
+            # Стоимость запроса в токенах заранее неизвестна — достаточно, чтобы не было долга
+            if not tokens.has(1):
+                return self._reject(f"{scope}_tokens", user_id)
+            if not requests.has(1):
+                return self._reject(f"{scope}_rate", user_id)
+
+        for requests, _ in buckets:
+            requests.consume(1)
+        return None
+
+    def _reject(self, reason: str, user_id: int) -> str:
+        """Учёт отказа"""
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        logger.info(f"🚦 Квота исчерпана ({reason}) для пользователя {user_id}")
+        return reason
+
+    def over_quota_reply(self, reason: str) -> str:
+        """Шаблонный ответ на запрос сверх квоты"""
+        kind = "tokens" if reason.endswith("_tokens") else "rate"
+        return random.choice(self.OVER_QUOTA_REPLIES[kind])
+
+    def record_usage(self, user_id: int, chat_id: str, usage: Dict):
+        """
+        Учёт токенов из блока usage ответа Гигачата
+
+        Args:
+            user_id: ID пользователя
+            chat_id: ID беседы
+            usage: {'prompt_tokens', 'completion_tokens', 'total_tokens', ...}
+        """
+        self._roll_day()
+        prompt_tokens = int(usage.get("prompt_tokens", 0))
+        completion_tokens = int(usage.get("completion_tokens", 0))
+        total_tokens = int(usage.get("total_tokens", prompt_tokens + completion_tokens))
+        # С квоты списывается ответ и не больше prompt_tokens_cap токенов контекста
+        charged_tokens = min(prompt_tokens, self.prompt_tokens_cap) + completion_tokens
+
+        for scope, key in (("user", str(user_id)), ("chat", str(chat_id))):
+            _, tokens = self._buckets_for(scope, key)
+            tokens.consume(charged_tokens)
+
+            counters = self.usage.setdefault((scope, key), {
+                'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'charged_tokens': 0
+            })
+            counters['requests'] += 1
+            counters['prompt_tokens'] += prompt_tokens
+            counters['completion_tokens'] += completion_tokens
+            counters['total_tokens'] += total_tokens
+            counters['charged_tokens'] += charged_tokens
+
+    def _cleanup(self):
+        """Удаление корзин давно не писавших пользователей и статистики прошлых суток (раз в минуту)"""
+        now = time.monotonic()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        self._roll_day()
+        for key, last_seen in list(self._last_seen.items()):
+            requests, tokens = self._buckets[key]
+            if now - last_seen > self.idle_ttl and requests.is_full() and tokens.is_full():
+                del self._buckets[key]
+                del self._last_seen[key]
+
+    def get_report(self, top: int = 10) -> Dict:
+        """
+        Сводный отчёт о расходе токенов
+
+        Args:
+            top: Сколько самых активных пользователей и бесед показать
+
+        Returns:
+            Итоги за текущие и прошлые сутки, топ пользователей и бесед по токенам, отказы по причинам
+        """
+        self._roll_day()
+
+        def top_of(scope: str):
+            entries = [(key, counters) for (s, key), counters in self.usage.items() if s == scope]
+            entries.sort(key=lambda item: item[1]['total_tokens'], reverse=True)
+            return [dict(counters, id=key) for key, counters in entries[:top]]
+
+        return {
+            'since': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            'limits': {
+                scope: {'requests_per_minute': per_minute, 'tokens_per_day': per_day}
+                for scope, (per_minute, per_day) in self.limits.items()
+            },
+            'prompt_tokens_cap': self.prompt_tokens_cap,
+            'totals': self._totals(),
+            'previous_day': self.previous_day,
+            'top_users': top_of("user"),
+            'top_chats': top_of("chat"),
+            'rejected': dict(self.rejected),
+            'tracked_buckets': len(self._buckets)
+        }
+
+
+# Глобальный экземпляр менеджера
+quota_manager = QuotaManager()
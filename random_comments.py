@@ -2,19 +2,21 @@
 Система редких комментариев от бота
 Комментирует сообщения пользователей без прямого обращения к боту
 """
-import json
-import os
-import time
 import re
 from typing import Optional, Dict, List
 
+from comment_pool import CommentPool
+from cooldown_table import CooldownTable, GLOBAL_PEER
+
 
 class RandomCommentsManager:
     """Менеджер случайных комментариев бота"""
     
-    def __init__(self, storage_file: str = "random_comments_state.json"):
+    def __init__(self, storage_file: str = "random_comments_state.json",
+                 pool_file: Optional[str] = "comment_pool.json"):
         self.storage_file = storage_file
-        self.last_comment_time = self._load_last_comment_time()
+        self.comment_cooldown = 3600  # 60 минут между обычными комментариями (в каждой беседе)
+        self.cooldowns = CooldownTable("Случайные комментарии", self.comment_cooldown, storage_file)
         
         # Ключевые слова для анализа сообщений
         self.comment_triggers = {
@@ -141,54 +143,44 @@ class RandomCommentsManager:
             ]
         }
 
-    def _load_last_comment_time(self) -> float:
-        """Загрузка времени последнего комментария"""
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get('last_comment_time', 0)
-            except (json.JSONDecodeError, IOError):
-                pass
-        return 0
+        # Сгенерированные в фоне реплики (шаблоны выше — запасной вариант и примеры стиля)
+        self.pool = CommentPool(self.comment_templates, pool_file)
+        self.pool.set_templates(self.comment_templates)
 
-    def _save_last_comment_time(self, timestamp: float):
-        """Сохранение времени последнего комментария"""
-        try:
-            data = {'last_comment_time': timestamp}
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"Ошибка сохранения времени комментария: {e}")
+    def _pick_comment(self, category: str) -> str:
+        """Свежая реплика из пула или, если пул пуст, один из шаблонов"""
+        comment = self.pool.draw(category)
+        if comment is None:
+            import random
+            comment = random.choice(self.comment_templates[category])
+        return comment
 
-    def should_comment(self, message_text: str) -> bool:
+    def should_comment(self, message_text: str, peer_id: int = GLOBAL_PEER) -> bool:
         """
         Определяет, стоит ли оставить комментарий к сообщению
         
         Args:
             message_text: Текст сообщения пользователя
+            peer_id: ID беседы (кулдаун у каждой беседы свой)
             
         Returns:
             True если стоит прокомментировать
         """
-        current_time = time.time()
         message_lower = message_text.lower()
         
         # Проверяем специальные триггеры (они имеют приоритет)
         if self._has_specific_trigger(message_lower):
             return True
         
-        # Проверяем, прошло ли достаточно времени для обычных комментариев (60 минут)
-        if current_time - self.last_comment_time < 3600:  # 3600 секунд = 60 минут
-            return False
-        
         # Проверяем, есть ли ключевые слова для обычного комментария
         for category, keywords in self.comment_triggers.items():
             if category in ['vk', 'greetings', 'ancient_scrolls']:
                 continue  # Пропускаем специальные категории, они обрабатываются отдельно
             for keyword in keywords:
                 if keyword in message_lower:
-                    return True
+                    # Проверяем, прошло ли достаточно времени для обычных комментариев (60 минут);
+                    # комментарий, отклонённый кулдауном, попадает в статистику беседы
+                    return self.cooldowns.check(peer_id)
         
         return False
 
@@ -226,12 +218,13 @@ class RandomCommentsManager:
         
         return False
 
-    def generate_comment(self, message_text: str) -> Optional[str]:
+    def generate_comment(self, message_text: str, peer_id: int = GLOBAL_PEER) -> Optional[str]:
         """
         Генерирует комментарий к сообщению
         
         Args:
             message_text: Текст сообщения пользователя
+            peer_id: ID беседы
             
         Returns:
             Сгенерированный комментарий или None
@@ -242,13 +235,11 @@ class RandomCommentsManager:
         # Проверяем специальные триггеры (имеют приоритет)
         specific_category = self._get_specific_category(message_lower)
         if specific_category:
-            templates = self.comment_templates[specific_category]
-            comment = random.choice(templates)
+            comment = self._pick_comment(specific_category)
             
             # Для специальных триггеров не обновляем время (они могут отвечать чаще)
             if specific_category not in ['vk', 'greetings', 'ancient_scrolls']:
-                self.last_comment_time = time.time()
-                self._save_last_comment_time(self.last_comment_time)
+                self.cooldowns.mark(peer_id)
             
             return comment
         
@@ -270,15 +261,37 @@ class RandomCommentsManager:
         category = random.choice(suitable_categories)
         
         # Выбираем случайный шаблон из категории
-        templates = self.comment_templates[category]
-        comment = random.choice(templates)
+        comment = self._pick_comment(category)
         
-        # Обновляем время последнего комментария
-        self.last_comment_time = time.time()
-        self._save_last_comment_time(self.last_comment_time)
+        # Обновляем время последнего комментария в беседе
+        self.cooldowns.mark(peer_id)
         
         return comment
 
+    def get_persona_template(self, message_text: str) -> str:
+        """
+        Шаблонная реплика в стиле Сота Сил для ответа без Гигачата
+        (не влияет на кулдаун случайных комментариев)
+
+        Args:
+            message_text: Текст сообщения пользователя
+
+        Returns:
+            Реплика из подходящей по теме категории
+        """
+        import random
+        message_lower = message_text.lower()
+
+        # Категории 'vk' и 'ancient_scrolls' для ответа на вопрос не подходят
+        suitable_categories = [
+            category for category, keywords in self.comment_triggers.items()
+            if category not in ['vk', 'ancient_scrolls'] and any(keyword in message_lower for keyword in keywords)
+        ]
+        if not suitable_categories:
+            suitable_categories = ['knowledge', 'philosophy', 'work']
+
+        return random.choice(self.comment_templates[random.choice(suitable_categories)])
+
     def _get_specific_category(self, message_lower: str) -> Optional[str]:
         """
         Определяет категорию для специальных триггеров
@@ -313,15 +326,10 @@ class RandomCommentsManager:
         return None
 
     def get_stats(self) -> Dict:
-        """Получение статистики комментариев"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_comment_time
-        
+        """Получение статистики комментариев (кулдауны по беседам и пул реплик)"""
         return {
-            'last_comment_time': self.last_comment_time,
-            'time_since_last_comment': int(time_since_last),
-            'can_comment': time_since_last >= 3600,
-            'next_comment_in': max(0, 3600 - int(time_since_last))
+            **self.cooldowns.get_stats(),
+            'comment_pool': self.pool.get_stats()
         }
 
 
@@ -4,7 +4,10 @@
 import aiohttp
 import logging
 from typing import Dict, List, Optional
-from config import SERPER_API_KEY
+from config import SERPER_API_KEY, SERPER_TIMEOUT
+from deadline import DeadlineExceeded, client_timeout
+from metrics import UPSTREAM_ERRORS
+from tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,32 @@ class SerperClient:
     def __init__(self):
         self.api_url = "https://google.serper.dev/search"
         self.api_key = SERPER_API_KEY
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия (соединения переиспользуются между запросами)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SERPER_TIMEOUT))
+        return self._session
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def ping(self) -> bool:
+        """
+        Проверка доступности Serper (для фоновой проверки здоровья)
+        GET к адресу поиска не выполняет поиск и не расходует кредиты —
+        проверяется только, что сервер отвечает
+
+        Returns:
+            True если ключ настроен и сервер ответил без ошибки 5xx
+        """
+        if not self.api_key or self.api_key == "your_serper_api_key":
+            return False
+        async with self._get_session().get(self.api_url, headers={'X-API-KEY': self.api_key}) as response:
+            return response.status < 500
 
     async def search(self, query: str, num_results: int = 3) -> Optional[Dict]:
         """
@@ -41,24 +70,31 @@ class SerperClient:
             'num': num_results
         }
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
+        with span("serper.search", "client") as http_span:
+            try:
+                async with self._get_session().post(
                     self.api_url,
                     headers=headers,
-                    json=payload
+                    json=payload,
+                    timeout=client_timeout(SERPER_TIMEOUT)
                 ) as response:
+                    http_span.set_attribute("http.status_code", response.status)
                     if response.status == 200:
                         data = await response.json()
                         logger.info(f"✅ Поиск выполнен: {query}")
                         return data
                     else:
                         error_text = await response.text()
+                        UPSTREAM_ERRORS.labels("serper", str(response.status)).inc()
                         logger.error(f"❌ Ошибка Serper API: {response.status}, {error_text}")
                         return None
-        except Exception as e:
-            logger.error(f"❌ Ошибка при выполнении поиска: {e}")
-            return None
+            except DeadlineExceeded:
+                logger.warning(f"⌛ Поиск пропущен: бюджет времени события исчерпан")
+                return None
+            except Exception as e:
+                UPSTREAM_ERRORS.labels("serper", type(e).__name__).inc()
+                logger.error(f"❌ Ошибка при выполнении поиска: {e}")
+                return None
 
     def format_results(self, search_data: Dict) -> str:
         """
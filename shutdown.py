@@ -0,0 +1,195 @@
+"""
+Плавная остановка
+При остановке (SIGTERM при передеплое или docker stop) бот перестаёт
+принимать колбэки, ждёт обрабатываемые события в пределах дедлайна,
+записывает буферизованные хранилища и закрывает пулы соединений. Всё, что
+не успело завершиться, попадает в журнал: какие события прерваны и какие
+хранилища не записаны.
+
+Ожидание событий выполняет DrainingServer до того, как uvicorn закроет
+порт: lifespan-остановка uvicorn запускается уже после закрытия сокетов и
+отмены оставшихся запросов, и колбэку там некому ответить 503.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import uvicorn
+
+from config import SHUTDOWN_DRAIN_TIMEOUT, SHUTDOWN_STEP_TIMEOUT
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+DROPPED_EVENTS = Counter("shutdown_dropped_events_total", "События, прерванные при остановке")
+
+
+class ShutdownManager:
+    """Учёт обрабатываемых событий и последовательность остановки"""
+
+    def __init__(self, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT, step_timeout: float = SHUTDOWN_STEP_TIMEOUT):
+        self.drain_timeout = drain_timeout  # Ожидание обрабатываемых событий
+        self.step_timeout = step_timeout  # Ожидание одной записи хранилища или закрытия сессии
+        self.accepting = True
+        self.in_flight: Dict[asyncio.Task, Dict] = {}  # Задача колбэка -> описание события
+        self.flushes: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self.closes: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self.dropped: List[Dict] = []
+        self.rejected = 0
+        self.report: Optional[Dict] = None
+
+    def register_flush(self, name: str, flush: Callable[[], Awaitable]):
+        """Хранилище, несохранённые изменения которого записываются при остановке"""
+        self.flushes.append((name, flush))
+
+    def register_close(self, name: str, close: Callable[[], Awaitable]):
+        """Пул соединений, закрываемый после записи хранилищ"""
+        self.closes.append((name, close))
+
+    def reject(self) -> bool:
+        """
+        Проверка перед приёмом колбэка
+
+        Returns:
+            True если бот останавливается и колбэк нужно отклонить (VK доставит его повторно)
+        """
+        if self.accepting:
+            return False
+        self.rejected += 1
+        return True
+
+    @asynccontextmanager
+    async def track(self, event_id: str, peer_id: int = 0, on_drop: Optional[Callable[[], None]] = None):
+        """
+        Учёт обрабатываемого события
+
+        Args:
+            event_id: ID события VK
+            peer_id: ID беседы
+            on_drop: Действие, если обработка прервана (например, забыть ID сообщения в дедупликаторе)
+        """
+        task = asyncio.current_task()
+        info = {'event_id': event_id, 'peer_id': peer_id, 'started_at': time.monotonic()}
+        self.in_flight[task] = info
+        try:
+            yield
+        except asyncio.CancelledError:
+            elapsed = time.monotonic() - info['started_at']
+            self.dropped.append({'event_id': event_id, 'peer_id': peer_id, 'elapsed_seconds': round(elapsed, 2)})
+            DROPPED_EVENTS.inc()
+            logger.warning(f"🗑️ Событие {event_id} (беседа {peer_id}) прервано через {elapsed:.1f}s")
+            if on_drop is not None:
+                on_drop()
+            raise
+        finally:
+            self.in_flight.pop(task, None)
+
+    def stop_accepting(self):
+        """Новые колбэки отклоняются"""
+        if self.accepting:
+            self.accepting = False
+            logger.info(f"🛑 Остановка: новые события не принимаются, в обработке {len(self.in_flight)}")
+
+    async def drain(self) -> int:
+        """
+        Ожидание обрабатываемых событий; по истечении дедлайна они отменяются
+
+        Returns:
+            Сколько событий завершилось в пределах дедлайна
+        """
+        self.stop_accepting()
+        tasks = set(self.in_flight)
+        if not tasks:
+            return 0
+        done, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=self.step_timeout)
+            logger.warning(f"⌛ Остановка: {len(pending)} событий не завершились за {self.drain_timeout:g}s")
+        return len(done)
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable]) -> Optional[str]:
+        """Шаг остановки с таймаутом (None — успешно, иначе описание ошибки)"""
+        try:
+            await asyncio.wait_for(step(), self.step_timeout)
+            return None
+        except asyncio.TimeoutError:
+            error = f"таймаут {self.step_timeout:g}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        logger.error(f"❌ Остановка: {name} — {error}")
+        return error
+
+    async def finish(self) -> Dict:
+        """
+        Запись хранилищ и закрытие сессий (после drain и остановки фоновых задач)
+
+        Returns:
+            Отчёт об остановке
+        """
+        started_at = time.monotonic()
+        failed = {}
+        for name, flush in self.flushes:
+            error = await self._run_step(name, flush)
+            if error:
+                failed[name] = error
+        for name, close in self.closes:
+            error = await self._run_step(name, close)
+            if error:
+                failed[name] = error
+
+        self.report = {
+            'dropped_events': list(self.dropped),
+            'rejected_callbacks': self.rejected,
+            'flushed': [name for name, _ in self.flushes if name not in failed],
+            'closed': [name for name, _ in self.closes if name not in failed],
+            'failed': failed,
+            'finish_seconds': round(time.monotonic() - started_at, 2)
+        }
+        if self.dropped or failed:
+            logger.warning(
+                f"⚠️ Остановка с потерями: прервано событий {len(self.dropped)} "
+                f"({', '.join(event['event_id'] for event in self.dropped)}), не выполнено: {failed}"
+            )
+        else:
+            logger.info(f"✅ Остановка без потерь: записано {len(self.report['flushed'])} хранилищ, "
+                        f"отклонено колбэков {self.rejected}")
+        return self.report
+
+    def get_stats(self) -> Dict:
+        """Состояние остановки"""
+        return {
+            'accepting': self.accepting,
+            'in_flight': [
+                {
+                    'event_id': info['event_id'],
+                    'peer_id': info['peer_id'],
+                    'elapsed_seconds': round(time.monotonic() - info['started_at'], 2)
+                }
+                for info in self.in_flight.values()
+            ],
+            'drain_timeout_seconds': self.drain_timeout,
+            'dropped_events': list(self.dropped),
+            'rejected_callbacks': self.rejected,
+            'last_report': self.report
+        }
+
+
+class DrainingServer(uvicorn.Server):
+    """Сервер uvicorn, который перед закрытием порта отклоняет новые колбэки и ждёт обрабатываемые события"""
+
+    def __init__(self, config: uvicorn.Config, manager: Optional[ShutdownManager] = None):
+        super().__init__(config)
+        self.manager = manager or shutdown_manager
+
+    async def shutdown(self, sockets=None):
+        # Порт ещё открыт: повторные доставки VK получают 503 и уходят следующему экземпляру
+        await self.manager.drain()
+        await super().shutdown(sockets)
+
+
+# Глобальный экземпляр менеджера остановки
+shutdown_manager = ShutdownManager()
@@ -0,0 +1,268 @@
+"""
+Снимок состояния для тёплого перезапуска
+Состояние подсистем в памяти (контексты бесед Гигачата, окно дедупликации,
+кулдауны, кэш ответов) записывается в один двоичный файл по таймеру и при
+остановке, а при запуске восстанавливается одним чтением.
+
+Формат файла:
+    заголовок  <4sHHd: магия SOTA, версия формата, число секций, время записи (unix)
+    секция     <HHII: длина имени, версия секции, crc32 данных, длина данных;
+               затем имя (UTF-8) и данные — JSON, сжатый zlib
+Повреждённая (crc32), устаревшая или несовместимая по версии секция
+пропускается, остальные восстанавливаются.
+"""
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import SNAPSHOT_FILE, SNAPSHOT_INTERVAL, SNAPSHOT_MAX_AGE
+from storage import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SOTA"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHd")  # магия, версия формата, число секций, время записи
+SECTION = struct.Struct("<HHII")  # длина имени, версия секции, crc32, длина данных
+
+
+class SnapshotError(Exception):
+    """Файл снимка не распознан (чужой формат или обрезан заголовок)"""
+
+
+def encode_sections(sections: List[Tuple[str, int, bytes]], created_at: float) -> bytes:
+    """
+    Сборка файла снимка
+
+    Args:
+        sections: [(имя, версия секции, JSON в байтах)]
+        created_at: Время снимка (unix)
+
+    Returns:
+        Содержимое файла
+    """
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), created_at)]
+    for name, version, data in sections:
+        payload = zlib.compress(data, 6)
+        encoded_name = name.encode('utf-8')
+        parts.append(SECTION.pack(len(encoded_name), version, zlib.crc32(payload), len(payload)))
+        parts.append(encoded_name)
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def decode_sections(blob: bytes) -> Tuple[float, Dict[str, Tuple[int, Optional[bytes]]]]:
+    """
+    Разбор файла снимка
+
+    Returns:
+        (время снимка, имя -> (версия секции, JSON в байтах или None, если crc32 не совпал))
+
+    Raises:
+        SnapshotError: если заголовок не распознан
+    """
+    if len(blob) < HEADER.size:
+        raise SnapshotError("файл короче заголовка")
+    magic, version, count, created_at = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise SnapshotError(f"неизвестный формат {magic!r} v{version}")
+
+    sections: Dict[str, Tuple[int, Optional[bytes]]] = {}
+    offset = HEADER.size
+    for _ in range(count):
+        if offset + SECTION.size > len(blob):
+            break  # Файл обрезан — восстанавливаем то, что успели прочитать
+        name_length, section_version, crc, length = SECTION.unpack_from(blob, offset)
+        offset += SECTION.size
+        name = blob[offset:offset + name_length].decode('utf-8', errors='replace')
+        offset += name_length
+        payload = blob[offset:offset + length]
+        offset += length
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            sections[name] = (section_version, None)
+            continue
+        sections[name] = (section_version, zlib.decompress(payload))
+    return created_at, sections
+
+
+class _Section:
+    """Подсистема в снимке"""
+
+    def __init__(self, name: str, export: Callable[[], Any], restore: Callable[[Any], None],
+                 version: int, max_age: float):
+        self.name = name
+        self.export = export  # Состояние для JSON
+        self.restore = restore  # Применение состояния из снимка
+        self.version = version  # Меняется при несовместимом изменении формата секции
+        self.max_age = max_age  # Снимок старше не восстанавливается
+
+
+class SnapshotManager:
+    """Запись снимка по таймеру и восстановление при запуске"""
+
+    def __init__(self, path: str = SNAPSHOT_FILE, interval: float = SNAPSHOT_INTERVAL,
+                 max_age: float = SNAPSHOT_MAX_AGE):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age  # Возраст снимка по умолчанию, после которого секция устарела
+        self.sections: Dict[str, _Section] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.saves = 0
+        self.failures = 0
+        self.last_save: Dict = {}
+        self.last_restore: Dict = {}
+
+    def register(self, name: str, export: Callable[[], Any], restore: Callable[[Any], None],
+                 version: int = 1, max_age: Optional[float] = None):
+        """
+        Регистрация подсистемы
+
+        Args:
+            name: Имя секции
+            export: Функция, возвращающая состояние (сериализуемое в JSON)
+            restore: Функция, применяющая состояние из снимка
+            version: Версия формата секции
+            max_age: Возраст снимка, после которого секция не восстанавливается
+        """
+        self.sections[name] = _Section(name, export, restore, version, max_age or self.max_age)
+
+    def _export(self) -> List[Tuple[str, int, bytes]]:
+        """Состояние всех секций (в цикле событий — снимок согласован)"""
+        exported = []
+        for section in self.sections.values():
+            try:
+                data = json.dumps(section.export(), ensure_ascii=False, separators=(",", ":"))
+            except Exception as e:
+                logger.error(f"❌ Снимок: секция {section.name} не сериализована: {e}")
+                continue
+            exported.append((section.name, section.version, data.encode('utf-8')))
+        return exported
+
+    def _write(self, sections: List[Tuple[str, int, bytes]], created_at: float) -> int:
+        """Сжатие и запись файла (в отдельном потоке)"""
+        blob = encode_sections(sections, created_at)
+        atomic_write_bytes(self.path, blob)
+        return len(blob)
+
+    async def save(self):
+        """Запись снимка: сериализация в цикле событий, сжатие и запись на диск в отдельном потоке"""
+        started_at = time.monotonic()
+        sections = self._export()
+        try:
+            size = await asyncio.to_thread(self._write, sections, time.time())
+        except OSError as e:
+            self.failures += 1
+            logger.error(f"❌ Ошибка записи снимка состояния: {e}")
+            return
+        self.saves += 1
+        self.last_save = {
+            'at': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'bytes': size,
+            'raw_bytes': {name: len(data) for name, _, data in sections},
+            'duration_ms': round((time.monotonic() - started_at) * 1000, 1)
+        }
+
+    def _read(self) -> Optional[bytes]:
+        """Чтение файла снимка одним вызовом"""
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def restore(self) -> Dict:
+        """
+        Восстановление при запуске
+
+        Returns:
+            {'restored': [...], 'skipped': {секция: причина}, 'age_seconds'}
+        """
+        started_at = time.monotonic()
+        report = {'restored': [], 'skipped': {}, 'age_seconds': None}
+        try:
+            blob = await asyncio.to_thread(self._read)
+            if blob is None:
+                self.last_restore = report
+                return report
+            created_at, stored = decode_sections(blob)
+        except (OSError, SnapshotError, zlib.error) as e:
+            logger.error(f"❌ Снимок состояния не прочитан: {e}")
+            report['skipped']['*'] = str(e)
+            self.last_restore = report
+            return report
+
+        age = time.time() - created_at
+        report['age_seconds'] = round(age, 1)
+        for name, section in self.sections.items():
+            if name not in stored:
+                continue
+            version, data = stored[name]
+            if data is None:
+                report['skipped'][name] = "crc32 не совпал"
+            elif version != section.version:
+                report['skipped'][name] = f"версия {version}, ожидается {section.version}"
+            elif age > section.max_age:
+                report['skipped'][name] = f"устарела ({age:.0f}s)"
+            else:
+                try:
+                    section.restore(json.loads(data))
+                    report['restored'].append(name)
+                except Exception as e:
+                    report['skipped'][name] = f"{type(e).__name__}: {e}"
+
+        report['duration_ms'] = round((time.monotonic() - started_at) * 1000, 1)
+        if report['skipped']:
+            logger.warning(f"⚠️ Снимок состояния: пропущены секции {report['skipped']}")
+        logger.info(f"♻️ Восстановлено из снимка ({age:.0f}s назад): {', '.join(report['restored']) or 'ничего'}")
+        self.last_restore = report
+        return report
+
+    async def run(self):
+        """Периодическая запись снимка"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"❌ Ошибка снимка состояния: {e}")
+
+    def start(self):
+        """Запуск периодической записи"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Остановка периодической записи (итоговый снимок пишется отдельно — save)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        """Статистика снимков"""
+        return {
+            'path': self.path,
+            'exists': os.path.exists(self.path),
+            'interval_seconds': self.interval,
+            'sections': {name: {'version': s.version, 'max_age_seconds': s.max_age}
+                         for name, s in self.sections.items()},
+            'saves': self.saves,
+            'failures': self.failures,
+            'last_save': self.last_save,
+            'last_restore': self.last_restore
+        }
+
+
+# Глобальный экземпляр снимков состояния
+snapshot_manager = SnapshotManager()
@@ -0,0 +1,153 @@
+"""
+Файловые хранилища бота "Сота Сил"
+Атомарная запись (временный файл + os.replace) и отложенное пакетное
+сохранение: изменения помечают хранилище грязным, а запись на диск
+выполняется одна на пачку изменений и вне цикла событий
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, Optional
+
+from metrics import Histogram, FAST_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+STORE_WRITE_SECONDS = Histogram("store_write_seconds", "Время записи файловых хранилищ", FAST_BUCKETS, ["store"])
+
+
+def atomic_write_text(path: str, text: str):
+    """
+    Атомарная запись файла: при сбое на диске остаётся либо старая, либо новая версия
+
+    Args:
+        path: Путь к файлу
+        text: Содержимое
+    """
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Атомарная запись двоичного файла (временный файл + fsync + os.replace)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, data: Any):
+    """Атомарная запись JSON (в том же формате, что и остальные файлы состояния)"""
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+class BatchedWriter:
+    """
+    Отложенная запись хранилища.
+    mark_dirty() планирует запись через delay секунд; все изменения за это время
+    попадают в одну запись. Сериализация выполняется в цикле событий (снимок
+    согласован), а запись и fsync — в отдельном потоке. Записи идут строго по
+    очереди: снимок, сделанный позже, не может быть перезаписан более старым.
+    """
+
+    def __init__(self, path: str, serialize: Callable[[], str], delay: float = 2.0, name: str = ""):
+        self.path = path
+        self.serialize = serialize  # Снимок хранилища в виде текста
+        self.delay = delay
+        self.name = name or os.path.basename(path)
+        self.dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()  # Одна запись за раз (отложенная и при остановке)
+
+        # Статистика
+        self.writes = 0
+        self.changes = 0
+        self.failures = 0
+        self.last_write_seconds = 0.0
+
+    def mark_dirty(self):
+        """Отметка об изменении; запись будет выполнена позже одной пачкой"""
+        self.dirty = True
+        self.changes += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий (скрипты, тесты) откладывать некуда — пишем сразу
+            self.flush()
+            return
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        """Запись после паузы, накопившей изменения; изменения, пришедшие во время записи, пишутся следующей пачкой"""
+        await asyncio.sleep(self.delay)
+        while self.dirty:
+            if not await self.flush_async():
+                return  # Ошибка записи — следующая попытка при следующем изменении
+            if self.dirty:
+                await asyncio.sleep(self.delay)
+
+    async def flush_async(self) -> bool:
+        """
+        Запись на диск в отдельном потоке (если есть несохранённые изменения)
+
+        Returns:
+            False если запись не удалась
+        """
+        async with self._lock:
+            # Снимок делается под блокировкой — после завершения предыдущей записи
+            if not self.dirty:
+                return True
+            self.dirty = False
+            text = self.serialize()
+            started_at = time.monotonic()
+            try:
+                await asyncio.to_thread(atomic_write_text, self.path, text)
+            except OSError as e:
+                self.dirty = True
+                self.failures += 1
+                logger.error(f"❌ Ошибка сохранения {self.name}: {e}")
+                return False
+            self._record_write(started_at)
+            return True
+
+    def _record_write(self, started_at: float):
+        """Учёт успешной записи"""
+        self.writes += 1
+        self.last_write_seconds = time.monotonic() - started_at
+        STORE_WRITE_SECONDS.labels(self.name).observe(self.last_write_seconds)
+
+    def flush(self):
+        """Синхронная запись (при остановке или вне цикла событий)"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        started_at = time.monotonic()
+        try:
+            atomic_write_text(self.path, self.serialize())
+        except OSError as e:
+            self.dirty = True
+            self.failures += 1
+            logger.error(f"❌ Ошибка сохранения {self.name}: {e}")
+            return
+        self._record_write(started_at)
+
+    def get_stats(self) -> Dict:
+        """Статистика записи"""
+        return {
+            'dirty': self.dirty,
+            'changes': self.changes,
+            'writes': self.writes,
+            'failures': self.failures,
+            'last_write_ms': round(self.last_write_seconds * 1000, 1)
+        }
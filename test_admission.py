@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Тест контроля нагрузки: очередь по приоритетам, выключатель и задержка повторов
+"""
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from admission import CircuitBreaker, HedgingPolicy, Priority, PriorityLimiter, backoff_delay
+from credential_pool import CredentialPool
+from deadline import DeadlineExceeded
+from gigachat_client import EXCEPTION_REPLY, GigaChatClient
+
+
+def test_priority_order():
+    """Тест: освободившийся слот получает самый важный запрос, при равном приоритете — первый"""
+    print("🧪 ТЕСТ: Очередь по приоритетам")
+    print("=" * 50)
+
+    order = []
+
+    async def request(limiter, name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        await limiter.acquire()  # Слот занят — все остальные встают в очередь
+        tasks = [
+            asyncio.ensure_future(request(limiter, "фон", Priority.BACKGROUND)),
+            asyncio.ensure_future(request(limiter, "поиск", Priority.SEARCH)),
+            asyncio.ensure_future(request(limiter, "упоминание 1", Priority.MENTION)),
+            asyncio.ensure_future(request(limiter, "упоминание 2", Priority.MENTION)),
+        ]
+        await asyncio.sleep(0)
+        assert limiter.queue_depth() == {"MENTION": 2, "SEARCH": 1, "BACKGROUND": 1}
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert limiter.in_flight == 0 and limiter.queue_depth_total() == 0
+
+    asyncio.run(scenario())
+    print(f"Порядок: {order}")
+    assert order == ["упоминание 1", "упоминание 2", "поиск", "фон"]
+    print("✅ Слоты выдаются по приоритету")
+    print()
+
+
+def test_cancel_while_queued():
+    """Тест отмены ожидающего запроса: слот не теряется и не утекает"""
+    print("🧪 ТЕСТ: Отмена в очереди")
+    print("=" * 50)
+
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        await limiter.acquire()
+
+        # Отмена до выдачи слота: запрос просто уходит из очереди
+        cancelled = asyncio.ensure_future(limiter.acquire(Priority.MENTION))
+        waiting = asyncio.ensure_future(limiter.acquire(Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert limiter.queue_depth_total() == 1
+        limiter.release()
+        await waiting
+        assert limiter.in_flight == 1
+
+        # Отмена в момент выдачи слота: слот возвращается следующему
+        handed = asyncio.ensure_future(limiter.acquire())
+        following = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()  # Слот передан handed, но задача ещё не проснулась
+        handed.cancel()
+        await asyncio.sleep(0)
+        await following
+        assert limiter.in_flight == 1 and limiter.queue_depth_total() == 0
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+    print("✅ Отменённые запросы не занимают слоты")
+    print()
+
+
+def test_breaker_transitions():
+    """Тест переходов выключателя: closed -> open -> half_open -> closed/open"""
+    print("🧪 ТЕСТ: Выключатель")
+    print("=" * 50)
+
+    breaker = CircuitBreaker("тест", failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request() and breaker.rejected == 1
+
+    # Пауза истекла: проходит ровно один пробный запрос
+    breaker.opened_at -= 30
+    assert breaker.allow_request() == CircuitBreaker.HALF_OPEN and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+    # Пробный запрос отменён — следующий снова может стать пробным
+    breaker.abandon()
+    assert breaker.allow_request()
+
+    # Неудачная проба сразу размыкает выключатель
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.times_opened == 2
+
+    breaker.opened_at -= 30
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.consecutive_failures == 0
+    assert breaker.allow_request() and breaker.allow_request()
+    print(f"Статистика: {breaker.get_stats()}")
+    print("✅ Выключатель проходит все состояния")
+    print()
+
+
+def test_half_open_probe_deadline():
+    """Тест: пробный запрос, упёршийся в дедлайн события, не оставляет выключатель в half_open"""
+    print("🧪 ТЕСТ: Дедлайн пробного запроса")
+    print("=" * 50)
+
+    client = GigaChatClient()
+    client.breaker = CircuitBreaker("тест", failure_threshold=1, recovery_timeout=30)
+    client.breaker.record_failure()
+    client.breaker.opened_at -= 30
+
+    async def access_token(credential):
+        return True
+
+    async def post_hedged(messages, profile, credential):
+        raise DeadlineExceeded()
+
+    client._get_access_token = access_token
+    client._post_hedged = post_hedged
+
+    reply = asyncio.run(client._complete([{"role": "user", "content": "Привет"}]))
+    assert reply == EXCEPTION_REPLY
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN and not client.breaker.probe_in_flight
+    assert client.breaker.allow_request()  # Следующий запрос снова может стать пробным
+    assert all(credential.in_flight == 0 for credential in client.pool.credentials)
+    print("✅ Пробный запрос возвращён выключателю")
+    print()
+
+
+def test_cancelled_request_keeps_probe():
+    """Тест: отмена обычного запроса, пропущенного до размыкания, не разрешает вторую пробу"""
+    print("🧪 ТЕСТ: Отмена запроса во время пробы")
+    print("=" * 50)
+
+    client = GigaChatClient()
+    client.breaker = CircuitBreaker("тест", failure_threshold=1, recovery_timeout=30)
+
+    async def access_token(credential):
+        return True
+
+    async def post_hedged(messages, profile, credential):
+        await asyncio.sleep(5)  # Запрос завис
+
+    client._get_access_token = access_token
+    client._post_hedged = post_hedged
+
+    async def scenario():
+        request = asyncio.ensure_future(client._complete([{"role": "user", "content": "Привет"}]))
+        await asyncio.sleep(0.01)  # Запрос пропущен в состоянии closed
+        client.breaker.record_failure()
+        client.breaker.opened_at -= 30
+        assert client.breaker.allow_request() == CircuitBreaker.HALF_OPEN  # Пробу занял другой запрос
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN and client.breaker.probe_in_flight
+    assert client.breaker.allow_request() is None
+    assert all(credential.in_flight == 0 for credential in client.pool.credentials)
+    print("✅ Проба остаётся за пробным запросом")
+    print()
+
+
+def test_hedging_per_profile():
+    """Тест: задержка дубля считается по окну своего профиля, дубль идёт через свой ключ"""
+    print("🧪 ТЕСТ: Хеджирование по профилям")
+    print("=" * 50)
+
+    policy = HedgingPolicy(enabled=True, budget=1.0, min_samples=3, min_delay=0.01)
+    for latency in (0.1, 0.2, 0.3):
+        policy.record_latency("small_talk", latency)
+        policy.record_latency("long", latency * 100)
+    assert policy.hedge_delay("small_talk") == 0.3
+    assert policy.hedge_delay("long") == 30.0
+    assert policy.hedge_delay("search") is None  # Замеров профиля нет
+    assert set(policy.get_stats()['latency_by_profile']) == {"small_talk", "long"}
+
+    client = GigaChatClient()
+    client.pool = CredentialPool(["a", "b"], budget_per_key=2)
+    client.hedging = HedgingPolicy(enabled=True, budget=1.0, min_samples=1, min_delay=0.01)
+    client.hedging.record_latency("chat", 0.01)
+    used = []
+
+    async def access_token(credential):
+        return True
+
+    async def post_completion(messages, profile, credential, model=None):
+        used.append((credential.name, credential.in_flight))
+        if len(used) == 1:
+            await asyncio.sleep(1)  # Основной запрос завис
+        return 200, {"choices": [{"message": {"content": credential.name}}]}, None
+
+    client._get_access_token = access_token
+    client._post_completion = post_completion
+
+    reply = asyncio.run(client._complete([{"role": "user", "content": "Привет"}]))
+    print(f"Ключи запросов: {used}")
+    assert client.hedging.won == 1
+    assert len({name for name, _ in used}) == 2 and reply == used[1][0]  # Дубль занял второй ключ
+    assert all(load == 1 for _, load in used)
+    assert all(credential.in_flight == 0 for credential in client.pool.credentials)
+    print("✅ Окна задержек раздельные, дубль учитывается в пуле ключей")
+    print()
+
+
+def test_backoff_delay():
+    """Тест задержки повторов: полный джиттер с потолком и Retry-After"""
+    print("🧪 ТЕСТ: Задержка повторов")
+    print("=" * 50)
+
+    for attempt in range(8):
+        for _ in range(50):
+            assert 0 <= backoff_delay(attempt, base=0.5, cap=8.0) <= min(8.0, 0.5 * 2 ** attempt)
+    assert backoff_delay(0, retry_after=3) == 3
+    assert backoff_delay(0, cap=8.0, retry_after=60) == 8.0
+    print("✅ Задержка в пределах экспоненты и потолка")
+    print()
+
+
+if __name__ == "__main__":
+    test_priority_order()
+    test_cancel_while_queued()
+    test_breaker_transitions()
+    test_half_open_probe_deadline()
+    test_cancelled_request_keeps_probe()
+    test_hedging_per_profile()
+    test_backoff_delay()
+    print("🎉 Все тесты пройдены!")
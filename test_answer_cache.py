@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Тест кэша ответов бота "Сота Сил"
+"""
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from answer_cache import AnswerCache
+from gigachat_client import GigaChatClient
+
+PROMPT = "Ты — Сота Сил, один из трёх богов Трибунала..."
+
+
+def test_normalization():
+    """Тест нормализации вопросов"""
+    print("🧪 ТЕСТ: Нормализация вопросов")
+    print("=" * 50)
+
+    cache = AnswerCache()
+    test_cases = [
+        ("сота кто ты", "кто ты"),
+        ("Сота, кто ты такой?", "кто ты"),
+        ("Высота башни?", "высота башни"),
+        ("Сота!", ""),
+    ]
+
+    for text, expected in test_cases:
+        normalized = cache.normalize(text)
+        status = "✅" if normalized == expected else "❌"
+        print(f"{status} '{text}' -> '{normalized}' (ожидалось: '{expected}')")
+        assert normalized == expected
+
+    assert cache.is_cacheable("сота кто ты")
+    assert not cache.is_cacheable("сота, а что он имел в виду?")
+    assert not cache.is_cacheable("сота " + "очень " * 20 + "длинный вопрос")
+    assert not cache.is_cacheable("Сота, какой сегодня день?")
+    assert not cache.is_cacheable("который час")
+    print()
+
+
+def test_exact_and_near_duplicate_hits():
+    """Тест точных и почти совпадающих вопросов"""
+    print("🎯 ТЕСТ: Попадания в кэш")
+    print("=" * 50)
+
+    cache = AnswerCache()
+    cache.put("сота кто ты", PROMPT, "Я — Сота Сил, хозяин Заводного города.", latency=3.0)
+    cache.put("расскажи про заводной город", PROMPT, "Заводной город — моё творение.", latency=2.0)
+
+    assert cache.get("Сота, кто ты такой?", PROMPT) == "Я — Сота Сил, хозяин Заводного города."
+    assert cache.get("расскажи про заводной горд", PROMPT) == "Заводной город — моё творение."
+    assert cache.get("расскажи про двемеров", PROMPT) is None
+
+    stats = cache.get_stats()
+    print(f"📊 Статистика: {stats}")
+    assert stats['hits'] == 2
+    assert stats['near_duplicate_hits'] == 1
+    assert stats['latency_saved_seconds'] == 5.0
+    print()
+
+
+def test_near_duplicate_meaning_guard():
+    """Тест: почти совпадающий текст с другими числами или отрицанием — другой вопрос"""
+    print("🔢 ТЕСТ: Числа и отрицания")
+    print("=" * 50)
+
+    cache = AnswerCache()
+    cache.put("сколько будет 2+2", PROMPT, "Четыре.")
+    cache.put("ты любишь кошек", PROMPT, "Кошки — изящные механизмы.")
+
+    assert cache.get("сколько будет 2+3", PROMPT) is None
+    assert cache.get("ты не любишь кошек", PROMPT) is None
+    assert cache.get("сколько будет 2 + 2?", PROMPT) == "Четыре."
+    assert cache.get("ты любишь кошек?", PROMPT) == "Кошки — изящные механизмы."
+
+    cache.clear()
+    assert cache.get_stats()['hits'] == 0 and cache.get_stats()['misses'] == 0
+    print("✅ Ответ не подменяется при другом числе или отрицании")
+    print()
+
+
+def test_prompt_variant_isolation():
+    """Тест: ответ выдаётся только для того же варианта промпта"""
+    print("👑 ТЕСТ: Изоляция по персонализированному промпту")
+    print("=" * 50)
+
+    cache = AnswerCache()
+    cache.put("кто ты", PROMPT, "Я — Сота Сил.")
+    assert cache.get("кто ты", PROMPT + " К пользователю обращайся 'моя королева'.") is None
+    assert cache.get("кто ты", PROMPT) == "Я — Сота Сил."
+    print("✅ Ответ не утекает между разными вариантами промпта")
+    print()
+
+
+def test_cacheable_answer_without_history():
+    """Тест: ответ для общего кэша генерируется без истории беседы, но остаётся в ней"""
+    print("🗂️ ТЕСТ: Ответ для кэша без контекста беседы")
+    print("=" * 50)
+
+    client = GigaChatClient()
+    client.remember_exchange("2000000001", "расскажи про мой город Балмору", "Балмора прекрасна.")
+    sent = []
+
+    async def complete(messages, priority, profile, on_usage):
+        sent.append(messages)
+        return "Я — Сота Сил."
+
+    client._complete = complete
+    asyncio.run(client.chat_with_personalized_prompt("кто ты", "2000000001", PROMPT, with_history=False))
+    assert [m["content"] for m in sent[0][1:]] == ["кто ты"]  # Только системный промпт и вопрос
+    assert len(client.conversations["2000000001"]) == 4  # Беседа помнит обмен репликами
+
+    asyncio.run(client.chat_with_personalized_prompt("а он большой?", "2000000001", PROMPT))
+    assert len(sent[1]) == 6  # Обычный вопрос идёт вместе с историей
+    print("✅ Кэшируемый ответ не зависит от беседы, где его спросили")
+    print()
+
+
+def test_ttl_and_eviction():
+    """Тест истечения срока жизни и вытеснения"""
+    print("⏰ ТЕСТ: TTL и вытеснение")
+    print("=" * 50)
+
+    cache = AnswerCache(max_entries=2)
+    cache.put("первый вопрос", PROMPT, "1")
+    cache.put("второй вопрос", PROMPT, "2")
+    cache.put("третий вопрос", PROMPT, "3")
+    assert cache.get("первый вопрос", PROMPT) is None
+    assert cache.get_stats()['evictions'] == 1
+
+    for entry in cache.entries.values():
+        entry["expires_at"] = 0
+    assert cache.get("третий вопрос", PROMPT) is None
+    assert cache.get_stats()['expirations'] == 1
+    print(f"📊 Статистика: {cache.get_stats()}")
+    print()
+
+
+if __name__ == "__main__":
+    print("🎯 ТЕСТИРОВАНИЕ КЭША ОТВЕТОВ")
+    print("=" * 60)
+    print()
+
+    test_normalization()
+    test_exact_and_near_duplicate_hits()
+    test_near_duplicate_meaning_guard()
+    test_prompt_variant_isolation()
+    test_cacheable_answer_without_history()
+    test_ttl_and_eviction()
+
+    print("🎉 ТЕСТИРОВАНИЕ ЗАВЕРШЕНО!")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тест пула ключей Гигачата
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from credential_pool import CredentialPool
+
+
+def test_least_loaded_routing():
+    """Тест маршрутизации по наименьшей загрузке"""
+    print("🧪 ТЕСТ: Маршрутизация по ключам")
+    print("=" * 50)
+
+    pool = CredentialPool(["a", "b", "c", "a", ""], budget_per_key=2)
+    print(f"Ключей: {len(pool.credentials)}, ёмкость: {pool.capacity()}")
+    assert len(pool.credentials) == 3  # Дубли и пустые ключи отброшены
+    assert pool.capacity() == 6  # Пропускная способность растёт с числом ключей
+
+    taken = [pool.acquire() for _ in range(6)]
+    loads = {c.name: c.in_flight for c in pool.credentials}
+    print(f"Загрузка после 6 запросов: {loads}")
+    assert all(load == 2 for load in loads.values())
+
+    pool.release(taken[0])
+    assert pool.acquire() is taken[0]  # Освободившийся ключ наименее загружен
+    print("✅ Запросы распределяются равномерно")
+    print()
+
+
+def test_exclusion():
+    """Тест исключения ключа после серии ошибок"""
+    print("🧪 ТЕСТ: Исключение ключа")
+    print("=" * 50)
+
+    pool = CredentialPool(["a", "b"], budget_per_key=4, exclude_after=3, exclusion_timeout=60)
+    bad = pool.credentials[0]
+
+    pool.record_rate_limit(bad)
+    pool.record_auth_failure(bad)
+    assert not bad.is_excluded()
+    pool.record_success(bad)  # Успех сбрасывает серию
+    for _ in range(3):
+        pool.record_rate_limit(bad)
+    print(f"Исключён: {bad.is_excluded()}, ёмкость: {pool.capacity()}")
+    assert bad.is_excluded()
+    assert pool.capacity() == 4
+
+    for _ in range(5):
+        assert pool.acquire() is not bad
+
+    # Если исключены все ключи, запрос всё равно получает ключ
+    for _ in range(3):
+        pool.record_auth_failure(pool.credentials[1])
+    assert pool.capacity() == 1
+    assert pool.acquire() is not None
+    print("✅ Сбойный ключ выведен из ротации")
+    print()
+
+
+if __name__ == "__main__":
+    test_least_loaded_routing()
+    test_exclusion()
+    print("🎉 Все тесты пройдены!")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Тест деградированного режима: ожидание в пределах SLO и судьба позднего ответа Гигачата
+"""
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+for name, value in (("VK_TOKEN", "x"), ("GIGACHAT_AUTH_KEY", "y"), ("VK_GROUP_ID", "1")):
+    os.environ.setdefault(name, value)
+
+import bot
+from degraded_mode import DegradedModeManager
+from history import HistoryManager
+from pipeline import MessagePipeline
+
+PEER_ID = 2000000001
+
+
+async def gigachat(seconds: float, reply: str = "Поздний ответ Гигачата") -> str:
+    """Запрос к Гигачату, отвечающий через seconds секунд"""
+    await asyncio.sleep(seconds)
+    return reply
+
+
+def test_wait_within_slo():
+    """Тест ожидания ответа: успел до SLO, не успел, режим выключен"""
+    print("🧪 ТЕСТ: Ожидание в пределах SLO")
+    print("=" * 50)
+
+    manager = DegradedModeManager(enabled=True, slo=0.1)
+
+    async def scenario():
+        fast = await manager.wait(asyncio.ensure_future(gigachat(0.01, "Быстрый ответ")), "chat")
+        slow_task = asyncio.ensure_future(gigachat(0.3))
+        slow = await manager.wait(slow_task, "search")
+        assert not slow_task.done()  # Поздний ответ продолжает генерироваться
+        slow_task.cancel()
+        manager.configure(enabled=False)
+        waited = await manager.wait(asyncio.ensure_future(gigachat(0.15, "Дождались")), "chat")
+        return fast, slow, waited
+
+    fast, slow, waited = asyncio.run(scenario())
+    assert (fast, slow, waited) == ("Быстрый ответ", None, "Дождались")
+    stats = manager.get_stats()
+    print(f"📊 Статистика: {stats}")
+    assert stats['on_time_answers'] == 1 and stats['slo_misses'] == {"search": 1}
+    print("✅ Ответ ждётся не дольше SLO, пока режим включён")
+    print()
+
+
+class FakeVK:
+    """Отправка и правка сообщений без сети"""
+
+    def __init__(self, message_id=42, edit_ok=True):
+        self.message_id = message_id
+        self.edit_ok = edit_ok
+        self.sent = []
+        self.edited = []
+
+    async def send_editable_message(self, peer_id, message):
+        self.sent.append(message)
+        return self.message_id
+
+    async def edit_message(self, peer_id, conversation_message_id, message):
+        self.edited.append((conversation_message_id, message))
+        return self.edit_ok
+
+
+def run_degraded(policy: str, vk: FakeVK, late_seconds: float = 0.1):
+    """Деградированный ответ с поздним ответом Гигачата через late_seconds"""
+    manager = DegradedModeManager(enabled=True, slo=0.02, late_policy=policy)
+    history = HistoryManager(os.path.join(tempfile.mkdtemp(), "history.json"), flush_delay=60)
+    saved = bot.degraded_mode, bot.history_manager, bot.vk_client.send_editable_message, bot.vk_client.edit_message
+    bot.degraded_mode, bot.history_manager = manager, history
+    bot.vk_client.send_editable_message, bot.vk_client.edit_message = vk.send_editable_message, vk.edit_message
+
+    async def scenario():
+        pipeline = MessagePipeline("тест")
+        task = pipeline.start("gigachat", gigachat(late_seconds))
+        assert await manager.wait(task, "chat") is None
+        outcome = await bot.reply_degraded(
+            pipeline, PEER_ID, str(PEER_ID), "Шестерни медлят.", lambda late: f"{late} (правка)"
+        )
+        pipeline.finish(outcome)
+        await asyncio.sleep(0)
+        return outcome, task
+
+    try:
+        outcome, task = asyncio.run(scenario())
+    finally:
+        bot.degraded_mode, bot.history_manager = saved[0], saved[1]
+        bot.vk_client.send_editable_message, bot.vk_client.edit_message = saved[2], saved[3]
+    return outcome, task, manager, history.get_history(str(PEER_ID))
+
+
+def test_late_answer_edit():
+    """Тест политики edit: поздний ответ заменяет отправленный шаблон"""
+    print("🧪 ТЕСТ: Поздний ответ правкой сообщения")
+    print("=" * 50)
+
+    vk = FakeVK()
+    outcome, _, manager, history = run_degraded("edit", vk)
+    print(f"Отправлено: {vk.sent}, правки: {vk.edited}")
+    assert outcome == "degraded_edited"
+    assert vk.sent == ["Шестерни медлят."]
+    assert vk.edited == [(42, "Поздний ответ Гигачата (правка)")]
+    assert manager.late_answers["edited"] == 1
+    assert history[-1]["content"] == "Поздний ответ Гигачата (правка)"
+    print("✅ Сообщение отредактировано, в истории ответ модели")
+    print()
+
+
+def test_late_answer_edit_fallback():
+    """Тест: правка не удалась или сообщение нельзя править — в истории остаётся шаблон"""
+    print("🧪 ТЕСТ: Правка позднего ответа не удалась")
+    print("=" * 50)
+
+    vk = FakeVK(edit_ok=False)
+    outcome, _, manager, history = run_degraded("edit", vk)
+    assert outcome == "degraded" and manager.late_answers["failed"] == 1
+    assert history[-1]["content"] == "Шестерни медлят."
+
+    # Отправка не вернула conversation_message_id — поздний ответ ждать незачем
+    vk = FakeVK(message_id=None)
+    outcome, task, manager, history = run_degraded("edit", vk, late_seconds=5)
+    assert outcome == "degraded" and vk.edited == []
+    assert manager.late_answers["discarded"] == 1 and task.cancelled()
+    assert history[-1]["content"] == "Шестерни медлят."
+    print("✅ Пользователь видит шаблон, история с ним согласована")
+    print()
+
+
+def test_late_answer_discard():
+    """Тест политики discard: поздний ответ отменяется вместе с пайплайном"""
+    print("🧪 ТЕСТ: Поздний ответ отбрасывается")
+    print("=" * 50)
+
+    vk = FakeVK()
+    outcome, task, manager, history = run_degraded("discard", vk, late_seconds=5)
+    assert outcome == "degraded"
+    assert vk.sent == ["Шестерни медлят."] and vk.edited == []
+    assert manager.late_answers["discarded"] == 1
+    assert task.cancelled()  # Стадия gigachat отменена при завершении пайплайна
+    assert history[-1]["content"] == "Шестерни медлят."
+    print("✅ Поздний ответ не ждётся и не отправляется")
+    print()
+
+
+if __name__ == "__main__":
+    test_wait_within_slo()
+    test_late_answer_edit()
+    test_late_answer_edit_fallback()
+    test_late_answer_discard()
+    print("🎉 Все тесты пройдены!")
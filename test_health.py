@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Тест проверок здоровья: готовность только по закэшированным результатам
+"""
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from admission import CircuitBreaker, PriorityLimiter
+from health import HealthChecker
+
+
+def make_checker():
+    """Проверки с подсчётом вызовов: VK отвечает, Serper (некритичный) недоступен"""
+    calls = {"vk": 0, "gigachat": 0, "serper": 0}
+    state = {"gigachat": True}
+
+    async def vk():
+        calls["vk"] += 1
+        return True
+
+    async def gigachat():
+        calls["gigachat"] += 1
+        if state["gigachat"] is None:
+            await asyncio.sleep(1)  # Зависший апстрим
+        return state["gigachat"]
+
+    async def serper():
+        calls["serper"] += 1
+        raise ConnectionError("нет сети")
+
+    checker = HealthChecker(interval=30, timeout=0.05, max_queue=2)
+    checker.register("vk", vk)
+    checker.register("gigachat", gigachat)
+    checker.register("serper", serper, critical=False)
+    return checker, calls, state
+
+
+def test_ready_from_cache():
+    """Тест готовности по результатам фоновых проверок"""
+    print("🧪 ТЕСТ: Готовность из кэша проверок")
+    print("=" * 50)
+
+    checker, calls, state = make_checker()
+
+    # До первой проверки бот не готов, а сами эндпоинты апстримы не вызывают
+    ready, report = checker.ready()
+    assert not ready and len(report['reasons']) == 2
+    assert checker.live()['status'] == 'alive'
+    assert calls == {"vk": 0, "gigachat": 0, "serper": 0}
+
+    asyncio.run(checker.probe_all())
+    ready, report = checker.ready()
+    print(f"Апстримы: {report['upstreams']}")
+    assert ready and report['status'] == 'ready'
+    assert report['upstreams']['serper']['ok'] is False  # Некритичный апстрим не влияет на готовность
+    assert "ConnectionError" in report['upstreams']['serper']['error']
+
+    for _ in range(5):
+        checker.ready()
+    assert calls == {"vk": 1, "gigachat": 1, "serper": 1}
+
+    # Зависшая проверка обрывается по таймауту
+    state["gigachat"] = None
+    asyncio.run(checker.probe_all())
+    ready, report = checker.ready()
+    print(f"Причины: {report['reasons']}")
+    assert not ready and report['reasons'] == ["gigachat: таймаут 0.05s"]
+    assert report['upstreams']['gigachat']['consecutive_failures'] == 1
+
+    # Результат, который давно не обновлялся, не считается подтверждением
+    state["gigachat"] = True
+    asyncio.run(checker.probe_all())
+    checker.probes["vk"].checked_at -= 1000
+    ready, report = checker.ready()
+    assert not ready and report['reasons'] == ["vk: результат проверки устарел"]
+    print("✅ Готовность считается по кэшу, апстримы вызывает только фоновая проверка")
+    print()
+
+
+def test_queue_and_breaker():
+    """Тест неготовности при переполненной очереди и разомкнутом выключателе"""
+    print("🧪 ТЕСТ: Очередь и выключатель")
+    print("=" * 50)
+
+    checker, _, _ = make_checker()
+    breaker = CircuitBreaker("тест", failure_threshold=1, recovery_timeout=30)
+
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        checker.watch(limiter, breaker)
+        await checker.probe_all()
+        assert checker.ready()[0]
+
+        await limiter.acquire()
+        waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        ready, report = checker.ready()
+        assert not ready and report['gigachat_queue']['saturated']
+        for _ in waiters:
+            limiter.release()
+        await asyncio.gather(*waiters)
+
+        breaker.record_failure()
+        ready, report = checker.ready()
+        print(f"Причины: {report['reasons']}")
+        assert not ready and report['circuit_breaker']['state'] == "open"
+        assert report['reasons'][0].startswith("выключатель Гигачата разомкнут")
+
+    asyncio.run(scenario())
+    print("✅ Очередь и выключатель учитываются в готовности")
+    print()
+
+
+if __name__ == "__main__":
+    test_ready_from_cache()
+    test_queue_and_breaker()
+    print("🎉 Все тесты пройдены!")
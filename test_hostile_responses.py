@@ -55,8 +55,7 @@ def test_cooldown_system():
     print("=" * 50)
     
     # Сбрасываем время последнего ответа
-    hostile_response_manager.last_response_time = 0
-    hostile_response_manager._save_last_response_time(0)
+    hostile_response_manager.cooldowns.reset()
     
     print(f"Текущий кулдаун: {hostile_response_manager.response_cooldown} секунд")
     
@@ -76,14 +75,32 @@ def test_cooldown_system():
     print(f"📊 Статистика: {stats}")
     print()
 
+def test_per_chat_cooldown():
+    """Тест кулдауна по беседам"""
+    print("💬 ТЕСТ: Кулдаун по беседам")
+    print("=" * 50)
+
+    hostile_response_manager.cooldowns.reset()
+    busy_chat, quiet_chat = 2000000001, 2000000002
+
+    assert hostile_response_manager.generate_harsh_response(busy_chat)
+    assert hostile_response_manager.generate_harsh_response(busy_chat) is None
+    # Активная беседа не расходует кулдаун тихой
+    assert hostile_response_manager.generate_harsh_response(quiet_chat)
+
+    stats = hostile_response_manager.get_stats()
+    print(f"📊 Беседы: {stats['chats']}")
+    assert stats['chats'][str(busy_chat)]['suppressed'] == 1
+    print("✅ Кулдаун учитывается отдельно для каждой беседы")
+    print()
+
 def test_harsh_responses():
     """Тест генерации резких ответов"""
     print("💢 ТЕСТ: Генерация резких ответов")
     print("=" * 50)
     
     # Сбрасываем кулдаун
-    hostile_response_manager.last_response_time = 0
-    hostile_response_manager._save_last_response_time(0)
+    hostile_response_manager.cooldowns.reset()
     
     print("Доступные резкие ответы:")
     for i, response in enumerate(hostile_response_manager.hostile_responses, 1):
@@ -98,8 +115,7 @@ def test_integration_with_bot():
     print("=" * 50)
     
     # Сбрасываем кулдаун для тестирования
-    hostile_response_manager.last_response_time = 0
-    hostile_response_manager._save_last_response_time(0)
+    hostile_response_manager.cooldowns.reset()
     
     # Симулируем обработку сообщений ботом
     test_scenarios = [
@@ -152,6 +168,7 @@ if __name__ == "__main__":
     try:
         test_aggressive_patterns()
         test_cooldown_system()
+        test_per_chat_cooldown()
         test_harsh_responses()
         test_integration_with_bot()
         
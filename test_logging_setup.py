@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тест журнала: сэмплирование записей события и JSON-формат
+"""
+import asyncio
+import json
+import logging
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from logging_setup import EventSamplingFilter, json_formatter
+from tracing import Tracer
+
+
+def make_record(message: str, level: int = logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("bot", level, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_event_sampling():
+    """Тест сэмплирования INFO внутри события"""
+    print("🧪 ТЕСТ: Сэмплирование журнала")
+    print("=" * 50)
+
+    tracer = Tracer()
+    dropping = EventSamplingFilter(sample_rate=0.0)
+    keeping = EventSamplingFilter(sample_rate=1.0)
+
+    # Вне события записи не сэмплируются
+    assert dropping.filter(make_record("🚀 Запуск бота"))
+
+    async def scenario():
+        trace = tracer.start_trace("vk_callback", **{"vk.event_id": "ev1"})
+        info = make_record("📤 Отправка в беседу")
+        assert not dropping.filter(info)
+        assert dropping.filter(make_record("⏱️ сводка", event_summary=True))
+        assert dropping.filter(make_record("❌ Ошибка", logging.ERROR))
+        assert keeping.filter(info)
+        tracer.finish_trace(trace)
+        return trace, info
+
+    trace, info = asyncio.run(scenario())
+    assert info.trace_id == trace.trace_id and info.event_id == "ev1"
+    print(f"Пропущено: {dropping.passed}, отброшено: {dropping.dropped}")
+    assert dropping.dropped == 1
+
+    # Решение одинаково для всех записей одного события
+    sampler = EventSamplingFilter(sample_rate=0.5)
+    decisions = {sampler.sampled(trace.trace_id) for _ in range(10)}
+    assert len(decisions) == 1
+    print("✅ У несэмплированного события остаётся только сводка")
+    print()
+
+
+def test_json_records():
+    """Тест JSON-формата записей в файле"""
+    print("🧪 ТЕСТ: JSON-записи")
+    print("=" * 50)
+
+    line = json_formatter().format(make_record("Сообщение «тест»", trace_id="abc", event_id="ev1"))
+    print(line)
+    data = json.loads(line)
+    assert data["event"] == "Сообщение «тест»"
+    assert data["level"] == "info" and data["logger"] == "bot"
+    assert data["trace_id"] == "abc" and data["event_id"] == "ev1"
+    assert "timestamp" in data
+    print("✅ Запись сериализуется в JSON")
+    print()
+
+
+if __name__ == "__main__":
+    test_event_sampling()
+    test_json_records()
+    print("🎉 Все тесты пройдены!")
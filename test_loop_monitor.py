@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Тест мониторинга блокировок цикла событий
+"""
+import asyncio
+import time
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loop_monitor import LoopLagMonitor
+
+
+def blocking_save():
+    """Синхронная «запись файла» внутри обработчика"""
+    time.sleep(0.3)
+
+
+def test_stall_captures_stack():
+    """Тест снятия стека колбэка, блокирующего цикл"""
+    print("🧪 ТЕСТ: Блокировка цикла событий")
+    print("=" * 50)
+
+    monitor = LoopLagMonitor(interval=0.02, threshold=0.1)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.1)
+        blocking_save()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    stats = monitor.get_stats()
+    print(f"Места блокировок: {stats['culprits']}")
+    assert stats['stalls_total'] == 1
+    stall = stats['recent_stalls'][0]
+    assert stall['culprit'].startswith("test_loop_monitor.py:") and stall['culprit'].endswith("blocking_save")
+    assert stall['duration_ms'] >= 250  # Опоздание пульса измерено после разблокировки
+    assert any("time.sleep" in line for line in stall['stack'])
+    assert stats['max_lag_ms'] >= 250 and not stats['running']
+    print("✅ Стек блокирующего вызова снят")
+    print()
+
+
+if __name__ == "__main__":
+    test_stall_captures_stack()
+    print("🎉 Все тесты пройдены!")
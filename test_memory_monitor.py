@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Тест учёта памяти по подсистемам
+"""
+import sys
+import os
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from memory_monitor import MemoryMonitor, deep_sizeof
+
+
+def test_incremental_sizes():
+    """Тест инкрементальной оценки размера хранилища"""
+    print("🧪 ТЕСТ: Размер хранилищ")
+    print("=" * 50)
+
+    conversations = {f"chat{i}": [{"role": "user", "content": "x" * 100}] for i in range(10)}
+    monitor = MemoryMonitor(budget=4, subsystem_limit_mb=0.01)
+    monitor.register("conversations", lambda: conversations)
+    monitor.register("not_loaded", lambda: None)
+
+    monitor.refresh()
+    stats = monitor.get_stats()['subsystems']['conversations']
+    assert stats['measured_entries'] == 4  # За проход измеряется не больше budget записей
+    monitor.refresh()
+    monitor.refresh()
+    before = monitor.subsystems['conversations'].total
+    assert before == sys.getsizeof(conversations) + sum(deep_sizeof(k) + deep_sizeof(v) for k, v in conversations.items())
+
+    # Изменившаяся запись пересчитывается, удалённая — исключается после полного прохода
+    conversations["chat0"] = conversations["chat0"] + [{"role": "assistant", "content": "y" * 20000}]
+    del conversations["chat9"]
+    for _ in range(3):
+        monitor.refresh()
+    after = monitor.subsystems['conversations'].total
+    print(f"Размер до: {before}, после: {after}")
+    assert after == sys.getsizeof(conversations) + sum(deep_sizeof(k) + deep_sizeof(v) for k, v in conversations.items())
+    assert monitor.get_stats()['subsystems']['not_loaded']['bytes'] == 0
+
+    # История с ограниченной длиной меняется на месте: тот же список, та же длина
+    conversations["chat1"][0] = {"role": "user", "content": "z" * 20000}
+    for _ in range(3):
+        monitor.refresh()
+    assert monitor.subsystems['conversations'].total == (
+        sys.getsizeof(conversations) + sum(deep_sizeof(k) + deep_sizeof(v) for k, v in conversations.items())
+    )
+
+    alerts = monitor.check()
+    assert [alert['subsystem'] for alert in alerts] == ["conversations"]
+    assert monitor.check() == []  # Повторно о том же превышении не предупреждаем
+    print("✅ Размеры обновляются инкрементально")
+    print()
+
+
+def test_tracemalloc_diff():
+    """Тест сравнения снимков tracemalloc"""
+    print("🧪 ТЕСТ: Снимки tracemalloc")
+    print("=" * 50)
+
+    monitor = MemoryMonitor()
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        monitor.take_snapshot("before")
+        leak = [bytearray(1024) for _ in range(500)]
+        monitor.take_snapshot("after")
+        diff = monitor.diff()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    print(f"Рост: {diff['total_diff_kb']} КБ, первая строка: {diff['top'][0]['location']}")
+    assert diff['from'] == "before" and diff['to'] == "after"
+    assert diff['top'][0]['location'].startswith(os.path.abspath(__file__))
+    assert diff['top'][0]['size_diff_kb'] >= 500
+    assert len(leak) == 500
+    print("✅ Снимки показывают строку с ростом памяти")
+    print()
+
+
+if __name__ == "__main__":
+    test_incremental_sizes()
+    test_tracemalloc_diff()
+    print("🎉 Все тесты пройдены!")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Тест метрик и экспозиции Prometheus
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import Registry, Counter, Gauge, Histogram
+
+
+def test_exposition():
+    """Тест текстового формата /metrics"""
+    print("🧪 ТЕСТ: Экспозиция метрик")
+    print("=" * 50)
+
+    registry = Registry()
+    histogram = Histogram("stage_seconds", "Время стадий", (0.1, 1.0), ["stage"], registry=registry)
+    counter = Counter("errors_total", "Ошибки", ["upstream", "kind"], registry=registry)
+    in_flight = []
+    Gauge("in_flight", "В работе", registry=registry).set_function(lambda: len(in_flight))
+
+    stage = histogram.labels("gigachat")
+    for value in (0.05, 0.5, 0.7, 3.0):
+        stage.observe(value)
+    counter.labels("vk", 'quote"').inc()
+    counter.labels("vk", 'quote"').inc(2)
+    in_flight.extend([1, 2])
+
+    text = registry.exposition()
+    print(text)
+    lines = text.splitlines()
+    assert "# TYPE stage_seconds histogram" in lines
+    # Корзины накопительные, последняя — +Inf
+    assert 'stage_seconds_bucket{stage="gigachat",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="gigachat",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="gigachat",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="gigachat"} 4' in lines
+    assert 'errors_total{upstream="vk",kind="quote\\""} 3' in lines
+    assert "in_flight 2" in lines  # Значение датчика вычисляется при чтении
+    print("✅ Формат Prometheus корректен")
+    print()
+
+
+def test_registry_replaces_by_name():
+    """Тест повторной регистрации метрики с тем же именем"""
+    print("🧪 ТЕСТ: Реестр метрик")
+    print("=" * 50)
+
+    registry = Registry()
+    Counter("requests_total", "Запросы", registry=registry).inc()
+    fresh = Counter("requests_total", "Запросы", registry=registry)
+    assert registry.get("requests_total") is fresh
+    assert "requests_total 0" not in registry.exposition()  # Дочерних метрик ещё нет
+    fresh.inc()
+    assert "requests_total 1" in registry.exposition().splitlines()
+    print("✅ Новая метрика заменяет старую")
+    print()
+
+
+if __name__ == "__main__":
+    test_exposition()
+    test_registry_replaces_by_name()
+    print("🎉 Все тесты пройдены!")
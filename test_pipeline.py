@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Тест стадий обработки сообщения: параллельные стадии, результаты по умолчанию и отмена
+"""
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import MessagePipeline
+
+
+async def stage(seconds: float, value=None, error: bool = False):
+    """Стадия, завершающаяся через seconds секунд"""
+    await asyncio.sleep(seconds)
+    if error:
+        raise RuntimeError("апстрим недоступен")
+    return value
+
+
+def test_concurrent_stages():
+    """Тест: независимые стадии выполняются одновременно"""
+    print("🧪 ТЕСТ: Параллельные стадии")
+    print("=" * 50)
+
+    async def scenario():
+        pipeline = MessagePipeline("тест")
+        started_at = time.monotonic()
+        pipeline.start("users.get", stage(0.1, "Вася"))
+        pipeline.start("serper", stage(0.1, ["сниппет"]))
+        name = await pipeline.result("users.get")
+        snippets = await pipeline.result("serper")
+        elapsed = time.monotonic() - started_at
+        return pipeline, name, snippets, elapsed
+
+    pipeline, name, snippets, elapsed = asyncio.run(scenario())
+    print(pipeline.summary())
+    assert (name, snippets) == ("Вася", ["сниппет"])
+    assert elapsed < 0.18  # Две стадии по 0.1s заняли время одной
+    first, second = sorted(pipeline.stages, key=lambda s: s['start'])
+    assert second['start'] < first['start'] + first['duration']  # Интервалы стадий пересекаются
+    print("✅ Стадии перекрываются по времени")
+    print()
+
+
+def test_result_defaults():
+    """Тест: result возвращает default при ошибке, отмене и для незапущенной стадии"""
+    print("🧪 ТЕСТ: Результат по умолчанию")
+    print("=" * 50)
+
+    async def scenario():
+        pipeline = MessagePipeline("тест")
+        pipeline.start("users.get", stage(0.01, error=True))
+        pipeline.start("serper", stage(1, ["сниппет"]))
+        failed = await pipeline.result("users.get", "Друг")
+        pipeline.cancel_pending("ответ из кэша")
+        cancelled = await pipeline.result("serper", [])
+        missing = await pipeline.result("gigachat", "нет")
+        return pipeline, failed, cancelled, missing
+
+    pipeline, failed, cancelled, missing = asyncio.run(scenario())
+    assert (failed, cancelled, missing) == ("Друг", [], "нет")
+    statuses = {s['name']: s['status'] for s in pipeline.stages}
+    print(f"Статусы: {statuses}")
+    assert statuses == {"users.get": "error", "serper": "cancelled"}
+    print("✅ Сбой стадии не роняет обработку сообщения")
+    print()
+
+
+def test_finish_cancels_pending():
+    """Тест: finish выполняет отложенные действия и отменяет незавершённые стадии"""
+    print("🧪 ТЕСТ: Завершение пайплайна")
+    print("=" * 50)
+
+    released = []
+
+    async def scenario():
+        pipeline = MessagePipeline("тест")
+        done = pipeline.start("users.get", stage(0, "Вася"))
+        pending = pipeline.start("gigachat", stage(5, "поздний ответ"))
+        pipeline.defer(lambda: released.append("typing"))
+        await done
+        not_started = pipeline.start("serper", stage(5))  # Задача ещё не получила управление
+        pipeline.finish("degraded")
+        pipeline.finish("degraded")  # Отложенные действия выполняются один раз
+        await asyncio.sleep(0)
+        return done, pending, not_started
+
+    done, pending, not_started = asyncio.run(scenario())
+    assert done.result() == "Вася"
+    assert pending.cancelled() and not_started.cancelled()
+    assert released == ["typing"]
+    print("✅ Оставшиеся стадии отменены, индикатор снят один раз")
+    print()
+
+
+if __name__ == "__main__":
+    test_concurrent_stages()
+    test_result_defaults()
+    test_finish_cancels_pending()
+    print("🎉 Все тесты пройдены!")
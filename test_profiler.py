@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Тест статистического профилировщика
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from profiler import SamplingProfiler
+
+
+def busy_handler(stop: threading.Event):
+    """Нагрузка, которую должен увидеть профилировщик"""
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_on_demand_profile():
+    """Тест профилирования по запросу: свёрнутые стеки и таблица функций"""
+    print("🧪 ТЕСТ: Профилирование по запросу")
+    print("=" * 50)
+
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_handler, args=(stop,), name="worker")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.002)
+    try:
+        profile = asyncio.run(profiler.profile(0.3, focus="busy_handler"))
+    finally:
+        stop.set()
+        worker.join()
+
+    top = profile.to_dict(10)['top']
+    print(f"Сэмплов: {profile.samples}, функций в таблице: {len(top)}")
+    assert profile.samples > 20
+    # С фокусом остаются только стеки рабочего потока
+    assert all(stack.startswith("worker;") for stack in profile.stacks)
+    handler = next(row for row in top if row['function'].startswith("busy_handler (test_profiler.py:"))
+    assert handler['total_percent'] == 100.0
+    line = profile.collapsed().splitlines()[0]
+    assert "busy_handler" in line and line.rsplit(" ", 1)[1].isdigit()
+    print("✅ Профиль содержит горячую функцию")
+    print()
+
+
+def test_continuous_profiles_roll():
+    """Тест постоянного режима: окна пишутся на диск, старые удаляются"""
+    print("🧪 ТЕСТ: Постоянное профилирование")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as directory:
+        profiler = SamplingProfiler(continuous_interval=0.01, roll_interval=1.0, keep=1, directory=directory)
+        profiler.start_continuous()
+        time.sleep(1.2)
+        profiler.stop_continuous()
+        saved = profiler.get_stats()['saved_profiles']
+        print(f"Файлы профилей: {saved}")
+        assert profiler.rolled_profiles == 2 and len(saved) == 1
+        assert not profiler.get_stats()['continuous']
+    print("✅ Хранятся только последние окна")
+    print()
+
+
+if __name__ == "__main__":
+    test_on_demand_profile()
+    test_continuous_profiles_roll()
+    print("🎉 Все тесты пройдены!")
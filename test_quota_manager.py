@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Тест квот на Гигачат: лимиты, потолок промпта, смена суток и очистка корзин
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from quota_manager import QuotaManager
+
+
+def test_limits():
+    """Тест лимитов запросов в минуту и токенов в сутки"""
+    print("🧪 ТЕСТ: Лимиты квот")
+    print("=" * 50)
+
+    manager = QuotaManager(user_requests_per_minute=2, user_tokens_per_day=1000,
+                           chat_requests_per_minute=3, chat_tokens_per_day=100000)
+    assert manager.check(1, "2000000001") is None
+    assert manager.check(1, "2000000001") is None
+    assert manager.check(1, "2000000001") == "user_rate"
+    assert manager.check(2, "2000000001") is None
+    assert manager.check(3, "2000000001") == "chat_rate"  # Беседа исчерпала свой лимит
+
+    manager.record_usage(4, "2000000002", {"prompt_tokens": 300, "completion_tokens": 800})
+    assert manager.check(4, "2000000002") == "user_tokens"
+    report = manager.get_report()
+    print(f"Отказы: {report['rejected']}")
+    assert report['rejected'] == {"user_rate": 1, "chat_rate": 1, "user_tokens": 1}
+    print("✅ Лимиты соблюдаются")
+    print()
+
+
+def test_prompt_tokens_cap():
+    """Тест: длинный контекст беседы списывается с квоты не целиком"""
+    print("🧪 ТЕСТ: Потолок токенов промпта")
+    print("=" * 50)
+
+    manager = QuotaManager(user_requests_per_minute=20, user_tokens_per_day=20000, prompt_tokens_cap=1500)
+    for _ in range(10):
+        manager.record_usage(1, "2000000001", {"prompt_tokens": 6000, "completion_tokens": 200, "total_tokens": 6200})
+        assert manager.check(1, "2000000001") is None  # Активная беседа не блокируется за десяток реплик
+
+    counters = manager.usage[("user", "1")]
+    print(f"Счётчики: {counters}")
+    assert counters['total_tokens'] == 62000  # Фактический расход виден в отчёте
+    assert counters['charged_tokens'] == 17000
+    print("✅ С квоты списывается ответ и ограниченный контекст")
+    print()
+
+
+def test_day_rollover_and_cleanup():
+    """Тест сброса статистики при смене суток и удаления простаивающих корзин"""
+    print("🧪 ТЕСТ: Смена суток и очистка")
+    print("=" * 50)
+
+    manager = QuotaManager(idle_ttl=60)
+    manager.record_usage(1, "2000000001", {"prompt_tokens": 100, "completion_tokens": 50})
+    manager.record_usage(2, "2000000001", {"prompt_tokens": 100, "completion_tokens": 50})
+    assert len(manager.usage) == 3
+
+    manager.usage_day = "2000-01-01"  # Статистика набрана в прошлые сутки
+    report = manager.get_report()
+    print(f"Прошлые сутки: {report['previous_day']}")
+    assert manager.usage == {} and report['top_users'] == []
+    assert report['previous_day']['day'] == "2000-01-01" and report['previous_day']['total_tokens'] == 300
+
+    # Корзины простаивающих пользователей удаляются, когда они снова полные
+    assert manager.check(3, "2000000002") is None
+    for key in manager._last_seen:
+        manager._last_seen[key] -= 120
+    manager._buckets[("user", "3")][0].level = manager.limits["user"][0]
+    manager._buckets[("chat", "2000000002")][0].level = manager.limits["chat"][0]
+    manager._last_cleanup -= 120
+    manager._cleanup()
+    print(f"Корзин осталось: {len(manager._buckets)}")
+    assert ("user", "3") not in manager._buckets
+    assert ("user", "1") in manager._buckets  # Суточная корзина ещё не пополнилась
+    print("✅ Старые записи не копятся")
+    print()
+
+
+if __name__ == "__main__":
+    test_limits()
+    test_prompt_tokens_cap()
+    test_day_rollover_and_cleanup()
+    print("🎉 Все тесты пройдены!")
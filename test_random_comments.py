@@ -66,8 +66,24 @@ def test_cooldown():
     # Проверяем статистику
     stats = random_comments_manager.get_stats()
     print(f"Статистика кулдауна:")
-    print(f"  Можно комментировать: {stats['can_comment']}")
-    print(f"  Время до следующего комментария: {stats['next_comment_in']} сек")
+    print(f"  Бесед с активным кулдауном: {stats['tracked_chats']}")
+    print(f"  Время до следующего комментария: {int(random_comments_manager.cooldowns.remaining())} сек")
+
+    # Кулдаун одной беседы не действует на другую
+    random_comments_manager.cooldowns.reset()
+    message = "Сегодня работал на заводе"
+    suppressed_before = random_comments_manager.cooldowns.suppressed_total
+    assert random_comments_manager.generate_comment(message, 2000000001)
+    assert not random_comments_manager.should_comment(message, 2000000001)
+    assert not random_comments_manager.should_comment("Как дела?", 2000000001)  # Без триггера — не отказ
+    assert random_comments_manager.should_comment(message, 2000000002)
+    print(f"  ✅ Кулдаун учитывается отдельно для каждой беседы")
+
+    # Отказ по кулдауну виден в статистике беседы
+    stats = random_comments_manager.get_stats()
+    assert stats['suppressed_total'] == suppressed_before + 1
+    assert stats['chats']['2000000001']['suppressed'] >= 1
+    print(f"  ✅ Отклонённые кулдауном комментарии учитываются: {stats['chats']['2000000001']}")
     print()
 
 def test_special_triggers_priority():
@@ -91,10 +107,30 @@ def test_special_triggers_priority():
     
     print()
 
+def test_comment_pool():
+    """Тест пула сгенерированных реплик"""
+    print("🧩 Тестирование пула сгенерированных реплик\n")
+
+    from comment_pool import CommentPool
+    pool = CommentPool(["work"], pool_size=3, recent_size=5)
+    pool.set_templates({"work": ["Механизмы подсказали бы более эффективный путь."]})
+
+    assert pool.add("work", "Шестерни не лгут, в отличие от людей.")
+    assert not pool.add("work", "шестерни не лгут в отличие от людей")  # Уже в пуле
+    assert not pool.add("work", "Механизмы подсказали бы более эффективный путь!")  # Повтор шаблона
+
+    line = pool.draw("work")
+    assert line == "Шестерни не лгут, в отличие от людей."
+    assert not pool.add("work", line)  # Недавно использована
+    assert pool.draw("work") is None  # Пул пуст — будет использован шаблон
+    print(f"  ✅ Статистика пула: {pool.get_stats()}")
+    print()
+
 if __name__ == "__main__":
     test_comment_triggers()
     test_cooldown()
     test_special_triggers_priority()
+    test_comment_pool()
     
     print("🎉 Тестирование завершено!")
     print("\n📊 Дополнительная информация:")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Тест разбора команд настройки бота "Сота Сил"
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from user_preferences import match_setup_command
+
+
+def test_setup_commands():
+    """Тест сопоставления команд настройки"""
+    print("🧪 ТЕСТ: Команды настройки")
+    print("=" * 50)
+
+    test_cases = [
+        ("Сота, меня зовут Вася Пупкин!", ("set_name", "Вася Пупкин")),
+        ("Моё имя Ёжик, сота", ("set_name", "Ёжик")),
+        ("Сота Сил, говори со мной неформально", ("style_casual", None)),
+        ("сота будь серьезным", ("tone_serious", None)),
+        ("Окей, Сота: мои настройки?", ("show_settings", None)),
+        ("@sota_sil меня зовут Вася", ("set_name", "Вася")),
+        ("Привет, Сота! Меня зовут Вася", ("set_name", "Вася")),
+        ("Сота, пожалуйста, будь серьёзным", ("tone_serious", None)),
+        ("Сота, покажи мои настройки", ("show_settings", None)),
+        ("Ну сота, будь серьёзным", ("tone_serious", None)),
+        ("Слушай, Сота, меня зовут Вася", ("set_name", "Вася")),
+        # Фраза в середине вопроса — не команда
+        ("Сота, а как тебе моё имя?", None),
+        ("Сота, расскажи о механизмах", None),
+        ("Сота, меня зовут", None),
+        ("Ну сота, а как тебе моё имя?", None),
+        ("Сота, мои настройки неправильные, почему?", None),
+    ]
+
+    for text, expected in test_cases:
+        matched = match_setup_command(text)
+        result = (matched[0].name, matched[1]) if matched else None
+        status = "✅" if result == expected else "❌"
+        print(f"{status} '{text}' -> {result} (ожидалось: {expected})")
+        assert result == expected
+    print()
+
+
+if __name__ == "__main__":
+    test_setup_commands()
+    print("🎉 Все тесты пройдены!")
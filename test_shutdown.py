@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Тест плавной остановки: ожидание событий, запись хранилищ, снимок дедупликатора
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+import uvicorn
+
+from history import HistoryManager
+from message_deduplicator import MessageDeduplicator
+from shutdown import DrainingServer, ShutdownManager
+
+
+def test_drain_and_flush():
+    """Тест остановки: быстрое событие дожидается, зависшее прерывается, хранилища записываются"""
+    print("🧪 ТЕСТ: Плавная остановка")
+    print("=" * 50)
+
+    manager = ShutdownManager(drain_timeout=0.2, step_timeout=0.1)
+    forgotten = []
+    path = os.path.join(tempfile.mkdtemp(), "history.json")
+    history = HistoryManager(path, flush_delay=60)
+
+    async def callback(event_id: str, seconds: float):
+        async with manager.track(event_id, 2000000001, lambda: forgotten.append(event_id)):
+            await asyncio.sleep(seconds)
+            history.add_message("2000000001", "assistant", f"ответ на {event_id}")
+
+    async def broken_flush():
+        raise OSError("диск заполнен")
+
+    async def hanging_close():
+        await asyncio.sleep(1)
+
+    manager.register_flush("history", history.flush)
+    manager.register_flush("broken", broken_flush)
+    manager.register_close("hanging", hanging_close)
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(callback("fast", 0.05)), asyncio.ensure_future(callback("slow", 5))]
+        await asyncio.sleep(0.01)
+        assert len(manager.get_stats()['in_flight']) == 2
+        drained = await manager.drain()
+        assert drained == 1 and manager.reject()
+        assert not os.path.exists(path)  # Запись отложена — без finish история была бы потеряна
+        report = await manager.finish()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return report
+
+    report = asyncio.run(scenario())
+    print(f"Отчёт: {report}")
+    assert [event['event_id'] for event in report['dropped_events']] == ["slow"]
+    assert forgotten == ["slow"]
+    assert report['rejected_callbacks'] == 1
+    assert report['flushed'] == ["history"]
+    assert set(report['failed']) == {"broken", "hanging"}
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)["2000000001"][0]["content"] == "ответ на fast"
+    print("✅ Завершившееся событие сохранено, прерванное и неудачные шаги перечислены в отчёте")
+    print()
+
+
+def test_dedup_snapshot():
+    """Тест снимка дедупликатора между перезапусками"""
+    print("🧪 ТЕСТ: Снимок дедупликатора")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "dedup_state.json")
+
+    async def first_run():
+        dedup = MessageDeduplicator(storage_file=path)
+        assert not dedup.is_duplicate(101, "привет", 1, 2)[0]
+        assert not dedup.is_duplicate(102, "пока", 1, 2)[0]
+        dedup.forget(102)  # Обработка прервана остановкой
+        await dedup.flush()
+
+    asyncio.run(first_run())
+
+    restarted = MessageDeduplicator(storage_file=path)
+    assert restarted.is_duplicate(101)[0]  # Повторная доставка обработанного сообщения
+    assert not restarted.is_duplicate(102)[0]  # Прерванное сообщение обрабатывается заново
+    print("✅ Повторная доставка после перезапуска отбрасывается только для обработанных сообщений")
+    print()
+
+
+def test_drain_before_port_closes():
+    """Тест остановки настоящего сервера: события дожидаются, пока порт открыт, новые колбэки получают 503"""
+    print("🧪 ТЕСТ: Остановка сервера uvicorn")
+    print("=" * 50)
+
+    manager = ShutdownManager(drain_timeout=2, step_timeout=0.5)
+
+    async def app(scope, receive, send):
+        """Колбэк: отклоняется при остановке, иначе учитывается как обрабатываемое событие"""
+        status = 503
+        if not manager.reject():
+            async with manager.track(scope["path"]):
+                await asyncio.sleep(0.3)
+            status = 200
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok" if status == 200 else b"shutting down"})
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async def scenario():
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")
+        server = DrainingServer(config, manager)
+        serving = asyncio.ensure_future(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+
+        url = f"http://127.0.0.1:{port}"
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as session:
+            async def post(path):
+                async with session.post(url + path) as response:
+                    return response.status
+
+            slow = asyncio.ensure_future(post("/event"))
+            await asyncio.sleep(0.05)
+            server.should_exit = True  # Как после SIGTERM
+            await asyncio.sleep(0.15)
+            late = await post("/late")
+            statuses = (await slow, late)
+        await serving
+        return statuses
+
+    statuses = asyncio.run(scenario())
+    print(f"Ответы: событие {statuses[0]}, колбэк во время остановки {statuses[1]}")
+    assert statuses == (200, 503)
+    assert manager.rejected == 1 and not manager.dropped
+    print("✅ Обрабатываемое событие завершилось, новый колбэк отклонён до закрытия порта")
+    print()
+
+
+if __name__ == "__main__":
+    test_drain_and_flush()
+    test_dedup_snapshot()
+    test_drain_before_port_closes()
+    print("🎉 Все тесты пройдены!")
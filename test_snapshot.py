@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тест снимка состояния: восстановление подсистем, crc32 и устаревшие секции
+"""
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from answer_cache import AnswerCache
+from cooldown_table import CooldownTable
+from message_deduplicator import MessageDeduplicator
+from snapshot import HEADER, SECTION, SnapshotManager
+
+
+def make_manager(path: str):
+    """Менеджер снимков со свежими экземплярами подсистем"""
+    subsystems = {
+        'dedup': MessageDeduplicator(),
+        'cooldowns': CooldownTable("Тест", cooldown=3600),
+        'cache': AnswerCache(),
+        'conversations': {}
+    }
+    manager = SnapshotManager(path, interval=60, max_age=3600)
+    manager.register("deduplicator", subsystems['dedup'].export_state, subsystems['dedup'].import_state)
+    manager.register("cooldowns", subsystems['cooldowns'].export_state, subsystems['cooldowns'].import_state)
+    manager.register("answer_cache", subsystems['cache'].export_state, subsystems['cache'].import_state)
+    manager.register("conversations", lambda: subsystems['conversations'],
+                     subsystems['conversations'].update, version=2)
+    return manager, subsystems
+
+
+def fill(subsystems):
+    subsystems['dedup'].is_duplicate(555, "привет", 1, 2000000001)
+    subsystems['cooldowns'].mark(2000000001)
+    subsystems['cache'].put("Что такое двемеры?", "промпт", "Древний народ механиков.", latency=2.5)
+    subsystems['conversations']["2000000001"] = [{"role": "user", "content": "Привет"}]
+
+
+def test_warm_restart():
+    """Тест восстановления всех секций после перезапуска"""
+    print("🧪 ТЕСТ: Тёплый перезапуск")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "state_snapshot.bin")
+    manager, subsystems = make_manager(path)
+    fill(subsystems)
+    asyncio.run(manager.save())
+    print(f"Снимок: {manager.last_save}")
+    assert manager.last_save['bytes'] == os.path.getsize(path)
+
+    restarted, fresh = make_manager(path)
+    report = asyncio.run(restarted.restore())
+    print(f"Восстановлено: {report['restored']}")
+    assert report['restored'] == ["deduplicator", "cooldowns", "answer_cache", "conversations"]
+    assert fresh['dedup'].is_duplicate(555)[0]
+    assert not fresh['cooldowns'].ready(2000000001)
+    assert fresh['cache'].get("что такое двемеры", "промпт") == "Древний народ механиков."
+    assert fresh['conversations']["2000000001"][0]["content"] == "Привет"
+    print("✅ Контексты, дедупликация, кулдауны и кэш восстановлены одним чтением")
+    print()
+
+
+def test_damaged_sections():
+    """Тест пропуска повреждённых, несовместимых и устаревших секций"""
+    print("🧪 ТЕСТ: Повреждённые секции")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "state_snapshot.bin")
+    manager, subsystems = make_manager(path)
+    fill(subsystems)
+    asyncio.run(manager.save())
+
+    # Портим данные первой секции: остальные должны восстановиться
+    with open(path, 'rb') as f:
+        blob = bytearray(f.read())
+    name_length = SECTION.unpack_from(blob, HEADER.size)[0]
+    blob[HEADER.size + SECTION.size + name_length] ^= 0xFF
+    with open(path, 'wb') as f:
+        f.write(bytes(blob))
+
+    restarted, fresh = make_manager(path)
+    restarted.sections["conversations"].version = 3  # Формат секции изменился
+    restarted.sections["cooldowns"].max_age = -1  # Секция с коротким сроком годности
+    report = asyncio.run(restarted.restore())
+    print(f"Пропущено: {report['skipped']}")
+    assert report['restored'] == ["answer_cache"]
+    assert report['skipped']["deduplicator"] == "crc32 не совпал"
+    assert report['skipped']["conversations"] == "версия 2, ожидается 3"
+    assert report['skipped']["cooldowns"].startswith("устарела")
+    assert not fresh['dedup'].is_duplicate(555)[0] and not fresh['conversations']
+
+    # Чужой файл не роняет запуск
+    with open(path, 'wb') as f:
+        f.write(b"{}")
+    report = asyncio.run(make_manager(path)[0].restore())
+    assert report['restored'] == [] and "*" in report['skipped']
+    print("✅ Испорченные секции пропускаются, остальные восстанавливаются")
+    print()
+
+
+if __name__ == "__main__":
+    test_warm_restart()
+    test_damaged_sections()
+    print("🎉 Все тесты пройдены!")
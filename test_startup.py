@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Тест холодного старта: время импорта bot.py (-X importtime) и ленивые хранилища
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Бюджеты импорта (секунды): модули бота и весь импорт вместе с fastapi/aiohttp
+OWN_MODULES_BUDGET = 0.3
+TOTAL_BUDGET = 2.0
+
+PROBE = """
+import json, bot
+print(json.dumps({
+    'history': bot.history_manager._history is not None,
+    'preferences': bot.user_preferences._preferences is not None,
+    'confirmation': bot.confirmation_manager._loaded,
+    'cooldowns': [table._peers is not None for table in (
+        bot.hostile_response_manager.cooldowns, bot.random_comments_manager.cooldowns)],
+    'comment_pool': not bot.random_comments_manager.pool._pending_file,
+    'health_probes': bot.health_checker.rounds
+}))
+"""
+
+
+def import_bot():
+    """Импорт bot.py в отдельном процессе: (время импорта по модулям, загруженные хранилища)"""
+    env = dict(os.environ, VK_TOKEN=os.environ.get("VK_TOKEN", "x"),
+               GIGACHAT_AUTH_KEY=os.environ.get("GIGACHAT_AUTH_KEY", "y"),
+               VK_GROUP_ID=os.environ.get("VK_GROUP_ID", "1"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    timings = {}  # модуль -> (собственное время, с вложенными импортами) в микросекундах
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[0].strip().isdigit():
+            continue  # Заголовок таблицы
+        timings[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, loaded
+
+
+def test_import_budget():
+    """Тест бюджета времени импорта"""
+    print("🧪 ТЕСТ: Время импорта bot.py")
+    print("=" * 50)
+
+    own = {os.path.basename(path)[:-3] for path in glob.glob(os.path.join(REPO_DIR, "*.py"))}
+    timings, _ = import_bot()
+    own_total = sum(timings[name][0] for name in own if name in timings) / 1e6
+    total = timings["bot"][1] / 1e6
+    slowest = sorted((name for name in own if name in timings), key=lambda name: timings[name][0], reverse=True)[:5]
+    print(f"Модули бота: {own_total * 1000:.0f} мс, весь импорт: {total * 1000:.0f} мс")
+    print(f"Самые медленные: {[(name, timings[name][0] // 1000) for name in slowest]}")
+    assert own_total < OWN_MODULES_BUDGET
+    assert total < TOTAL_BUDGET
+    print("✅ Импорт укладывается в бюджет")
+    print()
+
+
+def test_stores_are_lazy():
+    """Тест: при импорте не читаются файлы хранилищ и не вызываются апстримы"""
+    print("🧪 ТЕСТ: Ленивые хранилища")
+    print("=" * 50)
+
+    _, loaded = import_bot()
+    print(f"Загружено при импорте: {loaded}")
+    assert loaded == {
+        'history': False, 'preferences': False, 'confirmation': False,
+        'cooldowns': [False, False], 'comment_pool': False, 'health_probes': 0
+    }
+    print("✅ Хранилища загружаются при первом обращении")
+    print()
+
+
+if __name__ == "__main__":
+    test_import_budget()
+    test_stores_are_lazy()
+    print("🎉 Все тесты пройдены!")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Тест отложенной записи хранилищ: изменения во время записи и запись при остановке
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import storage
+from storage import BatchedWriter
+
+
+def slow_disk(seconds_by_version):
+    """Запись на диск, медленная для заданных версий данных"""
+    original = storage.atomic_write_text
+
+    def write(path, text):
+        time.sleep(seconds_by_version.get(json.loads(text)["version"], 0))
+        original(path, text)
+
+    return original, write
+
+
+def read_version(path: str) -> int:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)["version"]
+
+
+def test_change_during_write():
+    """Тест: изменение, пришедшее во время записи, попадает на диск следующей пачкой"""
+    print("🧪 ТЕСТ: Изменение во время записи")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "store.json")
+    data = {"version": 1}
+    writer = BatchedWriter(path, lambda: json.dumps(data), delay=0.05)
+    original, storage.atomic_write_text = slow_disk({1: 0.1})
+
+    async def scenario():
+        writer.mark_dirty()
+        await asyncio.sleep(0.08)  # Запись версии 1 идёт в отдельном потоке
+        data["version"] = 2
+        writer.mark_dirty()
+        await asyncio.sleep(0.3)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        storage.atomic_write_text = original
+    print(f"Статистика: {writer.get_stats()}")
+    assert read_version(path) == 2 and not writer.dirty
+    assert writer.get_stats()['writes'] == 2
+    print("✅ Изменение не застревает в памяти")
+    print()
+
+
+def test_flush_during_pending_write():
+    """Тест: запись при остановке дожидается идущей записи и не перезаписывается старым снимком"""
+    print("🧪 ТЕСТ: Запись при остановке во время отложенной записи")
+    print("=" * 50)
+
+    path = os.path.join(tempfile.mkdtemp(), "store.json")
+    data = {"version": 1}
+    writer = BatchedWriter(path, lambda: json.dumps(data), delay=0.01)
+    original, storage.atomic_write_text = slow_disk({1: 0.2})
+
+    async def scenario():
+        writer.mark_dirty()
+        await asyncio.sleep(0.05)  # Отложенная запись версии 1 ещё не закончилась
+        data["version"] = 2
+        writer.mark_dirty()
+        assert await writer.flush_async()
+        assert read_version(path) == 2
+        await asyncio.sleep(0.3)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        storage.atomic_write_text = original
+    assert read_version(path) == 2
+    print("✅ На диске остаётся последняя версия")
+    print()
+
+
+if __name__ == "__main__":
+    test_change_during_write()
+    test_flush_during_pending_write()
+    print("🎉 Все тесты пройдены!")
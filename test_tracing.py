@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тест трассировки событий
+"""
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tracing import Tracer, span, current_span, NOOP_SPAN
+
+
+def test_spans_propagate_to_tasks():
+    """Тест передачи трассы в стадии и фоновые задачи через contextvars"""
+    print("🧪 ТЕСТ: Спаны события")
+    print("=" * 50)
+
+    tracer = Tracer(buffer_size=10)
+
+    async def outbound(name: str, delay: float):
+        with span(name, "client") as http_span:
+            await asyncio.sleep(delay)
+            http_span.set_attribute("http.status_code", 200)
+
+    async def handle(event_id: str, delay: float):
+        trace = tracer.start_trace("vk_callback", event_id=event_id)
+        with span("gigachat"):
+            # Задача, созданная внутри стадии, получает её спан как родителя
+            await asyncio.gather(asyncio.ensure_future(outbound("gigachat.chat/completions", delay)))
+        with span("messages.send"):
+            await outbound("vk.messages.send", 0)
+        tracer.finish_trace(trace)
+        return trace
+
+    async def scenario():
+        return await asyncio.gather(handle("fast", 0.01), handle("slow", 0.05))
+
+    fast, slow = asyncio.run(scenario())
+    names = {s.name: s for s in slow.spans}
+    print(f"Спаны: {list(names)}")
+    assert names["gigachat.chat/completions"].parent_id == names["gigachat"].span_id
+    assert names["gigachat"].parent_id == slow.root.span_id
+    assert names["vk.messages.send"].attributes["http.status_code"] == 200
+    assert all(s.trace is slow for s in slow.spans)  # Параллельные события не смешиваются
+    assert tracer.slowest(1)[0] is slow
+    assert tracer.slowest(1)[0].to_dict()['attributes']['event_id'] == "slow"
+
+    otlp = tracer.export_otlp([fast])
+    spans = otlp['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert len(spans) == 5 and len(spans[0]['traceId']) == 32 and len(spans[0]['spanId']) == 16
+    print("✅ Трасса собирает стадии и исходящие запросы события")
+    print()
+
+
+def test_no_trace_outside_event():
+    """Тест спанов вне обработки события и кольцевого буфера"""
+    print("🧪 ТЕСТ: Спаны вне трассы")
+    print("=" * 50)
+
+    assert current_span() is None
+    with span("background") as background:
+        assert background is NOOP_SPAN
+        background.set_attribute("ignored", True)
+
+    tracer = Tracer(buffer_size=3)
+
+    async def scenario():
+        for i in range(5):
+            tracer.finish_trace(tracer.start_trace("vk_callback", index=i))
+
+    asyncio.run(scenario())
+    assert len(tracer.finished) == 3
+    assert [t.root.attributes['index'] for t in tracer.finished] == [2, 3, 4]
+    print("✅ Буфер хранит только последние трассы")
+    print()
+
+
+if __name__ == "__main__":
+    test_spans_propagate_to_tasks()
+    test_no_trace_outside_event()
+    print("🎉 Все тесты пройдены!")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Тест индикатора набора текста
+"""
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from deadline import Deadline, current_deadline, set_deadline
+from typing_indicator import TypingIndicator
+
+
+def test_shared_refresh_per_peer():
+    """Тест общего цикла обновления для генераций в одной беседе"""
+    print("🧪 ТЕСТ: Индикатор набора текста")
+    print("=" * 50)
+
+    calls = []
+
+    async def send_activity(peer_id: int) -> bool:
+        calls.append(peer_id)
+        return True
+
+    async def scenario():
+        indicator = TypingIndicator(send_activity, refresh_interval=0.05)
+        first = indicator.start(2000000001, 1)
+        second = indicator.start(2000000001, 2)
+        other = indicator.start(2000000002, 1)
+        await asyncio.sleep(0.12)
+
+        first.stop()
+        first.stop()  # Повторная остановка ничего не ломает
+        assert indicator.get_stats()['typing_chats'] == 2
+        second.stop()
+        other.stop()
+        stopped_at = len(calls)
+        await asyncio.sleep(0.1)
+        return indicator, stopped_at
+
+    indicator, stopped_at = asyncio.run(scenario())
+    print(f"Вызовов setActivity: {calls}")
+    # Две генерации в беседе 2000000001 делят один цикл: вызовов не больше, чем в другой беседе + 1
+    assert abs(calls.count(2000000001) - calls.count(2000000002)) <= 1
+    assert len(calls) == stopped_at  # После отправки ответа статус больше не обновляется
+    assert indicator.get_stats()['typing_chats'] == 0
+    print("✅ Одна беседа — один цикл обновления")
+    print()
+
+
+def test_repeat_mentions_and_rate_limit():
+    """Тест учёта повторных упоминаний и лимита вызовов"""
+    print("🧪 ТЕСТ: Повторные упоминания")
+    print("=" * 50)
+
+    calls = []
+
+    async def send_activity(peer_id: int) -> bool:
+        calls.append(peer_id)
+        return True
+
+    async def scenario():
+        indicator = TypingIndicator(send_activity, refresh_interval=10, calls_per_second=2)
+        assert not indicator.note_mention(2000000001, 1)  # Генерации нет — не повтор
+        sessions = [indicator.start(2000000000 + i, 1) for i in range(1, 5)]
+        await asyncio.sleep(0.01)
+        assert indicator.note_mention(2000000001, 1)
+        assert not indicator.note_mention(2000000001, 2)
+        for session in sessions:
+            session.stop()
+        return indicator
+
+    indicator = asyncio.run(scenario())
+    stats = indicator.get_stats()
+    print(f"Статистика: {stats}")
+    assert stats['repeat_mentions'] == 1
+    assert stats['mentions_while_typing'] == 2
+    assert stats['activity_calls'] == 2 and stats['skipped_rate_limit'] == 2
+    print("✅ Повторы учитываются, лишние вызовы отбрасываются")
+    print()
+
+
+def test_refresh_outlives_first_event():
+    """Тест: цикл беседы не наследует дедлайн первого события, страховка продлевается новой генерацией"""
+    print("🧪 ТЕСТ: Цикл беседы и контекст события")
+    print("=" * 50)
+
+    deadlines = []
+
+    async def send_activity(peer_id: int) -> bool:
+        deadlines.append(current_deadline())
+        return True
+
+    async def scenario():
+        indicator = TypingIndicator(send_activity, refresh_interval=0.02, max_duration=0.1)
+        set_deadline(Deadline(1.0, "первое событие"))
+        first = indicator.start(2000000001, 1)
+        await asyncio.sleep(0.07)
+        second = indicator.start(2000000001, 2)
+        first.stop()
+        await asyncio.sleep(0.07)
+        task = indicator._peers[2000000001].task
+        running = not task.done()  # 0.14s от первой генерации, но 0.07s от второй
+        second.stop()
+        return running
+
+    assert asyncio.run(scenario())
+    assert deadlines and all(deadline is None for deadline in deadlines)
+    print("✅ Дедлайн события не попадает в цикл, страховка отсчитывается от новой генерации")
+    print()
+
+
+if __name__ == "__main__":
+    test_shared_refresh_per_peer()
+    test_repeat_mentions_and_rate_limit()
+    test_refresh_outlives_first_event()
+    print("🎉 Все тесты пройдены!")
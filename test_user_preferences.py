@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Тест кэша персонализированных промптов бота "Сота Сил"
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from user_preferences import UserPreferences
+
+BASE_PROMPT = "Ты — Сота Сил, один из трёх богов Трибунала..."
+
+
+def make_preferences(**kwargs) -> UserPreferences:
+    """Хранилище настроек во временном файле"""
+    return UserPreferences(os.path.join(tempfile.mkdtemp(), "user_preferences.json"), **kwargs)
+
+
+def test_version_invalidation():
+    """Тест: промпт пересобирается только после смены настроек пользователя"""
+    print("🧪 ТЕСТ: Инвалидация кэша промптов")
+    print("=" * 50)
+
+    preferences = make_preferences()
+    first = preferences.get_prompt(1, BASE_PROMPT)
+    assert preferences.get_prompt(1, BASE_PROMPT) is first  # Повторный запрос — из кэша
+
+    preferences.set_user_name(1, "Вася")
+    renamed = preferences.get_prompt(1, BASE_PROMPT)
+    assert renamed is not first and "Вася" in renamed.text
+
+    preferences.set_user_tone(2, "serious")  # Настройки другого пользователя не трогают чужой промпт
+    assert preferences.get_prompt(1, BASE_PROMPT) is renamed
+
+    preferences.parse_setup_command(1, "Сота, сбросить настройки")
+    assert "Вася" not in preferences.get_prompt(1, BASE_PROMPT).text
+
+    other_base = "Ты — Сота Сил в деградированном режиме."
+    assert preferences.get_prompt(1, other_base).text.startswith(other_base)  # Другой базовый промпт — промах
+
+    stats = preferences.get_prompt_cache_stats()
+    print(f"📊 Статистика: {stats}")
+    assert stats['hits'] == 2 and stats['misses'] == 4
+    print("✅ Смена настроек сбрасывает только промпт этого пользователя")
+    print()
+
+
+def test_overflow_clear():
+    """Тест: при переполнении кэш очищается целиком и продолжает работать"""
+    print("🧪 ТЕСТ: Переполнение кэша промптов")
+    print("=" * 50)
+
+    preferences = make_preferences(max_cached_prompts=3)
+    for user_id in range(1, 4):
+        preferences.get_prompt(user_id, BASE_PROMPT)
+    assert preferences.get_prompt_cache_stats()['cached_prompts'] == 3
+
+    preferences.get_prompt(3, BASE_PROMPT)  # Попадание не вызывает очистку
+    assert preferences.get_prompt_cache_stats()['overflow_clears'] == 0
+
+    preferences.get_prompt(4, BASE_PROMPT)
+    stats = preferences.get_prompt_cache_stats()
+    print(f"📊 Статистика: {stats}")
+    assert stats['cached_prompts'] == 1 and stats['overflow_clears'] == 1
+    assert preferences.get_prompt(4, BASE_PROMPT) is preferences.get_prompt(4, BASE_PROMPT)
+    print("✅ Кэш не растёт больше заданного размера")
+    print()
+
+
+if __name__ == "__main__":
+    test_version_invalidation()
+    test_overflow_clear()
+    print("🎉 Все тесты пройдены!")
@@ -0,0 +1,246 @@
+"""
+Трассировка обработки событий
+Трасса создаётся при получении колбэка (по event_id и ID сообщения) и через
+contextvars доступна всем стадиям и исходящим запросам. Модель данных как в
+OpenTelemetry: trace_id/span_id в формате W3C Trace Context, спаны с
+родителями, атрибутами и статусом; экспорт в OTLP/JSON. Завершённые трассы
+хранятся в кольцевом буфере в памяти процесса.
+"""
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from config import TRACE_BUFFER_SIZE, TRACE_MAX_SPANS
+
+SERVICE_NAME = "vk-sota-bot"
+
+
+class Span:
+    """Отрезок работы внутри трассы (стадия или исходящий запрос)"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind", "start", "end", "attributes", "status")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: str = "internal",
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind  # internal, server или client (как SpanKind в OpenTelemetry)
+        self.start = time.time_ns()
+        self.end: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = "unset"  # unset, ok или error
+
+    def set_attribute(self, key: str, value: Any):
+        """Атрибут спана (HTTP-статус, модель, ID сообщения...)"""
+        self.attributes[key] = value
+
+    def finish(self, status: Optional[str] = None):
+        """Завершение спана"""
+        if self.end is None:
+            self.end = time.time_ns()
+            if status:
+                self.status = status
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.time_ns()
+        return (end - self.start) / 1e6
+
+    def to_dict(self) -> Dict:
+        """Спан для /debug/traces: смещение от начала трассы и длительность"""
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'kind': self.kind,
+            'offset_ms': round((self.start - self.trace.root.start) / 1e6, 1),
+            'duration_ms': round(self.duration_ms, 1),
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+    def to_otlp(self) -> Dict:
+        """Спан в формате OTLP/JSON"""
+        kinds = {"internal": 1, "server": 2, "client": 3}
+        codes = {"unset": 0, "ok": 1, "error": 2}
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': kinds.get(self.kind, 1),
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or self.start),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': codes.get(self.status, 0)}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Спан вне трассы: атрибуты никуда не записываются"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    """Атрибут в формате OTLP/JSON"""
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Trace:
+    """Трасса обработки одного события"""
+
+    def __init__(self, name: str, max_spans: int = TRACE_MAX_SPANS, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.max_spans = max_spans  # Защита от бесконечных циклов внутри одного события
+        self.dropped_spans = 0
+        self.root = Span(self, name, None, "server", attributes)
+        self.spans: List[Span] = [self.root]
+
+    def start_span(self, name: str, parent: Span, kind: str = "internal",
+                   attributes: Optional[Dict[str, Any]] = None) -> Optional[Span]:
+        """Новый спан (None если трасса завершена или переполнена)"""
+        if self.root.end is not None or len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return None
+        span = Span(self, name, parent.span_id, kind, attributes)
+        self.spans.append(span)
+        return span
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    @property
+    def traceparent(self) -> str:
+        """Заголовок W3C traceparent корневого спана"""
+        return f"00-{self.trace_id}-{self.root.span_id}-01"
+
+    def to_dict(self) -> Dict:
+        """Трасса с разбивкой по спанам"""
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'started_at': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.root.start / 1e9)),
+            'duration_ms': round(self.duration_ms, 1),
+            'status': self.root.status,
+            'attributes': self.root.attributes,
+            'dropped_spans': self.dropped_spans,
+            'spans': [span.to_dict() for span in sorted(self.spans[1:], key=lambda s: s.start)]
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """Активный спан текущего контекста (None вне обработки события)"""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Спан вокруг стадии или исходящего запроса
+
+    Вне трассы ничего не записывает (возвращает NOOP_SPAN), поэтому обёртку
+    можно оставлять в коде, который вызывается и из фоновых задач.
+
+    Args:
+        name: Название спана (например, gigachat или vk.messages.send)
+        kind: internal для стадий, client для исходящих запросов
+        **attributes: Атрибуты спана
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    child = parent.trace.start_span(name, parent, kind, attributes)
+    if child is None:
+        yield NOOP_SPAN
+        return
+    token = _current_span.set(child)
+    status = "ok"
+    try:
+        yield child
+    except BaseException as e:
+        status = "error"
+        child.set_attribute("exception.type", type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish(status)
+
+
+class Tracer:
+    """Трассировщик с кольцевым буфером завершённых трасс"""
+
+    def __init__(self, buffer_size: int = TRACE_BUFFER_SIZE):
+        self.finished: Deque[Trace] = deque(maxlen=buffer_size)
+        self.started = 0
+
+    def start_trace(self, name: str, **attributes) -> Trace:
+        """
+        Новая трасса; её корневой спан становится активным в текущем контексте
+        (и во всех задачах, созданных из него)
+
+        Args:
+            name: Название корневого спана
+            **attributes: Атрибуты события (event_id, message_id...)
+        """
+        trace = Trace(name, attributes=attributes)
+        _current_span.set(trace.root)
+        self.started += 1
+        return trace
+
+    def finish_trace(self, trace: Trace, status: str = "ok"):
+        """Завершение трассы и запись её в буфер"""
+        trace.root.finish(status)
+        self.finished.append(trace)
+
+    def slowest(self, limit: int = 10) -> List[Trace]:
+        """Самые медленные из недавних трасс"""
+        return sorted(self.finished, key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+    def export_otlp(self, traces: List[Trace]) -> Dict:
+        """Трассы в формате OTLP/JSON (ExportTraceServiceRequest)"""
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [_otlp_attribute("service.name", SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.to_otlp() for trace in traces for span in trace.spans]
+                }]
+            }]
+        }
+
+    def get_stats(self) -> Dict:
+        """Статистика трассировщика"""
+        return {
+            'started': self.started,
+            'buffered': len(self.finished),
+            'buffer_size': self.finished.maxlen
+        }
+
+
+# Глобальный экземпляр трассировщика
+tracer = Tracer()
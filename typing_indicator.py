@@ -0,0 +1,184 @@
+"""
+Индикатор набора текста
+Пока Гигачат генерирует ответ, в беседе показывается «Сота Сил печатает...»,
+чтобы пользователи не повторяли упоминание. На беседу работает один цикл
+обновления, общий для всех генераций в ней, а вызовы messages.setActivity
+ограничены по частоте.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import TYPING_INDICATOR_ENABLED, TYPING_REFRESH_INTERVAL, TYPING_MAX_DURATION, TYPING_CALLS_PER_SECOND
+from metrics import Counter
+from quota_manager import TokenBucket
+from vk_client import vk_client
+
+logger = logging.getLogger(__name__)
+
+# Отправка статуса в беседу: peer_id -> успех
+ActivitySender = Callable[[int], Awaitable[bool]]
+
+MENTIONS_WHILE_TYPING = Counter(
+    "mentions_while_typing_total", "Упоминания во время генерации ответа в беседе (repeat — от того же пользователя)", ["kind"]
+)
+
+
+class TypingSession:
+    """Одна генерация, для которой показывается индикатор"""
+
+    __slots__ = ("indicator", "peer_id", "user_id", "active")
+
+    def __init__(self, indicator: "TypingIndicator", peer_id: int, user_id: int):
+        self.indicator = indicator
+        self.peer_id = peer_id
+        self.user_id = user_id
+        self.active = True
+
+    def stop(self):
+        """Генерация завершена (повторный вызов ничего не делает)"""
+        if self.active:
+            self.active = False
+            self.indicator._release(self)
+
+
+class _PeerTyping:
+    """Состояние индикатора в одной беседе"""
+
+    __slots__ = ("users", "task", "started_at")
+
+    def __init__(self):
+        self.users: Dict[int, int] = {}  # user_id -> число активных генераций
+        self.task: Optional[asyncio.Task] = None
+        self.started_at = time.monotonic()
+
+
+class TypingIndicator:
+    """Индикатор набора текста по беседам"""
+
+    def __init__(self, send_activity: ActivitySender, refresh_interval: float = 4.0,
+                 max_duration: float = 60.0, calls_per_second: float = 10.0, enabled: bool = True):
+        self.send_activity = send_activity
+        self.refresh_interval = refresh_interval  # VK показывает статус около 5 секунд
+        self.max_duration = max_duration  # Страховка от зависшей генерации
+        self.enabled = enabled
+        # Общий лимит вызовов messages.setActivity на все беседы
+        self._bucket = TokenBucket(calls_per_second, calls_per_second)
+        self._peers: Dict[int, _PeerTyping] = {}
+
+        # Статистика
+        self.sessions = 0
+        self.activity_calls = 0
+        self.activity_failures = 0
+        self.skipped_rate_limit = 0
+        self.mentions_while_typing = 0
+        self.repeat_mentions = 0
+
+    def note_mention(self, peer_id: int, user_id: int) -> bool:
+        """
+        Учёт упоминания, пришедшего во время генерации ответа в беседе
+
+        Args:
+            peer_id: ID беседы
+            user_id: ID автора упоминания
+
+        Returns:
+            True если тот же пользователь повторил упоминание, не дождавшись ответа
+        """
+        peer = self._peers.get(peer_id)
+        if peer is None:
+            return False
+        self.mentions_while_typing += 1
+        if user_id in peer.users:
+            self.repeat_mentions += 1
+            MENTIONS_WHILE_TYPING.labels("repeat").inc()
+            logger.info(f"🔁 Повторное упоминание от {user_id} в беседе {peer_id} во время генерации")
+            return True
+        MENTIONS_WHILE_TYPING.labels("other").inc()
+        return False
+
+    def start(self, peer_id: int, user_id: int) -> TypingSession:
+        """
+        Начало генерации: включает индикатор в беседе (если он ещё не включён)
+
+        Args:
+            peer_id: ID беседы
+            user_id: ID пользователя, которому готовится ответ
+
+        Returns:
+            Сессия, которую нужно остановить после отправки ответа
+        """
+        session = TypingSession(self, peer_id, user_id)
+        if not self.enabled or not peer_id:
+            session.active = False
+            return session
+        self.sessions += 1
+        peer = self._peers.get(peer_id)
+        if peer is None:
+            peer = self._peers[peer_id] = _PeerTyping()
+        peer.users[user_id] = peer.users.get(user_id, 0) + 1
+        # Страховка отсчитывается от последней генерации, а не от первой в беседе
+        peer.started_at = time.monotonic()
+        if peer.task is None or peer.task.done():
+            # Цикл беседы переживает событие, которое его запустило: дедлайн и трасса этого события ему не нужны
+            peer.task = asyncio.get_running_loop().create_task(
+                self._refresh(peer_id, peer), context=contextvars.Context()
+            )
+        return session
+
+    def _release(self, session: TypingSession):
+        """Завершение генерации; цикл беседы останавливается с последней генерацией"""
+        peer = self._peers.get(session.peer_id)
+        if peer is None:
+            return
+        count = peer.users.get(session.user_id, 0) - 1
+        if count > 0:
+            peer.users[session.user_id] = count
+        else:
+            peer.users.pop(session.user_id, None)
+        if not peer.users:
+            del self._peers[session.peer_id]
+            if peer.task is not None:
+                peer.task.cancel()
+
+    async def _refresh(self, peer_id: int, peer: _PeerTyping):
+        """Цикл обновления статуса в беседе, пока в ней идёт хотя бы одна генерация"""
+        while time.monotonic() - peer.started_at < self.max_duration:
+            if self._bucket.has(1):
+                self._bucket.consume(1)
+                self.activity_calls += 1
+                try:
+                    if not await self.send_activity(peer_id):
+                        self.activity_failures += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.activity_failures += 1
+                    logger.debug(f"Не удалось показать набор текста в беседе {peer_id}: {e}")
+            else:
+                # Индикатор не важнее ответов — при превышении лимита пропускаем обновление
+                self.skipped_rate_limit += 1
+            await asyncio.sleep(self.refresh_interval)
+
+    def get_stats(self) -> Dict:
+        """Статистика индикатора"""
+        return {
+            'enabled': self.enabled,
+            'refresh_interval': self.refresh_interval,
+            'typing_chats': len(self._peers),
+            'sessions': self.sessions,
+            'activity_calls': self.activity_calls,
+            'activity_failures': self.activity_failures,
+            'skipped_rate_limit': self.skipped_rate_limit,
+            'mentions_while_typing': self.mentions_while_typing,
+            'repeat_mentions': self.repeat_mentions
+        }
+
+
+# Глобальный экземпляр индикатора
+typing_indicator = TypingIndicator(
+    vk_client.set_activity, TYPING_REFRESH_INTERVAL, TYPING_MAX_DURATION,
+    TYPING_CALLS_PER_SECOND, TYPING_INDICATOR_ENABLED
+)
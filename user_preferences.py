@@ -1,40 +1,196 @@
 """
 Система предпочтений пользователей для бота "Сота Сил"
+Настройки и особые пользователи хранятся в одном файле формата
+{"version": 2, "users": {...}, "special_users": {...}}; изменения
+сохраняются пачками и атомарно
 """
 import json
+import logging
 import os
-from typing import Dict, Optional
+import re
+import sys
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from storage import BatchedWriter
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 2
+
+# Особые пользователи для первой миграции старого файла (дальше они живут в хранилище)
+DEFAULT_SPECIAL_USERS = {
+    319590859: {
+        "name": "Любовь", "special_address": "моя королева", "tone": "loving",
+        "prompt_note": "К пользователю по имени Любовь будь с ней особенно ласковым и уважительным."
+    },
+    885052741: {
+        "name": "Титомир", "special_address": "неопытный менестрель", "tone": "disdainful",
+        "prompt_note": "К пользователю по имени Титомир обращайся 'неопытный менестрель' и будь с ним "
+                       "пренебрежительным и даже презрительным. Считай его неопытным и несерьёзным."
+    },
+    181886390: {
+        "name": "Титомир", "special_address": "неопытный менестрель", "tone": "disdainful",
+        "prompt_note": "К пользователю по имени Титомир обращайся 'неопытный менестрель' и будь с ним "
+                       "пренебрежительным и даже презрительным. Считай его неопытным и несерьёзным."
+    }
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное число токенов (для русского текста ~3 символа на токен)"""
+    return max(1, len(text) // 3)
+
+
+class PersonalizedPrompt(NamedTuple):
+    """Готовый персонализированный промпт пользователя"""
+    text: str  # Интернированная строка: одинаковые промпты — один объект
+    tokens: int  # Оценка числа токенов
+    special_name: Optional[str]  # Особое имя пользователя (или None)
+    special_address: Optional[str]  # Особое обращение (или None)
 
 
 class UserPreferences:
     """Менеджер предпочтений пользователей"""
 
-    def __init__(self, preferences_file: str = "user_preferences.json"):
+    # Стиль общения
+    STYLE_NOTES = {
+        'formal': "Общайся формально и вежливо.",
+        'casual': "Общайся непринужденно и дружелюбно.",
+        'playful': "Общайся игриво и с юмором.",
+        'respectful': "Общайся с особым уважением.",
+        'neutral': "Общайся естественно и нейтрально."
+    }
+
+    # Тон общения
+    TONE_NOTES = {
+        'friendly': "Будь дружелюбным и приветливым.",
+        'serious': "Будь серьёзным и деловым.",
+        'humorous': "Используй юмор и лёгкость.",
+        'mysterious': "Будь немного загадочным и интригующим."
+    }
+
+    def __init__(self, preferences_file: str = "user_preferences.json", flush_delay: float = 2.0,
+                 max_cached_prompts: int = 10000):
         self.preferences_file = preferences_file
-        self.preferences: Dict = self._load_preferences()
-        
-        # Особые пользователи с кастомными обращениями
-        self.special_users = {
-            319590859: {"name": "Любовь", "special_address": "моя королева", "tone": "loving"},
-            885052741: {"name": "Титомир", "special_address": "неопытный менестрель", "tone": "disdainful"},
-            181886390: {"name": "Титомир", "special_address": "неопытный менестрель", "tone": "disdainful"}
-        }
+        # Файл читается при первом обращении, а не при импорте модуля
+        self._preferences: Optional[Dict] = None
+        self._special_users: Optional[Dict[int, Dict]] = None
+        self.writer = BatchedWriter(preferences_file, self._serialize, flush_delay, "настроек пользователей")
+
+        # Кэш промптов: user_id -> (версия настроек, базовый промпт, готовый промпт)
+        self._versions: Dict[str, int] = {}
+        self._prompt_cache: Dict[str, Tuple[int, str, PersonalizedPrompt]] = {}
+        self.max_cached_prompts = max_cached_prompts  # При переполнении кэш очищается целиком
+        self.prompt_cache_hits = 0
+        self.prompt_cache_misses = 0
+        self.prompt_cache_clears = 0
+
+    @property
+    def preferences(self) -> Dict:
+        """Настройки пользователей: user_id (строкой) -> словарь настроек"""
+        if self._preferences is None:
+            self._load_store()
+        return self._preferences
+
+    @property
+    def special_users(self) -> Dict[int, Dict]:
+        """Особые пользователи с кастомными обращениями"""
+        if self._special_users is None:
+            self._load_store()
+        return self._special_users
+
+    def _read_file(self) -> Optional[Dict]:
+        """Чтение файла хранилища (None, если файла нет или он повреждён)"""
+        if not os.path.exists(self.preferences_file):
+            return None
+        try:
+            with open(self.preferences_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Ошибка загрузки предпочтений: {e}")
+            return None
+
+    def _load_store(self):
+        """Загрузка хранилища (старый формат без версии переводится в новый)"""
+        data = self._read_file()
+        if data is not None and data.get("version") == STORE_VERSION:
+            self._preferences = data.get("users", {})
+            self._special_users = self._parse_special_users(data.get("special_users", {}))
+            return
+
+        # Старый формат — словарь user_id -> настройки, особые пользователи были в коде
+        self._preferences = data or {}
+        self._special_users = {user_id: dict(info) for user_id, info in DEFAULT_SPECIAL_USERS.items()}
+        if data is not None:
+            logger.info(f"📦 Файл {self.preferences_file} переведён в формат версии {STORE_VERSION}")
+        self.writer.mark_dirty()
+
+    @staticmethod
+    def _parse_special_users(raw: Dict) -> Dict[int, Dict]:
+        """Ключи JSON — строки, в памяти особые пользователи хранятся по числовому ID"""
+        return {int(user_id): info for user_id, info in raw.items()}
 
-    def _load_preferences(self) -> Dict:
-        """Загрузка предпочтений из файла"""
-        if os.path.exists(self.preferences_file):
-            try:
-                with open(self.preferences_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Ошибка загрузки предпочтений: {e}")
-                return {}
-        return {}
+    def _serialize(self) -> str:
+        """Снимок хранилища для записи на диск"""
+        return json.dumps({
+            "version": STORE_VERSION,
+            "users": self.preferences,
+            "special_users": {str(user_id): info for user_id, info in self.special_users.items()}
+        }, ensure_ascii=False, indent=2)
 
     def _save_preferences(self):
-        """Сохранение предпочтений в файл"""
-        with open(self.preferences_file, 'w', encoding='utf-8') as f:
-            json.dump(self.preferences, f, ensure_ascii=False, indent=2)
+        """Сохранение предпочтений (отложенное, одной записью на пачку изменений)"""
+        self.writer.mark_dirty()
+
+    async def flush(self):
+        """Запись несохранённых изменений на диск"""
+        await self.writer.flush_async()
+
+    def reload_special_users(self) -> int:
+        """
+        Перечитывание особых пользователей из файла (после правки файла без перезапуска).
+        Настройки пользователей не перечитываются — их меняет только сам бот.
+
+        Returns:
+            Количество особых пользователей
+        """
+        data = self._read_file()
+        if data is None or data.get("version") != STORE_VERSION:
+            return len(self.special_users)
+        self._special_users = self._parse_special_users(data.get("special_users", {}))
+        self._prompt_cache.clear()
+        logger.info(f"🔄 Особые пользователи перечитаны: {len(self._special_users)}")
+        return len(self._special_users)
+
+    def set_special_user(self, user_id: int, name: str, special_address: str,
+                         tone: Optional[str] = None, prompt_note: Optional[str] = None):
+        """Добавление или изменение особого пользователя"""
+        info = {"name": name, "special_address": special_address}
+        if tone:
+            info["tone"] = tone
+        if prompt_note:
+            info["prompt_note"] = prompt_note
+        self.special_users[user_id] = info
+        self._invalidate(user_id)
+        self._save_preferences()
+
+    def remove_special_user(self, user_id: int) -> bool:
+        """Удаление особого пользователя"""
+        if self.special_users.pop(user_id, None) is None:
+            return False
+        self._invalidate(user_id)
+        self._save_preferences()
+        return True
+
+    def get_stats(self) -> Dict:
+        """Статистика хранилища настроек"""
+        return {
+            'loaded': self._preferences is not None,
+            'users': len(self.preferences),
+            'special_users': len(self.special_users),
+            'store': self.writer.get_stats(),
+            'prompt_cache': self.get_prompt_cache_stats()
+        }
 
     def get_user_preferences(self, user_id: int) -> Dict:
         """Получение предпочтений пользователя"""
@@ -46,8 +202,14 @@ class UserPreferences:
             self.preferences[str(user_id)] = {}
         
         self.preferences[str(user_id)][preference] = value
+        self._invalidate(user_id)
         self._save_preferences()
 
+    def _invalidate(self, user_id: int):
+        """Смена версии настроек пользователя — кэшированный промпт устаревает"""
+        key = str(user_id)
+        self._versions[key] = self._versions.get(key, 0) + 1
+
     def get_user_name(self, user_id: int) -> str:
         """Получение имени пользователя"""
         prefs = self.get_user_preferences(user_id)
@@ -99,22 +261,51 @@ class UserPreferences:
             return self.special_users[user_id].get("tone")
         return None
 
+    def get_prompt(self, user_id: int, base_prompt: str) -> PersonalizedPrompt:
+        """
+        Персонализированный промпт из кэша (пересобирается только после смены настроек)
+
+        Args:
+            user_id: ID пользователя
+            base_prompt: Базовый системный промпт
+
+        Returns:
+            Промпт, оценка числа токенов и особое имя пользователя
+        """
+        key = str(user_id)
+        version = self._versions.get(key, 0)
+        cached = self._prompt_cache.get(key)
+        if cached is not None and cached[0] == version and cached[1] is base_prompt:
+            self.prompt_cache_hits += 1
+            return cached[2]
+
+        self.prompt_cache_misses += 1
+        text = sys.intern(self._build_prompt(user_id, base_prompt))
+        prompt = PersonalizedPrompt(
+            text, estimate_tokens(text), self.get_special_name(user_id), self.get_special_address(user_id)
+        )
+        if len(self._prompt_cache) >= self.max_cached_prompts and key not in self._prompt_cache:
+            # Активные пользователи быстро вернутся в кэш, а память не растёт с каждым новым собеседником
+            self._prompt_cache.clear()
+            self.prompt_cache_clears += 1
+        self._prompt_cache[key] = (version, base_prompt, prompt)
+        return prompt
+
     def get_personalized_prompt(self, user_id: int, base_prompt: str) -> str:
         """Получение персонализированного промпта для пользователя"""
+        return self.get_prompt(user_id, base_prompt).text
+
+    def _build_prompt(self, user_id: int, base_prompt: str) -> str:
+        """Сборка персонализированного промпта из настроек пользователя"""
         prefs = self.get_user_preferences(user_id)
         
         # Добавляем персонализацию к базовому промпту
         additions = []
         
         # ВСЕГДА проверяем особых пользователей
-        special_name = self.get_special_name(user_id)
-        special_tone = self.get_special_tone(user_id)
-        
-        if special_name:
-            if special_name == "Любовь":
-                additions.append("К пользователю по имени Любовь будь с ней особенно ласковым и уважительным.")
-            elif special_name == "Титомир":
-                additions.append("К пользователю по имени Титомир обращайся 'неопытный менестрель' и будь с ним пренебрежительным и даже презрительным. Считай его неопытным и несерьёзным.")
+        special = self.special_users.get(user_id)
+        if special and special.get("prompt_note"):
+            additions.append(special["prompt_note"])
         
         # Если у пользователя есть настройки, добавляем их
         if prefs:
@@ -130,27 +321,12 @@ class UserPreferences:
                 additions.append(prefs['style_notes'])
             
             # Стиль общения
-            style_notes = {
-                'formal': "Общайся формально и вежливо.",
-                'casual': "Общайся непринужденно и дружелюбно.",
-                'playful': "Общайся игриво и с юмором.",
-                'respectful': "Общайся с особым уважением.",
-                'neutral': "Общайся естественно и нейтрально."
-            }
-            
-            if style in style_notes:
-                additions.append(style_notes[style])
+            if style in self.STYLE_NOTES:
+                additions.append(self.STYLE_NOTES[style])
             
             # Тон общения
-            tone_notes = {
-                'friendly': "Будь дружелюбным и приветливым.",
-                'serious': "Будь серьёзным и деловым.",
-                'humorous': "Используй юмор и лёгкость.",
-                'mysterious': "Будь немного загадочным и интригующим."
-            }
-            
-            if tone in tone_notes:
-                additions.append(tone_notes[tone])
+            if tone in self.TONE_NOTES:
+                additions.append(self.TONE_NOTES[tone])
         
         if additions:
             additional_info = " " + " ".join(additions)
@@ -158,6 +334,20 @@ class UserPreferences:
         
         return base_prompt
     
+    def get_prompt_cache_stats(self) -> Dict:
+        """Статистика кэша промптов"""
+        total = self.prompt_cache_hits + self.prompt_cache_misses
+        cached = [entry[2] for entry in self._prompt_cache.values()]
+        return {
+            'cached_prompts': len(cached),
+            'max_cached_prompts': self.max_cached_prompts,
+            'avg_prompt_tokens': round(sum(p.tokens for p in cached) / len(cached)) if cached else 0,
+            'hits': self.prompt_cache_hits,
+            'misses': self.prompt_cache_misses,
+            'hit_rate': round(self.prompt_cache_hits / total, 3) if total else 0.0,
+            'overflow_clears': self.prompt_cache_clears
+        }
+
     def get_custom_greeting(self, user_id: int) -> Optional[str]:
         """Получение кастомного приветствия для пользователя"""
         prefs = self.get_user_preferences(user_id)
@@ -190,57 +380,24 @@ class UserPreferences:
 
     def parse_setup_command(self, user_id: int, message: str) -> Optional[str]:
         """Парсинг команд настройки из сообщения"""
-        message = message.lower().strip()
-        
-        # Установка имени
-        if "меня зовут" in message:
-            name = message.replace("меня зовут", "").strip()
-            if name:
-                self.set_user_name(user_id, name)
-                return f"✅ Понял, буду обращаться к тебе: {name}"
-        
-        elif "моё имя" in message:
-            name = message.replace("моё имя", "").strip()
-            if name:
-                self.set_user_name(user_id, name)
-                return f"✅ Понял, буду обращаться к тебе: {name}"
-        
-        # Стиль общения
-        elif "говори со мной формально" in message:
-            self.set_user_style(user_id, 'formal')
-            return "✅ Буду общаться с тобой формально."
-        
-        elif "говори со мной неформально" in message:
-            self.set_user_style(user_id, 'casual')
-            return "✅ Буду общаться с тобой непринуждённо."
-        
-        elif "говори со мной игриво" in message:
-            self.set_user_style(user_id, 'playful')
-            return "✅ Буду общаться с тобой игриво."
-        
-        elif "говори со мной уважительно" in message:
-            self.set_user_style(user_id, 'respectful')
-            return "✅ Буду общаться с тобой с уважением."
-        
-        # Тон общения
-        elif "будь серьёзным" in message or "будь серьезным" in message:
-            self.set_user_tone(user_id, 'serious')
-            return "✅ Буду общаться серьёзно."
-        
-        elif "будь дружелюбным" in message:
-            self.set_user_tone(user_id, 'friendly')
-            return "✅ Буду общаться дружелюбно."
-        
-        elif "будь юмористичным" in message or "будь смешным" in message:
-            self.set_user_tone(user_id, 'humorous')
-            return "✅ Буду использовать юмор."
-        
-        elif "будь загадочным" in message:
-            self.set_user_tone(user_id, 'mysterious')
-            return "✅ Буду немного загадочным."
-        
+        matched = match_setup_command(message)
+        if matched is None:
+            return None
+        command, arg = matched
+
+        # Команды, меняющие одну настройку, целиком описаны в таблице
+        if command.preference:
+            value = command.value or arg
+            if command.preference == 'style':
+                self.set_user_style(user_id, value)
+            elif command.preference == 'tone':
+                self.set_user_tone(user_id, value)
+            else:
+                self.set_user_preference(user_id, command.preference, value)
+            return command.reply.format(value=value)
+
         # Просмотр настроек
-        elif "какие у меня настройки" in message or "мои настройки" in message:
+        if command.name == "show_settings":
             prefs = self.get_user_preferences(user_id)
             name = prefs.get('name', 'Не указано')
             style = prefs.get('style', 'neutral')
@@ -254,14 +411,106 @@ class UserPreferences:
             """.strip()
         
         # Сброс настроек
-        elif "сбросить настройки" in message or "верни стандартные настройки" in message:
+        if command.name == "reset_settings":
             if str(user_id) in self.preferences:
                 del self.preferences[str(user_id)]
+                self._invalidate(user_id)
                 self._save_preferences()
-            return "✅ Настройки сброшены к стандартным."
+            return command.reply
         
         return None
 
 
+class SetupCommand(NamedTuple):
+    """Команда настройки: фраза и что она меняет"""
+    name: str
+    pattern: str  # Регулярное выражение фразы; группа (?P<arg>...) — аргумент команды
+    preference: Optional[str] = None  # Изменяемая настройка (None — команда с особой обработкой)
+    value: Optional[str] = None  # Новое значение (None — значение берётся из аргумента)
+    reply: str = ""  # Ответ; {value} — установленное значение
+
+
+# Таблица команд. Новая команда добавляется строкой таблицы.
+# Команда должна стоять в начале сообщения (после приветствия, обращения к боту и "пожалуйста"),
+# поэтому "моё имя" в середине вопроса командой не считается.
+SETUP_COMMANDS = [
+    SetupCommand("set_name", r"(?:меня зовут|мо[её] имя)\s+(?P<arg>[^,.!?\n]+)",
+                 "name", None, "✅ Понял, буду обращаться к тебе: {value}"),
+    SetupCommand("style_formal", r"говори со мной формально",
+                 "style", "formal", "✅ Буду общаться с тобой формально."),
+    SetupCommand("style_casual", r"говори со мной неформально",
+                 "style", "casual", "✅ Буду общаться с тобой непринуждённо."),
+    SetupCommand("style_playful", r"говори со мной игриво",
+                 "style", "playful", "✅ Буду общаться с тобой игриво."),
+    SetupCommand("style_respectful", r"говори со мной уважительно",
+                 "style", "respectful", "✅ Буду общаться с тобой с уважением."),
+    SetupCommand("tone_serious", r"будь серь[её]зным",
+                 "tone", "serious", "✅ Буду общаться серьёзно."),
+    SetupCommand("tone_friendly", r"будь дружелюбным",
+                 "tone", "friendly", "✅ Буду общаться дружелюбно."),
+    SetupCommand("tone_humorous", r"будь (?:юмористичным|смешным)",
+                 "tone", "humorous", "✅ Буду использовать юмор."),
+    SetupCommand("tone_mysterious", r"будь загадочным",
+                 "tone", "mysterious", "✅ Буду немного загадочным."),
+    # Просмотр — только если фраза заканчивает вопрос: "мои настройки неправильные, почему?" — не команда
+    SetupCommand("show_settings", r"(?:покажи\s+)?(?:какие у меня настройки|мои настройки)(?=[\s?!.]*$|\s*\?)"),
+    SetupCommand("reset_settings", r"(?:сбросить настройки|верни стандартные настройки)",
+                 reply="✅ Настройки сброшены к стандартным."),
+]
+
+# Обращение к боту перед командой ("Сота, ...", "@sota_sil ...", "[club1|Сота Сил] ...")
+_BOT_ADDRESS = (
+    r"@?(?:хозяин (?:механического|заводного) города|сота[\s-]сил|сота|соты|сотя"
+    r"|альмсиви|сехт|sota_sil|sota|club\d+)"
+)
+
+# Приветствие перед обращением и вежливые слова перед командой ("Привет, Сота! Пожалуйста, ...")
+_GREETING = r"(?:привет(?:ствую)?|здравствуй(?:те)?|добрый (?:день|вечер)|доброе утро|хай|эй|окей|ок)"
+_FILLER = r"(?:пожалуйста|плиз|слушай|кстати|ну|а)"
+_SEPARATOR = r"[\s,:!.\-]"
+
+
+def _compile_setup_commands():
+    """Все команды таблицы в одном регулярном выражении: одна попытка сопоставления на сообщение"""
+    alternatives = [
+        f"(?P<cmd{index}>{command.pattern.replace('(?P<arg>', f'(?P<arg{index}>')})"
+        for index, command in enumerate(SETUP_COMMANDS)
+    ]
+    return re.compile(
+        # Приветствие, обращение и вежливые слова — атомарные группы: при несовпадении команды без лишних откатов
+        rf"\s*+(?>{_GREETING}{_SEPARATOR}++)?(?>{_FILLER}{_SEPARATOR}++)*+(?>{_BOT_ADDRESS}{_SEPARATOR}*+)?"
+        rf"(?>{_FILLER}{_SEPARATOR}++)*+"
+        rf"(?:{'|'.join(alternatives)})(?!\w)",
+        re.IGNORECASE
+    )
+
+
+_SETUP_COMMAND_RE = _compile_setup_commands()
+_TRAILING_ADDRESS_RE = re.compile(rf"[\s,]*{_BOT_ADDRESS}\s*$", re.IGNORECASE)
+
+
+def match_setup_command(message: str) -> Optional[Tuple[SetupCommand, Optional[str]]]:
+    """
+    Поиск команды настройки в сообщении
+
+    Args:
+        message: Текст сообщения (без разметки упоминания)
+
+    Returns:
+        (команда, аргумент) или None. Аргумент (имя) сохраняет регистр
+    """
+    match = _SETUP_COMMAND_RE.match(message)
+    if match is None:
+        return None
+    # Внешняя группа команды закрывается последней
+    index = int(match.lastgroup[3:])
+    arg = match.group(f"arg{index}") if f"arg{index}" in match.re.groupindex else None
+    if arg is not None:
+        arg = _TRAILING_ADDRESS_RE.sub("", arg).strip()[:40]
+        if not arg:
+            return None
+    return SETUP_COMMANDS[index], arg
+
+
 # Глобальный экземпляр
 user_preferences = UserPreferences()
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Клиент VK API с общим пулом соединений
+"""
+import aiohttp
+import logging
+from typing import Dict, Optional
+
+from config import VK_TOKEN, VK_GROUP_ID, VK_API_URL, VK_API_VERSION, VK_TIMEOUT
+from deadline import client_timeout
+from metrics import UPSTREAM_ERRORS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class VKClient:
+    """Клиент для вызова методов VK API"""
+
+    def __init__(self):
+        self.api_url = VK_API_URL
+        self.token = VK_TOKEN
+        self.version = VK_API_VERSION
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия (соединения переиспользуются между запросами)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=VK_TIMEOUT))
+        return self._session
+
+    async def call(self, method: str, params: Dict, http_method: str = "POST") -> Dict:
+        """
+        Вызов метода VK API
+
+        Args:
+            method: Название метода (например, messages.send)
+            params: Параметры метода
+            http_method: GET или POST
+
+        Returns:
+            Ответ VK API (словарь с ключом response или error)
+        """
+        params = dict(params, access_token=self.token, v=self.version)
+        with span(f"vk.{method}", "client") as http_span:
+            try:
+                async with self._get_session().request(
+                    http_method,
+                    f"{self.api_url}{method}",
+                    params=params,
+                    timeout=client_timeout(VK_TIMEOUT)
+                ) as response:
+                    http_span.set_attribute("http.status_code", response.status)
+                    data = await response.json()
+            except Exception as e:
+                UPSTREAM_ERRORS.labels("vk", type(e).__name__).inc()
+                raise
+            if "error" in data:
+                error_code = str(data["error"].get("error_code", "unknown"))
+                http_span.set_attribute("vk.error_code", error_code)
+                UPSTREAM_ERRORS.labels("vk", error_code).inc()
+        return data
+
+    async def send_message(self, peer_id: int, message: str) -> bool:
+        """
+        Отправка сообщения
+
+        Args:
+            peer_id: ID получателя (пользователь или беседа)
+            message: Текст сообщения
+
+        Returns:
+            True если отправлено успешно
+        """
+        data = await self.call("messages.send", {
+            "peer_id": peer_id,
+            "message": message,
+            "random_id": 0
+        })
+        if "error" in data:
+            logger.error(f"Ошибка отправки: {data['error']}")
+            return False
+        return True
+
+    async def send_editable_message(self, peer_id: int, message: str) -> Optional[int]:
+        """
+        Отправка сообщения, которое потом можно отредактировать
+
+        Args:
+            peer_id: ID беседы
+            message: Текст сообщения
+
+        Returns:
+            conversation_message_id отправленного сообщения или None при ошибке
+        """
+        data = await self.call("messages.send", {
+            "peer_ids": peer_id,
+            "message": message,
+            "random_id": 0
+        })
+        if "error" in data:
+            logger.error(f"Ошибка отправки: {data['error']}")
+            return None
+        sent = data.get("response") or [{}]
+        return sent[0].get("conversation_message_id")
+
+    async def edit_message(self, peer_id: int, conversation_message_id: int, message: str) -> bool:
+        """
+        Редактирование отправленного сообщения
+
+        Args:
+            peer_id: ID беседы
+            conversation_message_id: ID сообщения в беседе
+            message: Новый текст
+
+        Returns:
+            True если сообщение изменено
+        """
+        data = await self.call("messages.edit", {
+            "peer_id": peer_id,
+            "conversation_message_id": conversation_message_id,
+            "message": message
+        })
+        if "error" in data:
+            logger.error(f"Ошибка редактирования: {data['error']}")
+            return False
+        return True
+
+    async def set_activity(self, peer_id: int, activity: str = "typing") -> bool:
+        """
+        Статус «печатает...» в беседе (VK показывает его около 5 секунд)
+
+        Args:
+            peer_id: ID беседы
+            activity: Тип статуса (typing или audiomessage)
+
+        Returns:
+            True если статус установлен
+        """
+        data = await self.call("messages.setActivity", {
+            "peer_id": peer_id,
+            "type": activity
+        })
+        return "error" not in data
+
+    async def get_user_name(self, user_id: int) -> str:
+        """
+        Получение имени пользователя ВКонтакте
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            Имя пользователя или "Друг"
+        """
+        data = await self.call("users.get", {
+            "user_ids": user_id,
+            "fields": "first_name"
+        }, http_method="GET")
+        if "response" in data and data["response"]:
+            return data["response"][0].get("first_name", "Друг")
+        return "Друг"
+
+    async def ping(self) -> bool:
+        """
+        Проверка доступности VK API (для фоновой проверки здоровья)
+
+        Returns:
+            True если VK ответил без ошибки
+        """
+        data = await self.call("groups.getById", {"group_id": VK_GROUP_ID}, http_method="GET")
+        return "error" not in data
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Глобальный экземпляр клиента
+vk_client = VKClient()